@@ -5,11 +5,17 @@ import signal
 import sys
 import time
 
-from channel import channel_factory
-from common import const
-from config import load_config
-from plugins import *
-import threading
+# 启动耗时分析需要在导入其他模块之前开启，带 --profile-boot 参数启动时生效
+from common import boot_profiler
+
+boot_profiler.start()
+
+with boot_profiler.stage("imports"):
+    from channel import channel_factory
+    from common import const
+    from config import load_config
+    from plugins import *
+    import threading
 
 
 def sigterm_handler_wrap(_signo):
@@ -26,10 +32,12 @@ def sigterm_handler_wrap(_signo):
 
 
 def start_channel(channel_name: str):
-    channel = channel_factory.create_channel(channel_name)
+    with boot_profiler.stage("channel init"):
+        channel = channel_factory.create_channel(channel_name)
     if channel_name in ["wx", "wxy", "terminal", "wechatmp","wechatmp_service", "wechatcom_app", "wework",
                         "wechatcom_service", "gewechat", "web", "wx859", const.FEISHU, const.DINGTALK]:
-        PluginManager().load_plugins()
+        with boot_profiler.stage("plugin load"):
+            PluginManager().load_plugins()
 
     if conf().get("use_linkai"):
         try:
@@ -37,13 +45,17 @@ def start_channel(channel_name: str):
             threading.Thread(target=linkai_client.start, args=(channel,)).start()
         except Exception as e:
             pass
+    if not getattr(channel, "reports_ready", False):
+        # 其他通道的startup会一直阻塞，在启动前记录
+        boot_profiler.ready("channel startup")
     channel.startup()
 
 
 def run():
     try:
         # load config
-        load_config()
+        with boot_profiler.stage("config load"):
+            load_config()
         # ctrl + c
         sigterm_handler_wrap(signal.SIGINT)
         # kill signal
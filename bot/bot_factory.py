@@ -5,14 +5,19 @@ from common import const
 from config import conf
 
 
-def create_bot(bot_type):
+def create_bot(bot_type, match_model=True):
     """
     create a bot_type instance
     :param bot_type: bot type code
+    :param match_model: whether to pick the bot by the configured model first
     :return: bot instance
     """
+    if bot_type == const.ROUTER:
+        from bot.router.router_bot import RouterBot
+        return RouterBot()
+
     # 获取当前配置的模型
-    model = conf().get("model")
+    model = conf().get("model") if match_model else None
     
     # 如果模型是 qianfan，使用 QianfanBot
     if model == "qianfan" or bot_type == const.QIANFAN:
@@ -145,4 +150,16 @@ def create_bot(bot_type):
         from bot.bytedance.bytedance_coze_bot import ByteDanceCozeBot
         return ByteDanceCozeBot()
 
+    elif bot_type == const.DEEPSEEK:
+        from bot.deepseek.deepseek_bot import DeepSeekBot
+        return DeepSeekBot()
+
+    elif bot_type == const.SILICONFLOW:
+        from bot.siliconflow.siliconflow_bot import SiliconFlowBot
+        return SiliconFlowBot()
+
+    elif bot_type == const.QWEN_DASHSCOPE:
+        from bot.dashscope.dashscope_bot import DashscopeBot
+        return DashscopeBot()
+
     raise RuntimeError
@@ -15,7 +15,7 @@ from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
-from common.token_bucket import TokenBucket
+from common.rate_limiter import get_limiter, retry_after_from_headers
 from common import memory, utils, const
 from config import conf, load_config
 from bot.baidu.baidu_wenxin_session import BaiduWenxinSession
@@ -31,8 +31,6 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
         proxy = conf().get("proxy")
         if proxy:
             openai.proxy = proxy
-        if conf().get("rate_limit_chatgpt"):
-            self.tb4chatgpt = TokenBucket(conf().get("rate_limit_chatgpt", 20))
         conf_model = conf().get("model") or "gpt-3.5-turbo"
         self.sessions = SessionManager(ChatGPTSession, model=conf().get("model") or "gpt-3.5-turbo")
         # o1相关模型不支持system prompt，暂时用文心模型的session
@@ -126,15 +124,21 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
         :return: {}
         """
         try:
-            if conf().get("rate_limit_chatgpt") and not self.tb4chatgpt.get_token():
-                raise openai.error.RateLimitError("RateLimitError: rate limit exceeded")
             # if api_key == None, the default openai.api_key will be used
             if args is None:
                 args = self.args
             res = self.do_vision_completion_if_need(session_id, session.messages[-1]['content'])
             if res:
                 return res
-            response = openai.ChatCompletion.create(api_key=api_key, messages=session.messages, **args)
+            limiter = self._get_limiter(api_key)
+            if not limiter.acquire(timeout=conf().get("rate_limit_wait_timeout", 60)):
+                raise openai.error.RateLimitError("RateLimitError: rate limit exceeded")
+            used_tokens = None
+            try:
+                response = openai.ChatCompletion.create(api_key=api_key, messages=session.messages, **args)
+                used_tokens = response["usage"]["total_tokens"]
+            finally:
+                limiter.release(used_tokens)
             # logger.debug("[CHATGPT] response={}".format(response))
             # logger.info("[ChatGPT] reply={}, total_tokens={}".format(response.choices[0]['message']['content'], response["usage"]["total_tokens"]))
             content = response.choices[0]["message"]["content"]
@@ -190,7 +194,11 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
             if isinstance(e, openai.error.RateLimitError):
                 logger.warn("[CHATGPT] RateLimitError: {}".format(e))
                 result["content"] = "提问太快啦，请休息一下再问我吧"
-                if need_retry:
+                if need_retry and getattr(e, "http_status", None):
+                    # 服务端限流，同一个key的后续请求统一等待，而不是各自盲目sleep
+                    self._get_limiter(api_key).retry_after(retry_after_from_headers(getattr(e, "headers", None), 20))
+                elif need_retry:
+                    # 本地限流器等待超时，退避后再重试
                     time.sleep(20)
             elif isinstance(e, openai.error.Timeout):
                 logger.warn("[CHATGPT] Timeout: {}".format(e))
@@ -219,6 +227,10 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
                 return result
 
 
+    def _get_limiter(self, api_key=None):
+        return get_limiter(const.CHATGPT, api_key or openai.api_key, default_rpm=conf().get("rate_limit_chatgpt"))
+
+
 class AzureChatGPTBot(ChatGPTBot):
     def __init__(self):
         super().__init__()
@@ -2,12 +2,14 @@
 
 import time
 import openai
+import openai.error
 from bot.bot import Bot
 from bot.deepseek.deepseek_session import DeepSeekSession
 from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.rate_limiter import get_limiter, retry_after_from_headers
 from config import conf, load_config
 from common import const
 
@@ -60,13 +62,20 @@ class DeepSeekBot(Bot):
             logger.debug("[DEEPSEEK] session query={}".format(session.messages))
 
             # 调用 DeepSeek API
+            limiter = get_limiter(const.DEEPSEEK, self.api_key)
             try:
-                response = openai.ChatCompletion.create(
-                    api_key=self.api_key,
-                    api_base=self.api_base,
-                    messages=session.messages,
-                    **self.args
-                )
+                with limiter.limit(timeout=conf().get("rate_limit_wait_timeout", 60)) as permit:
+                    try:
+                        response = openai.ChatCompletion.create(
+                            api_key=self.api_key,
+                            api_base=self.api_base,
+                            messages=session.messages,
+                            **self.args
+                        )
+                    except openai.error.RateLimitError as e:
+                        limiter.retry_after(retry_after_from_headers(getattr(e, "headers", None), 10))
+                        raise
+                    permit.used_tokens = response.usage.total_tokens
                 if response.choices:
                     reply_content = response.choices[0].message.content
                     self.sessions.session_reply(reply_content, session_id, response.usage.total_tokens)
@@ -1,11 +1,9 @@
-import time
-
 import openai
 import openai.error
 from bridge.reply import Reply, ReplyType
 
 from common.log import logger
-from common.token_bucket import TokenBucket
+from common.rate_limiter import get_limiter, retry_after_from_headers
 from config import conf
 
 
@@ -14,8 +12,6 @@ class OpenAIImage(object):
     def __init__(self):
         openai.api_base = conf().get("open_ai_api_base")
         openai.api_key = conf().get("open_ai_api_key")
-        if conf().get("rate_limit_dalle"):
-            self.tb4dalle = TokenBucket(conf().get("rate_limit_dalle", 50))
 
     def create_img(self, query, retry_count=0, api_key=None, context=None):
         """
@@ -23,16 +19,20 @@ class OpenAIImage(object):
         - context: 如果想要发送dalle3的revised_prompt，需要填写此参数
         """
         try:
-            if conf().get("rate_limit_dalle") and not self.tb4dalle.get_token():
+            limiter = self._get_dalle_limiter(api_key)
+            if not limiter.acquire(timeout=conf().get("rate_limit_wait_timeout", 60)):
                 return False, "请求太快了，请休息一下再问我吧"
             logger.info("[OPEN_AI] image_query={}".format(query))
-            response = openai.Image.create(
-                api_key=api_key,
-                prompt=query,  # 图片描述
-                n=1,  # 每次生成图片的数量
-                model=conf().get("text_to_image") or "dall-e-2",
-                # size=conf().get("image_create_size", "256x256"),  # 图片大小,可选有 256x256, 512x512, 1024x1024
-            )
+            try:
+                response = openai.Image.create(
+                    api_key=api_key,
+                    prompt=query,  # 图片描述
+                    n=1,  # 每次生成图片的数量
+                    model=conf().get("text_to_image") or "dall-e-2",
+                    # size=conf().get("image_create_size", "256x256"),  # 图片大小,可选有 256x256, 512x512, 1024x1024
+                )
+            finally:
+                limiter.release()
             self.send_revised_prompt(context, response["data"][0].get("revised_prompt", ""), query)
             image_url = response["data"][0]["url"]
             logger.info("[OPEN_AI] image_url={}".format(image_url))
@@ -40,7 +40,7 @@ class OpenAIImage(object):
         except openai.error.RateLimitError as e:
             logger.warn(e)
             if retry_count < 1:
-                time.sleep(5)
+                self._get_dalle_limiter(api_key).retry_after(retry_after_from_headers(getattr(e, "headers", None), 5))
                 logger.warn("[OPEN_AI] ImgCreate RateLimit exceed, 第{}次重试".format(retry_count + 1))
                 return self.create_img(query, retry_count + 1, context=context)
             else:
@@ -49,6 +49,9 @@ class OpenAIImage(object):
             logger.exception(e)
             return False, "画图出现问题，请休息一下再问我吧"
 
+    def _get_dalle_limiter(self, api_key=None):
+        return get_limiter("dalle", api_key or openai.api_key, default_rpm=conf().get("rate_limit_dalle"))
+
     def send_revised_prompt(self, context, revised_prompt, query):
         if not context or not revised_prompt:
             return
@@ -0,0 +1,2 @@
+# 多后端路由模块初始化
+from .router_bot import RouterBot
@@ -0,0 +1,260 @@
+# encoding:utf-8
+
+"""
+多后端路由bot：把对话请求分发到多个已配置的后端bot
+支持加权/最低延迟选择、熔断、对冲请求以及每个后端的并发上限
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bot.bot import Bot
+from bridge.context import ContextType
+from bridge.reply import Reply, ReplyType
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from config import conf
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class BackendStats(object):
+    """单个后端的实时延迟/错误统计"""
+
+    def __init__(self, window=200):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)  # 最近成功请求的耗时(秒)
+        self.ewma = None  # 指数加权平均延迟
+        self.success = 0
+        self.failure = 0
+        self.consecutive_failures = 0
+        self.in_flight = 0
+
+    def record(self, ok, cost):
+        with self.lock:
+            if ok:
+                self.success += 1
+                self.consecutive_failures = 0
+                self.latencies.append(cost)
+                self.ewma = cost if self.ewma is None else 0.8 * self.ewma + 0.2 * cost
+            else:
+                self.failure += 1
+                self.consecutive_failures += 1
+
+    def percentile(self, p):
+        with self.lock:
+            data = sorted(self.latencies)
+        if not data:
+            return None
+        return data[min(len(data) - 1, int(len(data) * p))]
+
+    def snapshot(self):
+        return {
+            "success": self.success,
+            "failure": self.failure,
+            "in_flight": self.in_flight,
+            "ewma": self.ewma,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+        }
+
+
+class Backend(object):
+    def __init__(self, name, bot, weight=1, max_concurrency=0, failure_threshold=3, recovery_seconds=30):
+        self.name = name
+        self.bot = bot
+        self.weight = max(weight, 0)
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.stats = BackendStats()
+        self.state = CLOSED
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def _admissible(self):
+        """熔断未打开且未达到并发上限，调用方需持有self._lock"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_seconds:
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and self.stats.in_flight > 0:
+            return False  # 半开状态只放行一个探测请求
+        if self.max_concurrency and self.stats.in_flight >= self.max_concurrency:
+            return False
+        return True
+
+    def available(self):
+        """只用于挑选候选后端，是否真正放行以acquire()为准"""
+        with self._lock:
+            return self._admissible()
+
+    def acquire(self):
+        """检查和占用在同一把锁内完成，半开状态下并发的请求只有一个能成为探测请求"""
+        with self._lock:
+            if not self._admissible():
+                return False
+            self.stats.in_flight += 1
+            return True
+
+    def release(self, ok, cost):
+        self.stats.record(ok, cost)
+        with self._lock:
+            self.stats.in_flight -= 1
+            if ok:
+                self.state = CLOSED
+            elif self.state == HALF_OPEN or self.stats.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning("[ROUTER] circuit open for backend {}".format(self.name))
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def score(self):
+        """越小越优先，没有延迟数据的后端优先探测"""
+        ewma = self.stats.ewma
+        if ewma is None:
+            return 0
+        return ewma * (1 + self.stats.in_flight)
+
+
+class RouterBot(Bot):
+    def __init__(self):
+        super().__init__()
+        from bot.bot_factory import create_bot
+
+        self.strategy = conf().get("router_strategy", "least_latency")
+        self.hedge_delay = conf().get("router_hedge_delay", 0)
+        self.backends = []
+        for item in conf().get("router_backends", []):
+            if isinstance(item, str):
+                item = {"bot_type": item}
+            bot_type = item.get("bot_type")
+            try:
+                bot = create_bot(bot_type, match_model=False)
+            except Exception as e:
+                logger.error("[ROUTER] failed to create backend {}: {}".format(bot_type, e))
+                continue
+            model = item.get("model")
+            if model:
+                if isinstance(getattr(bot, "args", None), dict) and "model" in bot.args:
+                    bot.args["model"] = model
+                if hasattr(bot, "model_name"):
+                    bot.model_name = model
+            self.backends.append(
+                Backend(
+                    item.get("name") or bot_type,
+                    bot,
+                    weight=item.get("weight", 1),
+                    max_concurrency=item.get("max_concurrency", 0),
+                    failure_threshold=conf().get("router_failure_threshold", 3),
+                    recovery_seconds=conf().get("router_recovery_seconds", 30),
+                )
+            )
+        if not self.backends:
+            raise RuntimeError("[ROUTER] no available backend, please check router_backends")
+        self.affinity = ExpiredDict(conf().get("expires_in_seconds") or 3600)  # session_id -> 上次服务该会话的后端名, 尽量保持上下文连续
+        self.pool = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.backends)), thread_name_prefix="router")
+        logger.info("[ROUTER] inited, backends={}, strategy={}".format([b.name for b in self.backends], self.strategy))
+
+    def reply(self, query, context=None):
+        if context is not None and context.type == ContextType.TEXT and (query in conf().get("clear_memory_commands", ["#清除记忆"]) or query == "#清除所有"):
+            # 清除记忆需要作用到所有后端
+            reply = None
+            for backend in self.backends:
+                reply = backend.bot.reply(query, context)
+            return reply
+
+        session_id = context.get("session_id") if context else None
+        tried = set()
+        reply = None
+        while len(tried) < len(self.backends):
+            candidates = self._select(session_id, tried)
+            if not candidates:
+                break
+            primary = candidates[0]
+            secondary = candidates[1] if len(candidates) > 1 else None
+            if self.hedge_delay and secondary is not None:
+                backend, reply, hedged = self._hedged_call(primary, secondary, query, context)
+                tried.update([primary.name, secondary.name] if hedged else [primary.name])
+            else:
+                backend, reply = primary, self._call(primary, query, context)
+                tried.add(primary.name)
+            if _is_success(reply):
+                if session_id is not None:
+                    self.affinity[session_id] = backend.name
+                return reply
+            logger.warning("[ROUTER] backend {} failed, try next".format(backend.name))
+        return reply or Reply(ReplyType.ERROR, conf().get("error_reply", "我暂时遇到了一些问题，请您稍后重试~"))
+
+    def _select(self, session_id, exclude):
+        """按策略返回可用后端的排序列表"""
+        candidates = [b for b in self.backends if b.name not in exclude and b.available()]
+        if not candidates:
+            return []
+        if self.strategy == "weighted":
+            ordered = []
+            pool = [b for b in candidates if b.weight > 0] or candidates
+            while pool:
+                chosen = random.choices(pool, weights=[b.weight or 1 for b in pool])[0]
+                ordered.append(chosen)
+                pool.remove(chosen)
+        else:
+            ordered = sorted(candidates, key=lambda b: b.score())
+        sticky = self.affinity.get(session_id)
+        for i, b in enumerate(ordered):
+            if b.name == sticky:
+                ordered.insert(0, ordered.pop(i))
+                break
+        return ordered
+
+    def _call(self, backend, query, context):
+        if not backend.acquire():
+            return None
+        start = time.monotonic()
+        reply = None
+        try:
+            reply = backend.bot.reply(query, context)
+            return reply
+        except Exception as e:
+            logger.exception("[ROUTER] backend {} exception: {}".format(backend.name, e))
+            return None
+        finally:
+            backend.release(_is_success(reply), time.monotonic() - start)
+
+    def _hedged_call(self, primary, secondary, query, context):
+        """先请求primary，超过hedge_delay未返回则同时请求secondary，取先成功的结果"""
+        futures = {self.pool.submit(self._call, primary, query, context): primary}
+        done, _ = wait(futures, timeout=self.hedge_delay)
+        hedged = not done
+        if hedged:
+            logger.debug("[ROUTER] hedging request to {}".format(secondary.name))
+            futures[self.pool.submit(self._call, secondary, query, context)] = secondary
+        pending = set(futures)
+        backend, reply = primary, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                backend, reply = futures[f], f.result()
+                if _is_success(reply):
+                    return backend, reply, hedged
+        return backend, reply, hedged
+
+    def close(self):
+        """bot被替换时调用，关闭对冲请求使用的线程池"""
+        self.pool.shutdown(wait=False)
+
+    def get_stats(self):
+        return {
+            b.name: dict(b.stats.snapshot(), state=b.state, weight=b.weight, max_concurrency=b.max_concurrency)
+            for b in self.backends
+        }
+
+
+def _is_success(reply):
+    return reply is not None and reply.type not in [ReplyType.ERROR, None]
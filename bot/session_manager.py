@@ -1,7 +1,15 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from common.expired_dict import ExpiredDict
 from common.log import logger
+from common.session_store import SessionStore, default_spill_path, estimate_size
 from config import conf
 
+compaction_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="session_compact")  # 会话压缩的后台线程池
+DEFAULT_COMPACTION_PROMPT = "请用简洁的中文总结以下对话，保留用户的关键信息、偏好以及尚未解决的问题，不超过200字："
+COMPACTION_RETRY_SECONDS = 300  # 摘要失败后同一会话多久之后再尝试
+
 
 class Session(object):
     def __init__(self, session_id, system_prompt=None):
@@ -38,13 +46,29 @@ class Session(object):
 
 class SessionManager(object):
     def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
+        if conf().get("session_max_count") or conf().get("session_max_bytes"):
+            sessions = SessionStore(
+                max_sessions=conf().get("session_max_count", 0),
+                max_bytes=conf().get("session_max_bytes", 0),
+                expires_in_seconds=conf().get("expires_in_seconds", 0),
+                spill_path=default_spill_path() if conf().get("session_spill_to_disk", False) else None,
+                namespace="{}:{}".format(sessioncls.__name__, session_args.get("model")),
+                dump=_dump_session,
+                load=self._load_session,
+            )
+        elif conf().get("expires_in_seconds"):
             sessions = ExpiredDict(conf().get("expires_in_seconds"))
         else:
             sessions = dict()
         self.sessions = sessions
         self.sessioncls = sessioncls
         self.session_args = session_args
+        self.summarizer = None  # 会话压缩使用的摘要函数，为空时使用当前对话bot
+
+    def _load_session(self, session_id, data):
+        session = self.sessioncls(session_id, data["system_prompt"], **self.session_args)
+        session.messages = data["messages"]
+        return session
 
     def build_session(self, session_id, system_prompt=None):
         """
@@ -63,6 +87,7 @@ class SessionManager(object):
 
     def session_query(self, query, session_id):
         session = self.build_session(session_id)
+        self._apply_compaction(session)
         session.add_query(query)
         try:
             max_tokens = conf().get("conversation_max_tokens", 1000)
@@ -81,11 +106,103 @@ class SessionManager(object):
             logger.debug("raw total_tokens={}, savesession tokens={}".format(total_tokens, tokens_cnt))
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for session: {}".format(str(e)))
+        if session_id is not None and conf().get("session_compaction", False):
+            self._schedule_compaction(session)
         return session
 
+    def _schedule_compaction(self, session):
+        """
+        会话长度超过阈值时，在后台把较早的对话总结成一条摘要，
+        摘要在下一次提问时替换原消息，不阻塞本次回复
+        """
+        if getattr(session, "compacting", False) or getattr(session, "pending_compaction", None):
+            return
+        if time.monotonic() < getattr(session, "compaction_retry_at", 0):
+            return
+        max_tokens = conf().get("conversation_max_tokens", 1000)
+        if _count_tokens(session) < max_tokens * conf().get("session_compaction_threshold", 0.8):
+            return
+        messages = session.messages
+        start = 1 if messages and messages[0].get("role") == "system" else 0
+        end = len(messages) - max(conf().get("session_compaction_keep_messages", 4), 0)
+        if end - start < 2:
+            return
+        history = messages[start:end]
+        session.compacting = True
+        compaction_pool.submit(self._compact, session, start, history)
+
+    def _compact(self, session, start, history):
+        summary = None
+        try:
+            transcript = "\n".join("{}: {}".format(item["role"], item["content"]) for item in history)
+            prompt = conf().get("session_compaction_prompt", DEFAULT_COMPACTION_PROMPT) + "\n\n" + transcript
+            summary = (self.summarizer or _default_summarizer)(prompt)
+        except Exception as e:
+            logger.warning("[SessionManager] session compaction failed: {}".format(e))
+        if summary:
+            session.pending_compaction = (start, history, summary)
+            logger.debug("[SessionManager] session {} compacted {} messages".format(session.session_id, len(history)))
+        else:
+            # 摘要失败时原消息保持不变，一段时间内不再重试，避免每次回复都请求一次
+            session.compaction_retry_at = time.monotonic() + COMPACTION_RETRY_SECONDS
+        session.compacting = False
+
+    def _apply_compaction(self, session):
+        pending = getattr(session, "pending_compaction", None)
+        if not pending:
+            return
+        session.pending_compaction = None
+        start, history, summary = pending
+        current = session.messages[start:start + len(history)]
+        # 摘要生成期间会话被重置或裁剪过，则放弃这次压缩
+        if len(current) != len(history) or any(a is not b for a, b in zip(current, history)):
+            return
+        session.messages[start:start + len(history)] = [
+            {"role": "user", "content": "以下是我们之前对话的摘要，请在后续对话中参考：\n" + summary},
+            {"role": "assistant", "content": "好的，我已了解之前的对话内容。"},
+        ]
+
     def clear_session(self, session_id):
         if session_id in self.sessions:
             del self.sessions[session_id]
 
     def clear_all_session(self):
         self.sessions.clear()
+
+    def get_stats(self):
+        if isinstance(self.sessions, SessionStore):
+            return self.sessions.stats()
+        sessions = list(self.sessions.values())
+        return {"sessions": len(sessions), "bytes": sum(estimate_size(session) for session in sessions)}
+
+
+def _dump_session(session):
+    """写入SQLite的会话内容，压缩中的状态等运行时属性不保存"""
+    return {"system_prompt": session.system_prompt, "messages": session.messages}
+
+
+def _count_tokens(session):
+    try:
+        return session.calc_tokens()
+    except Exception:
+        return sum(len(str(item.get("content", ""))) for item in session.messages)
+
+
+def _default_summarizer(prompt):
+    """
+    直接调用OpenAI兼容的/chat/completions接口生成摘要，不经过对话bot：
+    不需要构造带msg、isgroup等字段的Context，也不占用对话请求的限流额度和路由统计
+    """
+    import requests
+
+    api_base = conf().get("session_compaction_api_base") or conf().get("open_ai_api_base") or "https://api.openai.com/v1"
+    api_key = conf().get("session_compaction_api_key") or conf().get("open_ai_api_key", "")
+    model = conf().get("session_compaction_model") or conf().get("model") or "gpt-3.5-turbo"
+    payload = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+    headers = {"Authorization": "Bearer " + api_key}
+    res = requests.post(url=api_base.rstrip("/") + "/chat/completions", json=payload, headers=headers,
+                        timeout=conf().get("request_timeout", 180))
+    if res.status_code != 200:
+        logger.warning("[SessionManager] summarize failed, status_code={}, response={}".format(res.status_code, res.text[:200]))
+        return None
+    return res.json()["choices"][0]["message"]["content"]
@@ -8,6 +8,7 @@ from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.rate_limiter import get_limiter, retry_after_from_headers
 from config import conf, load_config
 from common import const
 
@@ -67,16 +68,22 @@ class SiliconFlowBot(Bot):
             "messages": messages
         }
         
-        response = requests.post(
-            self.api_base,
-            headers=headers,
-            json=data
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"API调用失败: {response.status_code} - {response.text}")
-            
-        return response.json()
+        limiter = get_limiter(const.SILICONFLOW, self.api_key)
+        with limiter.limit(timeout=conf().get("rate_limit_wait_timeout", 60)) as permit:
+            response = requests.post(
+                self.api_base,
+                headers=headers,
+                json=data
+            )
+
+            if response.status_code == 429:
+                limiter.retry_after(retry_after_from_headers(response.headers, 10))
+            if response.status_code != 200:
+                raise Exception(f"API调用失败: {response.status_code} - {response.text}")
+
+            result = response.json()
+            permit.used_tokens = (result.get("usage") or {}).get("total_tokens")
+            return result
 
     def reply(self, query, context=None):
         """
@@ -1,8 +1,12 @@
+import copy
+import time
+
 from bot.bot_factory import create_bot
-from bridge.context import Context
-from bridge.reply import Reply
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
 from common import const
 from common.log import logger
+from common.single_flight import SingleFlight
 from common.singleton import singleton
 from config import conf
 from translate.factory import create_translator
@@ -80,6 +84,36 @@ class Bridge(object):
 
         self.bots = {}
         self.chat_bots = {}
+        self.single_flight = SingleFlight()
+        self.latency = {}  # bot类型 -> 对话请求的耗时统计
+
+    def _record_latency(self, bot_type, ok, cost):
+        stats = self.latency.get(bot_type)
+        if stats is None:
+            from bot.router.router_bot import BackendStats
+
+            stats = self.latency.setdefault(bot_type, BackendStats())
+        stats.record(ok, cost)
+
+    def _timed_reply(self, bot, query, context):
+        """调用bot回复并记录耗时，合并的重复请求只记录一次"""
+        start = time.monotonic()
+        reply = None
+        try:
+            reply = bot.reply(query, context)
+            return reply
+        finally:
+            ok = reply is not None and reply.type not in [ReplyType.ERROR, None]
+            self._record_latency(self.btype["chat"], ok, time.monotonic() - start)
+
+    def get_latency_stats(self):
+        """各bot对话请求的成功/失败次数和p50/p95耗时(秒)，路由bot额外返回各后端的统计"""
+        stats = {bot_type: s.snapshot() for bot_type, s in list(self.latency.items())}
+        chat_bot = self.bots.get("chat")
+        if chat_bot is not None and hasattr(chat_bot, "get_stats"):
+            for name, snapshot in chat_bot.get_stats().items():
+                stats["{}/{}".format(self.btype["chat"], name)] = snapshot
+        return stats
 
     # 模型对应的接口
     def get_bot(self, typename):
@@ -99,7 +133,15 @@ class Bridge(object):
         return self.btype[typename]
 
     def fetch_reply_content(self, query, context: Context) -> Reply:
-        return self.get_bot("chat").reply(query, context)
+        bot = self.get_bot("chat")
+        key = self._coalesce_key(bot, query, context)
+        if key is None:
+            return self._timed_reply(bot, query, context)
+        reply, shared = self.single_flight.do(key, self._timed_reply, bot, query, context)
+        if shared:
+            logger.debug("[Bridge] coalesced reply, key={}".format(key))
+        # 后续装饰步骤会修改reply，每个调用方拿到独立的副本
+        return copy.copy(reply)
 
     def fetch_voice_to_text(self, voiceFile) -> Reply:
         return self.get_bot("voice_to_text").voiceToText(voiceFile)
@@ -108,7 +150,28 @@ class Bridge(object):
         return self.get_bot("text_to_voice").textToVoice(text)
 
     def fetch_translate(self, text, from_lang="", to_lang="en") -> Reply:
-        return self.get_bot("translate").translate(text, from_lang, to_lang)
+        if not conf().get("request_coalescing", True):
+            return self.get_bot("translate").translate(text, from_lang, to_lang)
+        key = ("translate", self.btype["translate"], _normalize_query(text), from_lang, to_lang)
+        result, _ = self.single_flight.do(key, self.get_bot("translate").translate, text, from_lang, to_lang)
+        return result
+
+    def _coalesce_key(self, bot, query, context: Context):
+        """
+        只有无状态的请求才能合并，返回None表示不合并
+        key由bot类型、规范化后的输入以及影响结果的配置组成
+        """
+        if not conf().get("request_coalescing", True) or context is None or not isinstance(query, str):
+            return None
+        bot_type = self.btype["chat"]
+        model = context.get("gpt_model") or conf().get("model")
+        if context.type == ContextType.IMAGE_CREATE and _is_stateless(bot_type, bot):
+            return (bot_type, context.type, model, conf().get("text_to_image"), conf().get("image_create_size"),
+                    _normalize_query(query))
+        if context.type == ContextType.TEXT and bot_type == const.DIFY \
+                and getattr(bot, "current_app_type", None) == const.DIFY_WORKFLOW:
+            return (bot_type, context.type, const.DIFY_WORKFLOW, conf().get("dify_api_key"), _normalize_query(query))
+        return None
 
     def find_chat_bot(self, bot_type: str):
         if self.chat_bots.get(bot_type) is None:
@@ -117,6 +180,25 @@ class Bridge(object):
 
     def reset_bot(self):
         """
-        重置bot路由
+        重置bot路由，保留各bot的耗时统计
         """
+        for bot in list(self.bots.values()) + list(self.chat_bots.values()):
+            if hasattr(bot, "close"):
+                bot.close()  # 释放被替换的bot持有的线程池等资源
+        latency = self.latency
         self.__init__()
+        self.latency = latency
+
+
+def _is_stateless(bot_type, bot):
+    """
+    Dify(非workflow)和Coze依靠服务端会话管理上下文，画图请求也在会话中完成，
+    Dify agent模式还会在reply中直接通过channel发送消息，这类请求不能合并
+    """
+    if bot_type == const.DIFY:
+        return getattr(bot, "current_app_type", None) == const.DIFY_WORKFLOW
+    return bot_type != const.COZE
+
+
+def _normalize_query(query):
+    return " ".join(query.split())
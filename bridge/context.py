@@ -29,27 +29,76 @@ class ContextType(Enum):
         return self.name
 
 
+_DELETED = object()  # 覆盖层中标记已删除的key
+
+
 class Context:
-    def __init__(self, type: ContextType = None, content=None, kwargs=dict()):
+    # 每条消息都会创建Context，使用__slots__减少内存占用
+    # 因此不能给Context设置额外的属性，附加信息请放到kwargs中(context["key"] = value)
+    __slots__ = ("type", "content", "_kwargs", "_overlay")
+
+    def __init__(self, type: ContextType = None, content=None, kwargs=None):
         self.type = type
         self.content = content
-        self.kwargs = kwargs
+        self._kwargs = {} if kwargs is None else kwargs
+        # fork之后kwargs与其他Context共享，修改只写入覆盖层，读取时先查覆盖层
+        self._overlay = None
+
+    @property
+    def kwargs(self):
+        # 外部可能直接修改返回的dict，此时把覆盖层合并成独立的dict
+        if self._overlay is not None:
+            self._kwargs = self._merged()
+            self._overlay = None
+        return self._kwargs
+
+    @kwargs.setter
+    def kwargs(self, value):
+        self._kwargs = value
+        self._overlay = None
+
+    def _merged(self):
+        merged = dict(self._kwargs)
+        for key, value in self._overlay.items():
+            if value is _DELETED:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+        return merged
+
+    def fork(self):
+        """
+        复制出一个独立的Context，不复制kwargs：
+        两个Context共享同一个kwargs，之后各自的修改只写入自己的覆盖层
+        """
+        kwargs = self.kwargs
+        self._overlay = {}
+        context = Context(self.type, self.content, kwargs)
+        context._overlay = {}
+        return context
 
     def __contains__(self, key):
         if key == "type":
             return self.type is not None
         elif key == "content":
             return self.content is not None
+        elif self._overlay is not None and key in self._overlay:
+            return self._overlay[key] is not _DELETED
         else:
-            return key in self.kwargs
+            return key in self._kwargs
 
     def __getitem__(self, key):
         if key == "type":
             return self.type
         elif key == "content":
             return self.content
+        elif self._overlay is not None and key in self._overlay:
+            value = self._overlay[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
         else:
-            return self.kwargs[key]
+            return self._kwargs[key]
 
     def get(self, key, default=None):
         try:
@@ -62,16 +111,64 @@ class Context:
             self.type = value
         elif key == "content":
             self.content = value
+        elif self._overlay is not None:
+            self._overlay[key] = value
         else:
-            self.kwargs[key] = value
+            self._kwargs[key] = value
 
     def __delitem__(self, key):
         if key == "type":
             self.type = None
         elif key == "content":
             self.content = None
+        elif self._overlay is not None:
+            if key not in self:
+                raise KeyError(key)
+            self._overlay[key] = _DELETED
         else:
-            del self.kwargs[key]
+            del self._kwargs[key]
 
     def __str__(self):
-        return "Context(type={}, content={}, kwargs={})".format(self.type, self.content, self.kwargs)
\ No newline at end of file
+        kwargs = self._kwargs if self._overlay is None else self._merged()
+        return "Context(type={}, content={}, kwargs={})".format(self.type, self.content, kwargs)
+
+
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+
+    # 对比ChatChannel._handle中原来的逐项复制和fork，每条消息之后还会写入2个key
+    def manual_copy(context):
+        independent_context = Context(type=context.type, content=context.content, kwargs={})
+        for key in context.kwargs:
+            if isinstance(context.kwargs[key], dict):
+                independent_context.kwargs[key] = context.kwargs[key].copy()
+            elif isinstance(context.kwargs[key], list):
+                independent_context.kwargs[key] = context.kwargs[key].copy()
+            else:
+                independent_context.kwargs[key] = context.kwargs[key]
+        return independent_context
+
+    def make_context():
+        kwargs = {
+            "msg": object(), "isgroup": True, "session_id": "wxid_a@@123@chatroom", "receiver": "123@chatroom",
+            "origin_ctype": ContextType.TEXT, "group_name": "test", "is_shared_session_group": False,
+            "openai_api_key": None, "gpt_model": None, "channel": object(), "at_list": ["a", "b"],
+        }
+        return Context(ContextType.TEXT, "hello", kwargs)
+
+    rounds = 100000
+    for name, handoff in (("manual copy", manual_copy), ("fork", Context.fork)):
+        contexts = [make_context() for _ in range(rounds)]
+        tracemalloc.start()
+        start = time.perf_counter()
+        handled = []
+        for context in contexts:
+            c = handoff(context)
+            c["isgroup"] = True
+            c["channel"] = None
+            handled.append(c)
+        cost = time.perf_counter() - start
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:<12} {cost / rounds * 1e6:.2f}us, {size / rounds:.0f} bytes per message")
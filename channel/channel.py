@@ -10,6 +10,7 @@ from bridge.reply import *
 class Channel(object):
     channel_type = ""
     NOT_SUPPORT_REPLYTYPE = [ReplyType.VOICE, ReplyType.IMAGE]
+    reports_ready = False  # 为True时通道在可以接收消息时自己调用boot_profiler.ready()，用于统计启动耗时
 
     def startup(self):
         """
@@ -12,6 +12,8 @@ from common.dequeue import Dequeue
 from common import memory
 from plugins import *
 from common.log import logger
+from common.trigger_matcher import strip_mentions
+from config import conf, conf_snapshot
 
 try:
     from voice.audio_convert import any_to_wav
@@ -19,6 +21,31 @@ except Exception as e:
     pass
 
 handler_pool = ThreadPoolExecutor(max_workers=8)  # 处理消息的线程池
+_pool_lock = threading.Lock()  # 保护handler_pool的替换，避免提交到已关闭的旧线程池
+
+
+def _submit_handler(fn, *args):
+    with _pool_lock:
+        return handler_pool.submit(fn, *args)
+
+
+def resize_handler_pool(max_workers):
+    """
+    运行时调整处理消息的线程池大小：新任务提交到新线程池，
+    旧线程池中已提交的任务继续执行，执行完后线程自动退出
+    """
+    global handler_pool
+    with _pool_lock:
+        old_pool = handler_pool
+        if old_pool._max_workers == max_workers:
+            return False
+        # 保留通道设置的线程初始化函数(如wechaty为线程设置事件循环)
+        handler_pool = ThreadPoolExecutor(
+            max_workers=max_workers, initializer=old_pool._initializer, initargs=old_pool._initargs
+        )
+    old_pool.shutdown(wait=False)
+    logger.info("[chat_channel] handler_pool resized: {} -> {}".format(old_pool._max_workers, max_workers))
+    return True
 
 
 # 抽象类, 它包含了与消息通道无关的通用处理逻辑
@@ -50,8 +77,8 @@ class ChatChannel(Channel):
         # context首次传入时，receiver是None，根据类型设置receiver
         first_in = "receiver" not in context
         # 群名匹配过程，设置session_id和receiver
+        snapshot = conf_snapshot()
         if first_in:  # context首次传入时，receiver是None，根据类型设置receiver
-            config = conf()
             cmsg = context["msg"]
             user_data = conf().get_user_data(cmsg.from_user_id)
             context["openai_api_key"] = user_data.get("openai_api_key")
@@ -61,24 +88,14 @@ class ChatChannel(Channel):
                 group_id = cmsg.other_user_id
                 context["group_name"] = group_name
 
-                group_name_white_list = config.get("group_name_white_list", [])
-                group_name_keyword_white_list = config.get("group_name_keyword_white_list", [])
-                if any(
-                        [
-                            group_name in group_name_white_list,
-                            "ALL_GROUP" in group_name_white_list,
-                            check_contain(group_name, group_name_keyword_white_list),
-                        ]
+                if (
+                        snapshot.all_group
+                        or group_name in snapshot.group_name_white_list
+                        or snapshot.triggers.group_name_keyword_white_list.search(group_name)
                 ):
-                    group_chat_in_one_session = conf().get("group_chat_in_one_session", [])
                     session_id = f"{cmsg.actual_user_id}@@{group_id}" # 当群聊未共享session时，session_id为user_id与group_id的组合，用于区分不同群聊以及单聊
                     context["is_shared_session_group"] = False  # 默认为非共享会话群
-                    if any(
-                            [
-                                group_name in group_chat_in_one_session,
-                                "ALL_GROUP" in group_chat_in_one_session,
-                            ]
-                    ):
+                    if snapshot.all_group_in_one_session or group_name in snapshot.group_chat_in_one_session:
                         session_id = group_id
                         context["is_shared_session_group"] = True  # 如果是共享会话群，设置为True
                 else:
@@ -93,17 +110,17 @@ class ChatChannel(Channel):
             context = e_context["context"]
             if e_context.is_pass() or context is None:
                 return context
-            if cmsg.from_user_id == self.user_id and not config.get("trigger_by_self", True):
+            if cmsg.from_user_id == self.user_id and not snapshot.trigger_by_self:
                 logger.debug("[chat_channel]self message skipped")
                 return None
 
         # 消息内容匹配过程，并处理content
         if ctype == ContextType.TEXT:
-            nick_name_black_list = conf().get("nick_name_black_list", [])
+            nick_name_black_list = snapshot.nick_name_black_list
             if context.get("isgroup", False):  # 群聊
                 # 校验关键字
-                match_prefix = check_prefix(content, conf().get("group_chat_prefix"))
-                match_contain = check_contain(content, conf().get("group_chat_keyword"))
+                match_prefix = snapshot.triggers.group_chat_prefix.match(content)
+                match_contain = snapshot.triggers.group_chat_keyword.search(content)
                 flag = False
                 if context["msg"].to_user_id != context["msg"].actual_user_id:
                     if match_prefix is not None or match_contain is not None:
@@ -118,20 +135,13 @@ class ChatChannel(Channel):
                             return None
 
                         logger.info("[chat_channel]receive group at")
-                        if not conf().get("group_at_off", False):
+                        if not snapshot.group_at_off:
                             flag = True
                         self.name = self.name if self.name is not None else ""  # 部分渠道self.name可能没有赋值
-                        pattern = f"@{re.escape(self.name)}(\u2005|\u0020)"
-                        subtract_res = re.sub(pattern, r"", content)
-                        if isinstance(context["msg"].at_list, list):
-                            for at in context["msg"].at_list:
-                                pattern = f"@{re.escape(at)}(\u2005|\u0020)"
-                                subtract_res = re.sub(pattern, r"", subtract_res)
-                        if subtract_res == content and context["msg"].self_display_name:
-                            # 前缀移除后没有变化，使用群昵称再次移除
-                            pattern = f"@{re.escape(context['msg'].self_display_name)}(\u2005|\u0020)"
-                            subtract_res = re.sub(pattern, r"", content)
-                        content = subtract_res
+                        # 移除@机器人和@列表中的成员，没有变化时使用群昵称再次移除
+                        content = strip_mentions(
+                            content, self.name, context["msg"].at_list, context["msg"].self_display_name
+                        )
                 if not flag:
                     if context["origin_ctype"] == ContextType.VOICE:
                         logger.info("[chat_channel]receive group voice, but checkprefix didn't match")
@@ -143,7 +153,7 @@ class ChatChannel(Channel):
                     logger.warning(f"[chat_channel] Nickname '{nick_name}' in In BlackList, ignore")
                     return None
 
-                match_prefix = check_prefix(content, conf().get("single_chat_prefix", [""]))
+                match_prefix = snapshot.triggers.single_chat_prefix.match(content)
                 if match_prefix is not None:  # 判断如果匹配到自定义前缀，则返回过滤掉前缀+空格后的内容
                     content = content.replace(match_prefix, "", 1).strip()
                 elif self.channel_type == 'wechatcom_app':
@@ -154,19 +164,17 @@ class ChatChannel(Channel):
                 else:
                     return None
             content = content.strip()
-            img_match_prefix = check_prefix(content, conf().get("image_create_prefix",[""]))
+            img_match_prefix = snapshot.triggers.image_create_prefix.match(content)
             if img_match_prefix:
                 content = content.replace(img_match_prefix, "", 1)
                 context.type = ContextType.IMAGE_CREATE
             else:
                 context.type = ContextType.TEXT
             context.content = content.strip()
-            if "desire_rtype" not in context and conf().get(
-                    "always_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+            if "desire_rtype" not in context and snapshot.always_reply_voice and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
                 context["desire_rtype"] = ReplyType.VOICE
         elif context.type == ContextType.VOICE:
-            if "desire_rtype" not in context and conf().get(
-                    "voice_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+            if "desire_rtype" not in context and snapshot.voice_reply_voice and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
                 context["desire_rtype"] = ReplyType.VOICE
         return context
 
@@ -174,23 +182,8 @@ class ChatChannel(Channel):
         if context is None or not context.content:
             return
 
-        # 创建上下文的深拷贝，确保完全独立
-        # 由于Context对象没有copy方法，我们需要手动创建一个新的Context对象
-        independent_context = Context(
-            type=context.type,
-            content=context.content,
-            kwargs={}  # 创建空字典，然后手动复制
-        )
-
-        # 手动复制 kwargs 字典中的内容
-        for key in context.kwargs:
-            # 对于复杂对象，创建深拷贝
-            if isinstance(context.kwargs[key], dict):
-                independent_context.kwargs[key] = context.kwargs[key].copy()
-            elif isinstance(context.kwargs[key], list):
-                independent_context.kwargs[key] = context.kwargs[key].copy()
-            else:
-                independent_context.kwargs[key] = context.kwargs[key]
+        # fork出的上下文与原始context共享kwargs，各自的修改写入自己的覆盖层，不需要逐项复制
+        independent_context = context.fork()
 
         # 检查是否为冗长的系统配置消息，如果是则简化处理
         is_long_system_msg = (
@@ -306,8 +299,8 @@ class ChatChannel(Channel):
                     logger.info("[chat_channel] XML context is a processed text quote, converting to TEXT context.")
                     new_context = self._compose_context(ContextType.TEXT, cmsg.content, **context.kwargs)
                     if new_context:
-                        if hasattr(context, 'is_break') and context.is_break:
-                            new_context.is_break = True
+                        if context.get("is_break"):  # Context不能再设置额外属性，标记放在kwargs中
+                            new_context["is_break"] = True
                         return self._generate_reply(new_context) 
                     else:
                         logger.error("[chat_channel] Failed to convert processed XML quote to TEXT context. Original XML content remains.")
@@ -353,16 +346,17 @@ class ChatChannel(Channel):
                     if not segments_to_process:
                         reply.content = ""
                     else:
+                        snapshot = conf_snapshot()
                         decorated_segments = []
                         for i, segment_content in enumerate(segments_to_process):
                             current_segment_for_decoration = segment_content
 
                             if context.get("isgroup", False):
-                                decorated_segment_payload = conf().get("group_chat_reply_prefix", "") + current_segment_for_decoration + conf().get("group_chat_reply_suffix", "")
-                                if i == 0 and not conf().get("no_need_at", False):
+                                decorated_segment_payload = snapshot.group_chat_reply_prefix + current_segment_for_decoration + snapshot.group_chat_reply_suffix
+                                if i == 0 and not snapshot.no_need_at:
                                     decorated_segment_payload = "@" + context["msg"].actual_user_nickname + "\n" + decorated_segment_payload
                             else:
-                                decorated_segment_payload = conf().get("single_chat_reply_prefix", "") + current_segment_for_decoration + conf().get("single_chat_reply_suffix", "")
+                                decorated_segment_payload = snapshot.single_chat_reply_prefix + current_segment_for_decoration + snapshot.single_chat_reply_suffix
                             decorated_segments.append(decorated_segment_payload)
                         reply.content = "/$".join(decorated_segments)
 
@@ -554,7 +548,7 @@ class ChatChannel(Channel):
                             context = context_queue.get()
                             logger.debug("[chat_channel] consume context: {}".format(context))
                             try:
-                                future: Future = handler_pool.submit(self._handle, context)
+                                future: Future = _submit_handler(self._handle, context)
                                 future.add_done_callback(self._thread_pool_callback(session_id, context=context))
                                 task_submitted_and_callback_attached = True
                                 with self.lock:
@@ -632,6 +626,23 @@ class ChatChannel(Channel):
                     logger.info("Cancel {} messages in session {}".format(cnt, session_id))
                 self.sessions[session_id][0] = Dequeue()
 
+    def get_queue_stats(self, top=5):
+        """线程池和各会话消息队列的实时状态，top为列出积压最多的会话数"""
+        with self.lock:
+            pending = {session_id: session[0].qsize() for session_id, session in self.sessions.items()}
+            futures = [future for session_futures in self.futures.values() for future in session_futures]
+        pool = handler_pool
+        return {
+            "pool_size": pool._max_workers,
+            "pool_threads": len(pool._threads),
+            "pool_queued": pool._work_queue.qsize(),
+            "running": sum(1 for future in futures if future.running()),
+            "submitted": sum(1 for future in futures if not future.done()),
+            "sessions": len(pending),
+            "pending": sum(pending.values()),
+            "busiest": sorted(((sid, n) for sid, n in pending.items() if n), key=lambda item: -item[1])[:top],
+        }
+
     def shutdown(self):
         logger.info("[chat_channel] Shutdown called. Signaling consume thread to stop.")
         self._running = False
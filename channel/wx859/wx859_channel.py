@@ -1,4 +1,5 @@
 import asyncio
+import logging
 import os
 import re
 import json
@@ -8,24 +9,24 @@ import io
 import sys
 import traceback 
 import xml.etree.ElementTree as ET  
-import cv2
 import aiohttp
 import uuid 
 from typing import Union, BinaryIO, Optional, Tuple, List, Dict
 import urllib.parse  
 import requests
-from PIL import Image
 from bridge.context import Context, ContextType  
 from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel
 from channel.chat_message import ChatMessage
 from channel.wx859.wx859_message import WX859Message  # 改为从wx859_message导入WX859Message
+from common import boot_profiler
 from common.expired_dict import ExpiredDict
+from common.lazy_import import lazy_import, module_available
 from common.log import logger
 from common.singleton import singleton
 from common.time_check import time_checker
 from common.utils import remove_markdown_symbol, split_string_by_utf8_length
-from config import conf, get_appdata_dir
+from config import conf, conf_snapshot, get_appdata_dir
 from voice.audio_convert import split_audio # Added for voice splitting
 from common.tmp_dir import TmpDir # Added for temporary file management
 from plugins import PluginManager, EventContext, Event
@@ -35,17 +36,18 @@ from pathlib import Path
 import base64
 import subprocess
 import math
-from pydub import AudioSegment # Added for audio duration
+# PIL、pydub、pysilk、cv2只在处理图片、语音、视频时使用，延迟到第一次使用时再导入，加快启动
+Image = lazy_import("PIL.Image")
+pydub = lazy_import("pydub")
 from io import BytesIO # Added for pydub if it operates on BytesIO
 import functools
 
 # Attempt to import pysilk
-try:
-    import pysilk
-    PYSLIK_AVAILABLE = True
-    logger.info("[WX859] pysilk library loaded successfully.")
-except ImportError:
-    PYSLIK_AVAILABLE = False
+pysilk = lazy_import("pysilk", optional=True)
+PYSLIK_AVAILABLE = pysilk is not None
+if PYSLIK_AVAILABLE:
+    logger.info("[WX859] pysilk library found.")
+else:
     logger.warning("[WX859] pysilk library not found. Voice message SILK encoding will be unavailable.")
 
 # 增大日志行长度限制，以便完整显示XML内容
@@ -205,12 +207,31 @@ if not hasattr(ContextType, 'VIDEO'):
     logger.info("[WX859] 已添加 ContextType.VIDEO 类型")
 
 # 导入cv2（OpenCV）用于处理视频
-try:
-    import cv2
-    logger.info("[WX859] 成功导入OpenCV(cv2)模块")
-except ImportError:
+cv2 = lazy_import("cv2", optional=True)
+if cv2 is None:
     logger.warning("[WX859] 未安装OpenCV(cv2)模块，视频处理功能将受限")
-    cv2 = None
+
+
+# 微信团队和系统通知账号，过滤这些账号发来的消息
+SYSTEM_ACCOUNTS = frozenset([
+    "weixin",  # 微信团队
+    "filehelper",  # 文件传输助手
+    "fmessage",  # 朋友推荐通知
+    "medianote",  # 语音记事本
+    "floatbottle",  # 漂流瓶
+    "qmessage",  # QQ离线消息
+    "qqmail",  # QQ邮箱提醒
+    "tmessage",  # 腾讯新闻
+    "weibo",  # 微博推送
+    "newsapp",  # 新闻推送
+    "notification_messages",  # 服务通知
+    "helper_entry",  # 新版微信运动
+    "mphelper",  # 公众号助手
+    "brandsessionholder",  # 公众号消息
+    "weixinreminder",  # 微信提醒
+    "officialaccounts",  # 公众平台
+])
+
 
 def _find_ffmpeg_path():
     """Finds the ffmpeg executable path."""
@@ -291,6 +312,7 @@ class WX859Channel(ChatChannel):
     wx859 channel - 独立通道实现
     """
     NOT_SUPPORT_REPLYTYPE = []
+    reports_ready = True
 
     def __init__(self):
         super().__init__()
@@ -308,6 +330,7 @@ class WX859Channel(ChatChannel):
         # 🔥 新增：下载锁机制，防止重复下载
         self._download_locks = {}  # 下载锁字典 {attach_id: asyncio.Future}
         self._download_cache_check_enabled = True  # 启用缓存检查
+        self.cache_stats = {"image": {"hits": 0, "misses": 0}, "file": {"hits": 0, "misses": 0, "coalesced": 0}}
         
         # 初始化消息过滤设置
         self.single_ignore_blacklist = conf().get("single_ignore_blacklist", [])
@@ -423,6 +446,25 @@ class WX859Channel(ChatChannel):
         file_cleanup_thread.start()
         logger.info(f"[{self.name}] 文件缓存清理任务已启动")
 
+    def get_cache_stats(self):
+        """图片/文件缓存的命中统计和磁盘占用，供管理员指令查看"""
+        result = {}
+        for kind, cache_dir in (("image", self.image_cache_dir), ("file", getattr(self, "file_cache_dir", None))):
+            stats = dict(self.cache_stats[kind])
+            lookups = stats["hits"] + stats["misses"] + stats.get("coalesced", 0)
+            stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else None
+            stats["files"], stats["bytes"] = 0, 0
+            try:
+                for entry in os.scandir(cache_dir):
+                    if entry.is_file():
+                        stats["files"] += 1
+                        stats["bytes"] += entry.stat().st_size
+            except (OSError, TypeError):
+                pass
+            result[kind] = stats
+        result["file"]["downloading"] = len(self._download_locks)
+        return result
+
     def show_cache_status(self):
         """显示缓存状态统计信息 - 集成cache_monitor的查看功能"""
         try:
@@ -1463,6 +1505,7 @@ class WX859Channel(ChatChannel):
                 async with aiohttp.ClientSession() as session:
                     async with session.ws_connect(ws_url) as ws:
                         logger.info(f"[WX859] 已成功连接到 WebSocket: {ws_url}")
+                        boot_profiler.ready()
                         
                         # 启动心跳任务
                         heartbeat_task = asyncio.create_task(self._websocket_heartbeat(ws))
@@ -1557,7 +1600,8 @@ class WX859Channel(ChatChannel):
                                 break
                 
                 cmsg = WX859Message(msg, is_group)
-                logger.debug(f"[WX859] 处理消息: {getattr(cmsg, 'ctype', 'Unknown')} - {getattr(cmsg, 'content', 'Unknown')[:2000]}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"[WX859] 处理消息: {getattr(cmsg, 'ctype', 'Unknown')} - {getattr(cmsg, 'content', 'Unknown')[:2000]}")
                 
                 if self._should_filter_this_message(cmsg):
                     logger.debug(f"[WX859] 消息被过滤: {getattr(cmsg, 'sender_wxid', 'Unknown')}")
@@ -1583,7 +1627,8 @@ class WX859Channel(ChatChannel):
         # 定义启动任务
         async def startup_task():
             # 初始化机器人（登录）
-            login_success = await self._initialize_bot()
+            with boot_profiler.stage("login"):
+                login_success = await self._initialize_bot()
             if login_success:
                 logger.info("[WX859] 登录成功，准备启动消息监听...")
                 self.is_running = True
@@ -1631,32 +1676,13 @@ class WX859Channel(ChatChannel):
             return True
 
         # 2. 过滤微信团队和系统通知
-        system_accounts = [
-            "weixin",  # 微信团队
-            "filehelper",  # 文件传输助手
-            "fmessage",  # 朋友推荐通知
-            "medianote",  # 语音记事本
-            "floatbottle",  # 漂流瓶
-            "qmessage",  # QQ离线消息
-            "qqmail",  # QQ邮箱提醒
-            "tmessage",  # 腾讯新闻
-            "weibo",  # 微博推送
-            "newsapp",  # 新闻推送
-            "notification_messages",  # 服务通知
-            "helper_entry",  # 新版微信运动
-            "mphelper",  # 公众号助手
-            "brandsessionholder",  # 公众号消息
-            "weixinreminder",  # 微信提醒
-            "officialaccounts",  # 公众平台
-        ]
 
         # 检查是否是系统账号
-        for account in system_accounts:
-            if (
-                actual_sender_wxid and isinstance(actual_sender_wxid, str) and actual_sender_wxid == account
-            ) or (actual_from_user_id and isinstance(actual_from_user_id, str) and actual_from_user_id == account):
-                logger.debug(f"[WX859] Filter: 忽略系统账号消息: {actual_sender_wxid or actual_from_user_id}")
-                return True
+        if (isinstance(actual_sender_wxid, str) and actual_sender_wxid in SYSTEM_ACCOUNTS) or (
+            isinstance(actual_from_user_id, str) and actual_from_user_id in SYSTEM_ACCOUNTS
+        ):
+            logger.debug(f"[WX859] Filter: 忽略系统账号消息: {actual_sender_wxid or actual_from_user_id}")
+            return True
 
         # 3. 检测其他特殊账号特征
         # 微信支付相关通知
@@ -1695,7 +1721,7 @@ class WX859Channel(ChatChannel):
 
         # 4. Ignore voice messages if speech recognition is off
         if _message_type == ContextType.VOICE:
-            if conf().get("speech_recognition") != True:
+            if not conf_snapshot().speech_recognition:
                 logger.debug(f"[WX859] Filter: Ignored voice message (speech recognition off): from {effective_sender_id}")
                 return True
 
@@ -1755,11 +1781,11 @@ class WX859Channel(ChatChannel):
             await self._process_message(cmsg)
             
             # 只记录关键消息信息，减少日志输出
-            if conf().get("log_level", "INFO") != "ERROR":
+            if conf_snapshot().log_level != "ERROR":
                 logger.debug(f"[WX859] 私聊消息 - 类型: {cmsg.ctype}, ID: {cmsg.msg_id}, 内容: {cmsg.content[:20]}...")
             
             # 根据消息类型处理
-            if cmsg.ctype == ContextType.VOICE and conf().get("speech_recognition") != True:
+            if cmsg.ctype == ContextType.VOICE and not conf_snapshot().speech_recognition:
                 logger.debug("[WX859] 语音识别功能未启用，跳过处理")
                 return
             
@@ -1807,11 +1833,11 @@ class WX859Channel(ChatChannel):
             await self._process_message(cmsg)
             
             # 只记录关键消息信息，减少日志输出
-            if conf().get("log_level", "INFO") != "ERROR":
+            if conf_snapshot().log_level != "ERROR":
                 logger.debug(f"[WX859] 群聊消息 - 类型: {cmsg.ctype}, 群ID: {cmsg.other_user_id}")
             
             # 根据消息类型处理
-            if cmsg.ctype == ContextType.VOICE and conf().get("group_speech_recognition") != True:
+            if cmsg.ctype == ContextType.VOICE and not conf_snapshot().group_speech_recognition:
                 logger.debug("[WX859] 群聊语音识别功能未启用，跳过处理")
                 return
             
@@ -2584,6 +2610,7 @@ class WX859Channel(ChatChannel):
             if self._download_cache_check_enabled:
                 cached_result = await self._check_file_cache(attach_id, file_name)
                 if cached_result:
+                    self.cache_stats["file"]["hits"] += 1
                     logger.info(f"[WX859] 文件缓存命中，直接使用: {cached_result.get('cached_filename', 'unknown')}")
                     return cached_result
             
@@ -2596,12 +2623,14 @@ class WX859Channel(ChatChannel):
                     # 下载完成后，再次尝试从缓存获取
                     cached_result = await self._check_file_cache(attach_id, file_name)
                     if cached_result:
+                        self.cache_stats["file"]["coalesced"] += 1
                         logger.info(f"[WX859] 等待下载完成后从缓存获取: {cached_result.get('cached_filename', 'unknown')}")
                         return cached_result
                 except Exception as e:
                     logger.warning(f"[WX859] 等待下载完成时出错: {e}")
             
             # 🔥 第三步：执行实际下载
+            self.cache_stats["file"]["misses"] += 1
             return await self._do_download_file_with_lock(attach_id, file_name)
             
         except Exception as e:
@@ -4666,6 +4695,7 @@ class WX859Channel(ChatChannel):
                                             found_cached_path = potential_path
                                             break
                                     
+                                    self.cache_stats["image"]["hits" if found_cached_path else "misses"] += 1
                                     if found_cached_path:
                                         logger.info(f"[{self.name}] Found cached image for aeskey {extracted_refer_aeskey} at {found_cached_path} for msg {cmsg.msg_id}")
                                         
@@ -4963,8 +4993,9 @@ class WX859Channel(ChatChannel):
             import aiohttp
             
             # 获取API配置
-            api_host = conf().get("wx859_api_host", "127.0.0.1")
-            api_port = conf().get("wx859_api_port", 8059)
+            snapshot = conf_snapshot()
+            api_host = snapshot.wx859_api_host
+            api_port = snapshot.wx859_api_port
             # 固定使用859协议，根据swagger.json定义，使用/api前缀
             api_path_prefix = "/api"
 
@@ -4982,8 +5013,9 @@ class WX859Channel(ChatChannel):
             # 记录详细的API调用信息
             logger.debug(f"[WX859] API调用: {url}")
 
-            loggable_params = self._create_loggable_params(params)
-            logger.debug(f"[WX859] 请求参数: {json.dumps(loggable_params, ensure_ascii=False)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                loggable_params = self._create_loggable_params(params)
+                logger.debug(f"[WX859] 请求参数: {json.dumps(loggable_params, ensure_ascii=False)}")
             
             # 判断是否是需要使用表单数据的请求
             need_form_data = False
@@ -5038,7 +5070,8 @@ class WX859Channel(ChatChannel):
                                 try:
                                     # 尝试解析为JSON
                                     result = await response.json(content_type=None)
-                                    logger.debug(f"[WX859] 解析为JSON: {json.dumps(result, ensure_ascii=False)}")
+                                    if logger.isEnabledFor(logging.DEBUG):
+                                        logger.debug(f"[WX859] 解析为JSON: {json.dumps(result, ensure_ascii=False)}")
                                 except Exception as json_err:
                                     logger.error(f"[WX859] JSON解析失败: {json_err}, 原始内容: {text}")
                                     # 返回错误响应
@@ -5499,7 +5532,7 @@ class WX859Channel(ChatChannel):
             result = loop.run_until_complete(self._send_message(receiver, reply.content))
             if result and isinstance(result, dict) and result.get("Success", False):
                 logger.info(f"[WX859] 发送文本消息成功: 接收者: {receiver}")
-                if conf().get("log_level", "INFO") == "DEBUG":
+                if conf_snapshot().log_level == "DEBUG":
                     logger.debug(f"[WX859] 消息内容: {reply.content[:50]}...")
             else:
                 logger.warning(f"[WX859] 发送文本消息可能失败: 接收者: {receiver}, 结果: {result}")
@@ -5509,7 +5542,7 @@ class WX859Channel(ChatChannel):
             result = loop.run_until_complete(self._send_message(receiver, reply.content))
             if result and isinstance(result, dict) and result.get("Success", False):
                 logger.info(f"[WX859] 发送消息成功: 接收者: {receiver}")
-                if conf().get("log_level", "INFO") == "DEBUG":
+                if conf_snapshot().log_level == "DEBUG":
                     logger.debug(f"[WX859] 消息内容: {reply.content[:50]}...")
             else:
                 logger.warning(f"[WX859] 发送消息可能失败: 接收者: {receiver}, 结果: {result}")
@@ -5556,7 +5589,7 @@ class WX859Channel(ChatChannel):
         elif reply.type == ReplyType.APP:
             xml_content = reply.content
             logger.info(f"[WX859] APP message raw content type: {type(xml_content)}, content length: {len(xml_content)}")
-            if conf().get("log_level", "INFO") == "DEBUG":
+            if conf_snapshot().log_level == "DEBUG":
                  logger.debug(f"[WX859] APP XML Content: {xml_content[:500]}") # Log more content for debugging
 
             if not isinstance(xml_content, str):
@@ -5906,7 +5939,8 @@ class WX859Channel(ChatChannel):
                 # 构建完整的API URL用于日志
                 api_url = f"http://{api_host}:{api_port}{api_path_prefix}/Group/GetChatRoomMemberDetail"
                 logger.debug(f"[WX859] 正在请求群成员详情API: {api_url}")
-                logger.debug(f"[WX859] 请求参数: {json.dumps(params, ensure_ascii=False)}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"[WX859] 请求参数: {json.dumps(params, ensure_ascii=False)}")
                 
                 # 调用API获取群成员详情
                 response = await self._call_api("/Group/GetChatRoomMemberDetail", params)
@@ -6093,7 +6127,8 @@ class WX859Channel(ChatChannel):
                 # 构建完整的API URL用于日志
                 api_url = f"http://{api_host}:{api_port}{api_path_prefix}/Group/GetChatRoomInfo"
                 logger.debug(f"[WX859] 正在请求群信息API: {api_url}")
-                logger.debug(f"[WX859] 请求参数: {json.dumps(params, ensure_ascii=False)}")  # 记录请求参数
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"[WX859] 请求参数: {json.dumps(params, ensure_ascii=False)}")  # 记录请求参数
                 
                 # 尝试使用群聊专用API
                 group_info = await self._call_api("/Group/GetChatRoomInfo", params)
@@ -6494,7 +6529,7 @@ class WX859Channel(ChatChannel):
 
             # Load MP3 segment with pydub
             try:
-                audio = AudioSegment.from_file(voice_file_path_segment, format="mp3")
+                audio = pydub.AudioSegment.from_file(voice_file_path_segment, format="mp3")
             except Exception as e_pydub_load:
                 logger.error(f"[WX859] Failed to load voice segment {voice_file_path_segment} with pydub: {e_pydub_load}")
                 logger.error(traceback.format_exc()) # Log full traceback for pydub errors
@@ -0,0 +1,148 @@
+"""
+插件共享的异步运行时：
+1. 一个在后台线程中常驻的事件循环，插件的async处理函数和协程任务都在这里执行
+2. 进程内共享、带连接池的HTTP客户端(aiohttp和requests各一个)，避免每次请求重新建连
+3. 后台任务线程池，耗时的同步任务交给它执行，不再占用消息处理线程
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+
+from common.log import logger
+from config import conf
+
+_lock = threading.RLock()
+_loop = None
+_loop_thread = None
+_aiohttp_session = None
+_http_session = None
+_job_pool = None
+
+
+def get_loop():
+    """获取共享事件循环，首次调用时在守护线程中启动"""
+    global _loop, _loop_thread
+    if _loop is not None:
+        return _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            _loop_thread = threading.Thread(target=run, name="async-runtime", daemon=True)
+            _loop_thread.start()
+            ready.wait()
+            _loop = loop
+            logger.debug("[AsyncRuntime] event loop started")
+    return _loop
+
+
+def in_loop():
+    """当前是否运行在共享事件循环线程中"""
+    return _loop_thread is not None and threading.current_thread() is _loop_thread
+
+
+def submit(coro):
+    """把协程提交到共享事件循环，返回concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run_sync(coro, timeout=None):
+    """在共享事件循环中执行协程并等待结果，不能在事件循环线程中调用"""
+    if in_loop():
+        coro.close()
+        raise RuntimeError("run_sync() cannot be called from the async runtime loop")
+    return submit(coro).result(timeout)
+
+
+def run_job(fn, *args, **kwargs):
+    """把同步任务交给后台任务线程池执行，返回concurrent.futures.Future"""
+    global _job_pool
+    if _job_pool is None:
+        with _lock:
+            if _job_pool is None:
+                _job_pool = ThreadPoolExecutor(
+                    max_workers=conf().get("plugin_background_workers", 8),
+                    thread_name_prefix="plugin-job",
+                )
+    return _job_pool.submit(fn, *args, **kwargs)
+
+
+async def _create_aiohttp_session():
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=conf().get("http_pool_size", 32), ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector)
+
+
+def get_aiohttp_session():
+    """
+    获取共享的aiohttp.ClientSession，只能在共享事件循环中使用
+    第一次调用会阻塞等待session创建，请在事件循环之外先调用一次或在协程中await get_aiohttp_session_async()
+    """
+    global _aiohttp_session
+    if _aiohttp_session is None or _aiohttp_session.closed:
+        if in_loop():
+            raise RuntimeError("use 'await get_aiohttp_session_async()' inside the async runtime loop")
+        with _lock:
+            if _aiohttp_session is None or _aiohttp_session.closed:
+                _aiohttp_session = run_sync(_create_aiohttp_session())
+    return _aiohttp_session
+
+
+async def get_aiohttp_session_async():
+    """get_aiohttp_session的协程版本，供运行在共享事件循环中的代码使用"""
+    global _aiohttp_session
+    if _aiohttp_session is None or _aiohttp_session.closed:
+        # 事件循环是单线程的，这里没有await之前不会被其他协程打断
+        _aiohttp_session = await _create_aiohttp_session()
+    return _aiohttp_session
+
+
+def get_http_session():
+    """获取共享的requests.Session，同步代码使用它复用TCP/TLS连接"""
+    global _http_session
+    if _http_session is None:
+        # 只在用到时导入requests，导入插件框架不依赖它
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with _lock:
+            if _http_session is None:
+                pool_size = conf().get("http_pool_size", 32)
+                session = requests.Session()
+                # 多个插件、多个用户共用同一个session，不保存cookie，避免请求之间互相影响
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def shutdown():
+    """关闭共享的HTTP客户端和事件循环"""
+    global _loop, _aiohttp_session, _http_session, _job_pool
+    with _lock:
+        if _job_pool is not None:
+            _job_pool.shutdown(wait=False)
+            _job_pool = None
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+        if _loop is not None:
+            if _aiohttp_session is not None and not _aiohttp_session.closed:
+                try:
+                    asyncio.run_coroutine_threadsafe(_aiohttp_session.close(), _loop).result(5)
+                except Exception as e:
+                    logger.warning(f"[AsyncRuntime] close aiohttp session failed: {e}")
+            _aiohttp_session = None
+            _loop.call_soon_threadsafe(_loop.stop)
+            _loop = None
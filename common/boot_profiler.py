@@ -0,0 +1,210 @@
+"""
+启动耗时分析：启动参数带 --profile-boot 或设置环境变量 COW_PROFILE_BOOT=1 时开启
+1. 记录启动过程中每个模块的导入耗时，输出耗时最多的导入树
+2. 记录配置加载、插件加载、通道初始化、登录等各阶段耗时，以及从启动到可以接收消息的总耗时
+未开启时所有函数都是空操作
+"""
+
+import builtins
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_T0 = time.perf_counter()
+_enabled = "--profile-boot" in sys.argv or os.environ.get("COW_PROFILE_BOOT", "") not in ("", "0")
+_lock = threading.Lock()
+_stages = []  # (阶段名, 开始时间, 耗时)
+_ready_at = None
+_original_import = None
+_local = threading.local()
+
+# 导入树中只显示累计耗时超过该值(毫秒)的模块
+TREE_THRESHOLD_MS = float(os.environ.get("COW_PROFILE_BOOT_THRESHOLD", 10))
+
+
+class ImportNode(object):
+    __slots__ = ("name", "total", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.total = 0.0
+        self.children = []
+
+    @property
+    def self_time(self):
+        return self.total - sum(child.total for child in self.children)
+
+
+_import_root = ImportNode("<boot>")
+
+
+def enabled():
+    return _enabled
+
+
+def _resolve(name, globals, level):
+    if not level:
+        return name
+    package = (globals or {}).get("__package__") or ""
+    parts = package.rsplit(".", level - 1) if level > 1 else [package]
+    base = parts[0]
+    return f"{base}.{name}" if name else base
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    fullname = _resolve(name, globals, level)
+    # 已导入的模块不记录，只统计真正执行模块代码的导入
+    if fullname in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = [_import_root]
+    node = ImportNode(fullname)
+    stack[-1].children.append(node)
+    stack.append(node)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        node.total = time.perf_counter() - start
+        stack.pop()
+
+
+def start():
+    """开启导入耗时记录，需要在导入其他模块之前调用"""
+    global _original_import
+    if not _enabled or _original_import is not None:
+        return
+    _original_import = builtins.__import__
+    builtins.__import__ = _timed_import
+
+
+def _stop_import_hook():
+    global _original_import
+    if _original_import is not None:
+        builtins.__import__ = _original_import
+        _original_import = None
+
+
+@contextmanager
+def stage(name):
+    """记录一个启动阶段的耗时"""
+    if not _enabled:
+        yield
+        return
+    start_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _stages.append((name, start_at - _T0, time.perf_counter() - start_at))
+
+
+def ready(name="message listener ready", log=True):
+    """通道可以接收消息时调用，记录启动总耗时并输出报告，只有第一次调用生效"""
+    global _ready_at
+    if not _enabled:
+        return
+    with _lock:
+        if _ready_at is not None:
+            return
+        _ready_at = (name, time.perf_counter() - _T0)
+    _stop_import_hook()
+    if not log:
+        return
+    from common.log import logger
+
+    logger.info("[BootProfiler]\n" + report())
+
+
+def _walk_tree(node, depth, lines, max_depth):
+    children = sorted(node.children, key=lambda n: -n.total)
+    for child in children:
+        if child.total * 1000 < TREE_THRESHOLD_MS:
+            continue
+        lines.append(f"{'  ' * depth}{child.name}: {child.total * 1000:.0f}ms (self {child.self_time * 1000:.0f}ms)")
+        if depth + 1 < max_depth:
+            _walk_tree(child, depth + 1, lines, max_depth)
+
+
+def summary():
+    """各阶段耗时和启动总耗时(秒)，供基准测试使用"""
+    with _lock:
+        result = {name: cost for name, _, cost in _stages}
+        if _ready_at is not None:
+            result["ready"] = _ready_at[1]
+    result["import_total"] = sum(node.total for node in _import_root.children)
+    return result
+
+
+def report(max_depth=6, top=15):
+    lines = []
+    with _lock:
+        stages = list(_stages)
+        ready_at = _ready_at
+    if ready_at is not None:
+        lines.append(f"启动到{ready_at[0]}共耗时 {ready_at[1] * 1000:.0f}ms")
+    lines.append("各阶段耗时：")
+    for name, offset, cost in stages:
+        lines.append(f"  {name}: {cost * 1000:.0f}ms (开始于 {offset * 1000:.0f}ms)")
+
+    nodes = []
+
+    def collect(node):
+        for child in node.children:
+            nodes.append(child)
+            collect(child)
+
+    collect(_import_root)
+    if nodes:
+        lines.append(f"模块导入共耗时 {sum(n.total for n in _import_root.children) * 1000:.0f}ms，自身耗时最多的模块：")
+        for node in sorted(nodes, key=lambda n: -n.self_time)[:top]:
+            lines.append(f"  {node.name}: {node.self_time * 1000:.0f}ms")
+        lines.append(f"导入树(累计耗时超过{TREE_THRESHOLD_MS:.0f}ms)：")
+        _walk_tree(_import_root, 1, lines, max_depth)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # 基准测试：在子进程中模拟启动流程(加载配置、创建通道、加载插件)，统计从启动到可以接收消息的耗时
+    # 用法：python -m common.boot_profiler [通道类型，默认terminal] [次数，默认5]
+    import json
+    import statistics
+    import subprocess
+
+    channel_type = sys.argv[1] if len(sys.argv) > 1 else "terminal"
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    script = f"""
+import json
+from common import boot_profiler
+boot_profiler.start()
+with boot_profiler.stage("imports"):
+    from channel import channel_factory
+    from config import load_config
+    from plugins import PluginManager
+with boot_profiler.stage("config load"):
+    load_config()
+with boot_profiler.stage("channel init"):
+    channel = channel_factory.create_channel({channel_type!r})
+with boot_profiler.stage("plugin load"):
+    PluginManager().load_plugins()
+boot_profiler.ready("bench", log=False)
+print("BOOT_SUMMARY" + json.dumps(boot_profiler.summary()))
+"""
+    env = dict(os.environ, COW_PROFILE_BOOT="1")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, cwd=root).stdout
+        line = next((l for l in output.splitlines() if l.startswith("BOOT_SUMMARY")), None)
+        if line is None:
+            print(output[-2000:])
+            raise SystemExit("boot benchmark failed")
+        results.append(json.loads(line[len("BOOT_SUMMARY"):]))
+
+    print(f"channel={channel_type} runs={runs}")
+    for key in results[0]:
+        values = [r[key] * 1000 for r in results if key in r]
+        print(f"{key:>14}: median {statistics.median(values):8.1f}ms  min {min(values):8.1f}ms  max {max(values):8.1f}ms")
@@ -19,6 +19,7 @@ DIFY = "dify"
 SILICONFLOW = "siliconflow"  # 确保这个值与 config.json 中的 bot_type 一致
 DEEPSEEK = "deepseek"  # 添加DeepSeek类型
 MODELSCOPE = "modelscope"  # 添加ModelScope类型
+ROUTER = "router"  # 多后端路由，后端列表见 router_backends 配置
 
 # openAI models
 O1 = "o1"
@@ -1,42 +1,202 @@
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict, deque
 
+_MISSING = object()
 
-class ExpiredDict(dict):
-    def __init__(self, expires_in_seconds):
-        super().__init__()
+
+class ExpiredDict(object):
+    """
+    带过期时间的dict，过期时间使用monotonic时钟计算
+    :param expires_in_seconds: 过期秒数
+    :param max_size: 最大条目数，超过时淘汰最久未使用的条目，0表示不限制
+    :param sliding: True为滑动过期，每次读取都会刷新过期时间；False为固定过期，从写入时开始计算
+
+    所有条目的过期时长相同，所以过期顺序就是写入(滑动过期时为访问)顺序：
+    滑动过期直接按OrderedDict的访问顺序从头淘汰，固定过期用一个按写入顺序的队列淘汰，均摊O(1)
+    """
+
+    def __init__(self, expires_in_seconds, max_size=0, sliding=True):
         self.expires_in_seconds = expires_in_seconds if expires_in_seconds else 3600
+        self.max_size = max_size
+        self.sliding = sliding
+        self._data = OrderedDict()  # key -> [value, expire_at]，按最近访问排序
+        self._expiry = deque()  # 固定过期模式下按写入顺序记录 (expire_at, key)
+        self._lock = threading.RLock()
+
+    def _purge(self, now):
+        """淘汰已过期的条目，调用前需持有锁"""
+        data = self._data
+        if self.sliding:
+            while data:
+                key, entry = next(iter(data.items()))
+                if entry[1] > now:
+                    break
+                del data[key]
+        else:
+            expiry = self._expiry
+            while expiry and expiry[0][0] <= now:
+                expire_at, key = expiry.popleft()
+                entry = data.get(key)
+                if entry is not None and entry[1] == expire_at:
+                    del data[key]
+
+    def _lookup(self, key):
+        """返回未过期的条目值，不存在或已过期返回_MISSING"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            now = time.monotonic()
+            if entry[1] <= now:
+                del self._data[key]
+                return _MISSING
+            if self.sliding:
+                entry[1] = now + self.expires_in_seconds
+            self._data.move_to_end(key)
+            return entry[0]
 
     def __getitem__(self, key):
-        value, expiry_time = super().__getitem__(key)
-        if datetime.now() > expiry_time:
-            del self[key]
-            raise KeyError("expired {}".format(key))
-        self.__setitem__(key, value)
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
         return value
 
     def __setitem__(self, key, value):
-        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
-        super().__setitem__(key, (value, expiry_time))
+        with self._lock:
+            now = time.monotonic()
+            expire_at = now + self.expires_in_seconds
+            entry = self._data.get(key)
+            if entry is None:
+                self._data[key] = [value, expire_at]
+            else:
+                entry[0], entry[1] = value, expire_at
+                self._data.move_to_end(key)
+            if not self.sliding:
+                self._expiry.append((expire_at, key))
+                if len(self._expiry) > 2 * len(self._data) + 64:
+                    # 同一个key被多次写入时队列中会留下旧记录，过多时重建
+                    self._expiry = deque(sorted((e[1], k) for k, e in self._data.items()))
+            self._purge(now)
+            if self.max_size:
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
 
     def get(self, key, default=None):
-        try:
-            return self[key]
-        except KeyError:
-            return default
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[1] <= time.monotonic():
+                return default
+            return entry[0]
 
     def __contains__(self, key):
-        try:
-            self[key]
-            return True
-        except KeyError:
-            return False
+        return self._lookup(key) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            self._purge(time.monotonic())
+            return len(self._data)
 
     def keys(self):
-        keys = list(super().keys())
-        return [key for key in keys if key in self]
+        with self._lock:
+            self._purge(time.monotonic())
+            return list(self._data.keys())
 
     def items(self):
-        return [(key, self[key]) for key in self.keys()]
+        with self._lock:
+            self._purge(time.monotonic())
+            return [(key, entry[0]) for key, entry in self._data.items()]
+
+    def values(self):
+        return [value for _, value in self.items()]
 
     def __iter__(self):
         return self.keys().__iter__()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._expiry.clear()
+
+
+if __name__ == "__main__":
+    from datetime import datetime, timedelta
+
+    class OldExpiredDict(dict):
+        def __init__(self, expires_in_seconds):
+            super().__init__()
+            self.expires_in_seconds = expires_in_seconds if expires_in_seconds else 3600
+
+        def __getitem__(self, key):
+            value, expiry_time = super().__getitem__(key)
+            if datetime.now() > expiry_time:
+                del self[key]
+                raise KeyError("expired {}".format(key))
+            self.__setitem__(key, value)
+            return value
+
+        def __setitem__(self, key, value):
+            expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
+            super().__setitem__(key, (value, expiry_time))
+
+        def __contains__(self, key):
+            try:
+                self[key]
+                return True
+            except KeyError:
+                return False
+
+        def keys(self):
+            keys = list(super().keys())
+            return [key for key in keys if key in self]
+
+    def bench(name, fn, n):
+        start = time.perf_counter()
+        fn()
+        print(f"{name:<36} {(time.perf_counter() - start) / n * 1e6:8.3f}us/op")
+
+    n = 100000
+    keys = ["msg_{}".format(i) for i in range(n)]
+    for label, d in (
+        ("old", OldExpiredDict(3600)),
+        ("new sliding", ExpiredDict(3600)),
+        ("new fixed", ExpiredDict(3600, sliding=False)),
+        ("new fixed max_size=10000", ExpiredDict(3600, max_size=10000, sliding=False)),
+    ):
+        print(f"--- {label}")
+
+        def set_all():
+            for k in keys:
+                d[k] = k
+
+        def get_all():
+            for k in keys:
+                try:
+                    d[k]
+                except KeyError:
+                    pass
+
+        def contains_miss():
+            for k in keys:
+                ("x" + k) in d
+
+        bench("set", set_all, n)
+        bench("get", get_all, n)
+        bench("contains (miss)", contains_miss, n)
+        bench("keys() per call", lambda: [d.keys() for _ in range(10)], 10)
+
+    # 大量过期条目的清理：旧实现只有被访问时才删除，会一直占用内存
+    d = ExpiredDict(0.01)
+    for k in keys:
+        d[k] = k
+    time.sleep(0.02)
+    d["last"] = 1
+    print("entries left after expiry:", len(d._data))
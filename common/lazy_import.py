@@ -0,0 +1,55 @@
+"""
+可选重量级依赖的延迟导入：模块在第一次访问属性时才真正导入，功能没有用到时不占用启动时间
+"""
+
+import importlib
+import importlib.util
+import sys
+import types
+
+
+def module_available(name):
+    """不导入模块，只检查模块是否已安装"""
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyModule(types.ModuleType):
+    """模块代理，第一次访问属性时导入真正的模块，之后直接转发"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name, optional=False):
+    """
+    返回延迟导入的模块
+    :param optional: 为True时模块未安装返回None，调用方用 `if module is None` 判断功能是否可用
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if optional and not module_available(name):
+        return None
+    return LazyModule(name)
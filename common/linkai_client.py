@@ -62,7 +62,7 @@ class ChatClient(LinkAIClient):
             for mapping in config.get("group_app_map"):
                 local_group_map[mapping.get("group_name")] = mapping.get("app_code")
             pconf("linkai")["group_app_map"] = local_group_map
-            PluginManager().instances["LINKAI"].reload()
+            PluginManager().get_instance("LINKAI").reload()
 
         if config.get("text_to_image") and config.get("text_to_image") == "midjourney" and pconf("linkai"):
             if pconf("linkai")["midjourney"]:
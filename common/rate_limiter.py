@@ -0,0 +1,257 @@
+"""
+按后端+API key统一限流：每分钟请求数(rpm)、每分钟token数(tpm)以及最大并发数
+令牌按monotonic时钟惰性计算，不需要后台线程；等待者按先来先到的顺序获取
+"""
+
+import email.utils
+import hashlib
+import threading
+import time
+from collections import deque
+
+from common.log import logger
+from common.token_bucket import TokenBucket
+from config import conf
+
+
+def _bucket(per_minute):
+    """每分钟per_minute个令牌、初始为满的令牌桶，0表示不限制"""
+    return TokenBucket(per_minute, initial_tokens=per_minute) if per_minute else None
+
+
+def _resize(bucket, per_minute):
+    """修改已有令牌桶的速率并保留余额，原来不限制时才新建令牌桶"""
+    if not per_minute:
+        return None
+    if bucket is None:
+        return _bucket(per_minute)
+    bucket.set_rate(per_minute)
+    return bucket
+
+
+class KeyLimiter(object):
+    def __init__(self, name, rpm=0, tpm=0, max_concurrency=0):
+        self.name = name
+        self.rpm = _bucket(rpm)
+        self.tpm = _bucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.blocked_until = 0  # 服务端返回Retry-After后的解除时间
+        self.cond = threading.Condition()
+        self.waiters = deque()
+        # 统计信息
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _wait_time(self, tokens, now):
+        wait = max(0, self.blocked_until - now)
+        if self.rpm:
+            wait = max(wait, self.rpm.wait_time(1, now))
+        if self.tpm:
+            # 调用方不预估token时tokens为0，上次调用的实际消耗使余额透支后同样需要等待
+            wait = max(wait, self.tpm.wait_time(tokens, now))
+        return wait
+
+    def acquire(self, tokens=0, timeout=None):
+        """
+        获取一次调用许可
+        :param tokens: 本次请求预估消耗的token数，用于tpm限制
+        :param timeout: 最长等待秒数，None表示一直等待
+        :return: 是否获取成功
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        ticket = object()
+        with self.cond:
+            self.waiters.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.waiters[0] is ticket:
+                        saturated = self.max_concurrency and self.in_flight >= self.max_concurrency
+                        wait = None if saturated else self._wait_time(tokens, now)
+                        if wait == 0:
+                            if self.rpm:
+                                self.rpm.take(1)
+                            if self.tpm and tokens:
+                                self.tpm.take(tokens)
+                            self.in_flight += 1
+                            self._record_wait(now - start)
+                            return True
+                    else:
+                        wait = None  # 排在前面的等待者拿到许可后会通知
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self.cond.wait(wait)
+            finally:
+                self.waiters.remove(ticket)
+                self.cond.notify_all()
+
+    def release(self, used_tokens=None, estimated_tokens=0):
+        """
+        调用结束后释放并发许可
+        :param used_tokens: 实际消耗的token数，用于修正tpm的预估值
+        """
+        with self.cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if self.tpm and used_tokens is not None:
+                self.tpm.take(used_tokens - estimated_tokens)
+            self.cond.notify_all()
+
+    def retry_after(self, seconds):
+        """服务端返回429时调用，所有使用该key的请求都会等待到指定时间"""
+        if not seconds or seconds <= 0:
+            return
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            logger.warning("[RateLimiter] {} blocked for {:.1f}s by Retry-After".format(self.name, seconds))
+
+    def update(self, rpm=None, tpm=None, max_concurrency=None):
+        """运行时修改限制，None表示不修改，0表示不限制"""
+        with self.cond:
+            # 修改限制不会重新放满令牌，避免每次调整都放行一波突发请求
+            if rpm is not None:
+                self.rpm = _resize(self.rpm, rpm)
+            if tpm is not None:
+                self.tpm = _resize(self.tpm, tpm)
+            if max_concurrency is not None:
+                self.max_concurrency = max_concurrency
+            # 限制放宽后等待者可能已经可以拿到许可
+            self.cond.notify_all()
+
+    def _record_wait(self, cost):
+        self.acquired += 1
+        self.total_wait += cost
+        self.max_wait = max(self.max_wait, cost)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "in_flight": self.in_flight,
+                "waiting": len(self.waiters),
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "avg_wait": self.total_wait / self.acquired if self.acquired else 0,
+                "max_wait": self.max_wait,
+            }
+
+    def limit(self, tokens=0, timeout=None):
+        return _Permit(self, tokens, timeout)
+
+
+class _Permit(object):
+    def __init__(self, limiter, tokens, timeout):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.timeout = timeout
+        self.used_tokens = None
+
+    def __enter__(self):
+        if not self.limiter.acquire(self.tokens, self.timeout):
+            raise RateLimitTimeout("rate limit exceeded: {}".format(self.limiter.name))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.limiter.release(self.used_tokens, self.tokens)
+        return False
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+_limiters = {}
+_lock = threading.Lock()
+
+
+def get_limiter(backend, api_key=None, rpm=None, tpm=None, max_concurrency=None, default_rpm=None):
+    """
+    获取后端+api key对应的限流器，同一个key在所有bot之间共享
+    未显式传入的限制从配置 rate_limits[backend] 中读取
+    :param default_rpm: rate_limits[backend] 未配置rpm时使用的值，用于兼容 rate_limit_chatgpt 等旧配置
+    """
+    key_id = hashlib.md5(api_key.encode("utf-8")).hexdigest()[:8] if api_key else "default"
+    name = "{}:{}".format(backend, key_id)
+    with _lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limits = (conf().get("rate_limits") or {}).get(backend, {})
+            limiter = KeyLimiter(
+                name,
+                rpm=limits.get("rpm", default_rpm or 0) if rpm is None else rpm,
+                tpm=limits.get("tpm", 0) if tpm is None else tpm,
+                max_concurrency=limits.get("max_concurrency", 0) if max_concurrency is None else max_concurrency,
+            )
+            _limiters[name] = limiter
+        return limiter
+
+
+def set_limits(backend, rpm=None, tpm=None, max_concurrency=None):
+    """
+    运行时修改后端的限流配置，同时作用于该后端已创建的限流器
+    :return: 立即生效的限流器数量
+    """
+    limits = {"rpm": rpm, "tpm": tpm, "max_concurrency": max_concurrency}
+    limits = {key: value for key, value in limits.items() if value is not None}
+    rate_limits = dict(conf().get("rate_limits") or {})
+    rate_limits[backend] = dict(rate_limits.get(backend, {}), **limits)
+    conf()["rate_limits"] = rate_limits
+    with _lock:
+        limiters = [limiter for name, limiter in _limiters.items() if name.split(":")[0] == backend]
+    for limiter in limiters:
+        limiter.update(**limits)
+    logger.info("[RateLimiter] {} limits updated: {}, {} limiter(s) affected".format(backend, limits, len(limiters)))
+    return len(limiters)
+
+
+def all_stats():
+    with _lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def parse_retry_after(value, default=None):
+    """解析Retry-After响应头，支持秒数和HTTP日期两种格式"""
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return default
+
+
+def retry_after_from_headers(headers, default=None):
+    if not headers:
+        return default
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    return parse_retry_after(value, default)
+
+
+if __name__ == "__main__":
+    # 检查tpm限制：调用方不预估token(tokens=0)时，上次调用的实际消耗透支余额后，下一次获取需要等待
+    limiter = KeyLimiter("check", tpm=600)  # 每秒补充10个token
+    assert limiter.acquire(timeout=0)
+    limiter.release(used_tokens=650)  # 实际消耗超过容量，余额透支50
+    start = time.monotonic()
+    assert not limiter.acquire(timeout=1), "acquire should block while the tpm bucket is overdrawn"
+    assert limiter.acquire(timeout=10)
+    print(f"tpm overdraft: second acquire waited {time.monotonic() - start:.1f}s (expected ~5s)")
+
+    # 检查运行时修改限制：保留当前余额，不会重新放满令牌
+    limiter = KeyLimiter("update", rpm=60)
+    for _ in range(60):
+        assert limiter.acquire(timeout=0)
+        limiter.release()
+    limiter.update(rpm=120)
+    assert not limiter.acquire(timeout=0), "update should not refill the rpm bucket"
+    print("update: rpm bucket balance kept after raising the limit")
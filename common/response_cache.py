@@ -0,0 +1,182 @@
+"""
+插件共享的外部接口响应缓存：按 接口+参数 缓存返回结果，过期时间对齐自然时间段，
+每日更新的数据(早报、摸鱼日历、星座)缓存到当天午夜，热榜、天气等缓存到下一个整点，
+同一时间段内的相同请求只访问一次外部接口
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from common.log import logger
+from common.single_flight import SingleFlight
+
+
+def next_midnight(now=None):
+    """到下一个本地午夜的时间戳"""
+    now = datetime.fromtimestamp(now if now is not None else time.time())
+    return (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+
+
+def next_hour(now=None):
+    """到下一个本地整点的时间戳"""
+    now = datetime.fromtimestamp(now if now is not None else time.time())
+    return (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+
+
+def every(seconds):
+    """按固定秒数对齐的时间段，比如every(600)在每个整10分钟过期"""
+
+    def bucket(now=None):
+        now = now if now is not None else time.time()
+        return (now // seconds + 1) * seconds
+
+    return bucket
+
+
+DAILY = next_midnight
+HOURLY = next_hour
+
+
+def _estimate_size(value):
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return 1024
+
+
+class ResponseCache(object):
+    """
+    :param max_entries: 最多缓存的条目数，超过时淘汰最久未使用的条目
+    :param max_bytes: 按_estimate_size估算的总大小上限，主要用于限制缓存的图片、视频
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (value, expire_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, expires=DAILY):
+        """
+        :param expires: 时间段函数(如DAILY/HOURLY)，返回过期时间戳
+        """
+        expire_at = expires()
+        size = _estimate_size(value)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expire_at, size)
+            self._bytes += size
+            while self._data and (
+                (self.max_entries and len(self._data) > self.max_entries) or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._data)))
+
+    def get_or_fetch(self, key, fetch, expires=DAILY, cacheable=None, refresh=False):
+        """
+        先查缓存，没有时调用fetch获取，并发的相同请求只调用一次fetch
+        :param cacheable: 判断结果是否可以缓存的函数，默认结果不为空即可缓存，失败的响应不应缓存
+        :param refresh: 忽略已有缓存强制重新获取，用于定时预取
+        """
+        if not refresh:
+            value = self.get(key)
+            if value is not None:
+                return value
+        value, shared = self._flight.do(key, fetch)
+        if not shared and (cacheable(value) if cacheable else value is not None):
+            self.set(key, value, expires)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache():
+    """插件共用的响应缓存实例"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = ResponseCache()
+    return _shared_cache
+
+
+def schedule_daily(times, job, name="prefetch"):
+    """
+    每天在指定时间执行job，用于在高峰前预取数据
+    :param times: "HH:MM"格式的时间列表
+    :return: 取消调度的函数
+    """
+    state = {"timer": None, "cancelled": False}
+
+    def seconds_until_next():
+        now = datetime.now()
+        candidates = []
+        for t in times:
+            hour, minute = (int(x) for x in t.split(":"))
+            at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if at <= now:
+                at += timedelta(days=1)
+            candidates.append((at - now).total_seconds())
+        return min(candidates)
+
+    def run():
+        if state["cancelled"]:
+            return
+        try:
+            job()
+        except Exception as e:
+            logger.error(f"[ResponseCache] scheduled {name} failed: {e}")
+        arm()
+
+    def arm():
+        timer = threading.Timer(seconds_until_next(), run)
+        timer.daemon = True
+        timer.name = name
+        state["timer"] = timer
+        timer.start()
+
+    def cancel():
+        state["cancelled"] = True
+        if state["timer"] is not None:
+            state["timer"].cancel()
+
+    if times:
+        arm()
+    return cancel
@@ -0,0 +1,250 @@
+"""
+有容量上限的会话存储：按LRU淘汰最久未使用的会话，可选把被淘汰的会话以JSON写入本地SQLite，
+下次收到该会话的消息时自动加载回内存
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from common.log import logger
+
+
+def estimate_size(session):
+    """粗略估算会话占用的字节数，只统计消息内容"""
+    messages = getattr(session, "messages", None) or []
+    size = 256
+    for item in messages:
+        content = item.get("content") if isinstance(item, dict) else item
+        size += 64 + len(str(content)) * 2
+    return size
+
+
+class SessionStore(MutableMapping):
+    """
+    可以替代sessions字典使用，keys()/values()/items()/len()包含已写入SQLite的会话
+    :param dump: 会话 -> 可JSON序列化的对象，用于写入SQLite，默认原样写入
+    :param load: (key, dump的结果) -> 会话，用于从SQLite还原，默认原样返回
+    """
+
+    def __init__(self, max_sessions=0, max_bytes=0, expires_in_seconds=0, spill_path=None, namespace="default",
+                 dump=None, load=None):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.expires_in_seconds = expires_in_seconds
+        self.namespace = namespace
+        # 不使用pickle：数据库文件被篡改时，加载pickle会执行任意代码
+        self._dump = dump or (lambda session: session)
+        self._load_session = load or (lambda key, data: data)
+        self._data = OrderedDict()  # key -> [session, size, last_access]
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._db = None
+        if spill_path:
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (ns TEXT, key TEXT, data BLOB, updated REAL, PRIMARY KEY (ns, key))"
+            )
+            self._db.commit()
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.reloads = 0
+
+    def _expired(self, last_access):
+        return self.expires_in_seconds and time.monotonic() - last_access > self.expires_in_seconds
+
+    def _stored_expired(self, updated):
+        return self.expires_in_seconds and time.time() - updated > self.expires_in_seconds
+
+    def _decode(self, key, data):
+        try:
+            return self._load_session(key, json.loads(data))
+        except Exception as e:
+            logger.warning("[SessionStore] failed to load session {}: {}".format(key, e))
+            return None
+
+    def _spilled(self):
+        """SQLite中未过期且不在内存中的会话，只读取不加载回内存"""
+        if self._db is None:
+            return []
+        rows = self._db.execute("SELECT key, data, updated FROM sessions WHERE ns=?", (self.namespace,)).fetchall()
+        return [(key, data) for key, data, updated in rows if key not in self._data and not self._stored_expired(updated)]
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT data, updated FROM sessions WHERE ns=? AND key=?", (self.namespace, str(key))).fetchone()
+        if row is None:
+            return None
+        self._db.execute("DELETE FROM sessions WHERE ns=? AND key=?", (self.namespace, str(key)))
+        self._db.commit()
+        if self._stored_expired(row[1]):
+            return None
+        session = self._decode(key, row[0])
+        if session is not None:
+            self.reloads += 1
+        return session
+
+    def _spill(self, key, session, last_access):
+        if self._db is None:
+            return
+        try:
+            data = json.dumps(self._dump(session), ensure_ascii=False)
+        except Exception as e:
+            logger.warning("[SessionStore] failed to spill session {}: {}".format(key, e))
+            return
+        # 保存的是最后访问的墙上时间，用于重新加载时判断是否过期
+        updated = time.time() - (time.monotonic() - last_access)
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (ns, key, data, updated) VALUES (?, ?, ?, ?)",
+            (self.namespace, str(key), data, updated),
+        )
+        self._db.commit()
+
+    def _evict(self):
+        while self._data and (
+            (self.max_sessions and len(self._data) > self.max_sessions) or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            if len(self._data) == 1:
+                break  # 至少保留当前会话
+            key, (session, size, last_access) = self._data.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            if not self._expired(last_access):
+                self._spill(key, session, last_access)
+
+    def _touch(self, key, entry):
+        """刷新访问时间和占用大小，会话的消息列表会在外部被原地修改"""
+        size = estimate_size(entry[0])
+        self._bytes += size - entry[1]
+        entry[1] = size
+        entry[2] = time.monotonic()
+        self._data.move_to_end(key)
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._expired(entry[2]):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                session = self._load(key)
+                if session is None:
+                    self.misses += 1
+                    raise KeyError(key)
+                entry = [session, 0, time.monotonic()]
+                self._data[key] = entry
+            else:
+                self.hits += 1
+            self._touch(key, entry)
+            self._evict()
+            return entry[0]
+
+    def __setitem__(self, key, session):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            elif self._db is not None:
+                # 覆盖已写入SQLite的旧会话
+                self._db.execute("DELETE FROM sessions WHERE ns=? AND key=?", (self.namespace, str(key)))
+                self._db.commit()
+            entry = [session, 0, time.monotonic()]
+            self._data[key] = entry
+            self._touch(key, entry)
+            self._evict()
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self._bytes -= entry[1]
+
+    def __delitem__(self, key):
+        with self._lock:
+            found = key in self._data
+            if found:
+                self._remove(key)
+            if self._db is not None:
+                cur = self._db.execute("DELETE FROM sessions WHERE ns=? AND key=?", (self.namespace, str(key)))
+                self._db.commit()
+                found = found or cur.rowcount > 0
+            if not found:
+                raise KeyError(key)
+
+    def __contains__(self, key):
+        """只判断是否存在，不加载会话、不改变LRU顺序和命中统计"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                return not self._expired(entry[2])
+            if self._db is None:
+                return False
+            row = self._db.execute("SELECT updated FROM sessions WHERE ns=? AND key=?", (self.namespace, str(key))).fetchone()
+            return row is not None and not self._stored_expired(row[0])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        with self._lock:
+            keys = [k for k, entry in self._data.items() if not self._expired(entry[2])]
+            return keys + [key for key, _ in self._spilled()]
+
+    def items(self):
+        """内存和SQLite中的全部会话，SQLite中的会话只读取副本，不加载回内存"""
+        with self._lock:
+            items = [(k, entry[0]) for k, entry in self._data.items() if not self._expired(entry[2])]
+            spilled = self._spilled()
+        for key, data in spilled:
+            session = self._decode(key, data)
+            if session is not None:
+                items.append((key, session))
+        return items
+
+    def values(self):
+        return [session for _, session in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE ns=?", (self.namespace,))
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            spilled = 0
+            if self._db is not None:
+                spilled = self._db.execute("SELECT COUNT(*) FROM sessions WHERE ns=?", (self.namespace,)).fetchone()[0]
+            return {
+                "sessions": len(self._data),
+                "bytes": self._bytes,
+                "spilled": spilled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "reloads": self.reloads,
+            }
+
+
+def default_spill_path():
+    from config import get_appdata_dir
+
+    return os.path.join(get_appdata_dir(), "sessions.db")
@@ -0,0 +1,66 @@
+import threading
+
+
+class _Call(object):
+    __slots__ = ("done", "result", "error", "dups")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.dups = 0
+
+
+class SingleFlight(object):
+    """
+    并发请求合并：相同key的调用同一时刻只会真正执行一次，
+    其余并发调用方阻塞等待，并共享这一次调用的结果(或异常)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.total = 0  # 总调用次数
+        self.shared = 0  # 被合并(未实际执行)的调用次数
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        执行fn，如果已有相同key的调用正在进行，则等待其结果
+        :return: (result, shared) shared为True表示结果来自其他调用方
+        """
+        with self._lock:
+            self.total += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.dups += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return {"total": self.total, "shared": self.shared, "in_flight": len(self._calls)}
@@ -1,65 +1,126 @@
-import heapq
+from bisect import bisect_left, insort
 
 
 class SortedDict(dict):
+    """
+    按sort_func(key, value)排序的dict，排序相同时按key排序
+    内部维护一个有序的 (priority, key) 列表，插入/更新/删除都通过二分查找定位
+    """
+
     def __init__(self, sort_func=lambda k, v: k, init_dict=None, reverse=False):
         if init_dict is None:
             init_dict = []
         if isinstance(init_dict, dict):
             init_dict = init_dict.items()
         self.sort_func = sort_func
-        self.sorted_keys = None
+        self.sorted_keys = None  # 缓存的有序key列表，顺序变化时置空
         self.reverse = reverse
-        self.heap = []
+        self._order = []  # 升序排列的 (priority, key)
+        self._priorities = {}  # key -> 当前在_order中的priority
         for k, v in init_dict:
             self[k] = v
 
+    def _remove_order(self, key):
+        entry = (self._priorities.pop(key), key)
+        i = bisect_left(self._order, entry)
+        del self._order[i]
+
+    def _insert_order(self, key, priority):
+        self._priorities[key] = priority
+        insort(self._order, (priority, key))
+
     def __setitem__(self, key, value):
-        if key in self:
-            super().__setitem__(key, value)
-            for i, (priority, k) in enumerate(self.heap):
-                if k == key:
-                    self.heap[i] = (self.sort_func(key, value), key)
-                    heapq.heapify(self.heap)
-                    break
-            self.sorted_keys = None
-        else:
-            super().__setitem__(key, value)
-            heapq.heappush(self.heap, (self.sort_func(key, value), key))
-            self.sorted_keys = None
+        priority = self.sort_func(key, value)
+        if key in self._priorities:
+            if self._priorities[key] == priority:
+                super().__setitem__(key, value)
+                return
+            self._remove_order(key)
+        super().__setitem__(key, value)
+        self._insert_order(key, priority)
+        self.sorted_keys = None
 
     def __delitem__(self, key):
         super().__delitem__(key)
-        for i, (priority, k) in enumerate(self.heap):
-            if k == key:
-                del self.heap[i]
-                heapq.heapify(self.heap)
-                break
+        self._remove_order(key)
         self.sorted_keys = None
 
     def keys(self):
         if self.sorted_keys is None:
-            self.sorted_keys = [k for _, k in sorted(self.heap, reverse=self.reverse)]
+            order = reversed(self._order) if self.reverse else self._order
+            self.sorted_keys = [k for _, k in order]
         return self.sorted_keys
 
     def items(self):
-        if self.sorted_keys is None:
-            self.sorted_keys = [k for _, k in sorted(self.heap, reverse=self.reverse)]
-        sorted_items = [(k, self[k]) for k in self.sorted_keys]
-        return sorted_items
+        return [(k, self[k]) for k in self.keys()]
 
     def _update_heap(self, key):
-        for i, (priority, k) in enumerate(self.heap):
-            if k == key:
-                new_priority = self.sort_func(key, self[key])
-                if new_priority != priority:
-                    self.heap[i] = (new_priority, key)
-                    heapq.heapify(self.heap)
-                    self.sorted_keys = None
-                break
+        """value被原地修改后调用，重新计算key的排序位置"""
+        new_priority = self.sort_func(key, self[key])
+        if new_priority != self._priorities[key]:
+            self._remove_order(key)
+            self._insert_order(key, new_priority)
+            self.sorted_keys = None
 
     def __iter__(self):
         return iter(self.keys())
 
     def __repr__(self):
         return f"{type(self).__name__}({dict(self)}, sort_func={self.sort_func.__name__}, reverse={self.reverse})"
+
+
+if __name__ == "__main__":
+    import heapq
+    import random
+    import time
+
+    class OldSortedDict(dict):
+        def __init__(self, sort_func=lambda k, v: k, reverse=False):
+            self.sort_func = sort_func
+            self.sorted_keys = None
+            self.reverse = reverse
+            self.heap = []
+
+        def __setitem__(self, key, value):
+            if key in self:
+                super().__setitem__(key, value)
+                for i, (priority, k) in enumerate(self.heap):
+                    if k == key:
+                        self.heap[i] = (self.sort_func(key, value), key)
+                        heapq.heapify(self.heap)
+                        break
+            else:
+                super().__setitem__(key, value)
+                heapq.heappush(self.heap, (self.sort_func(key, value), key))
+            self.sorted_keys = None
+
+        def __delitem__(self, key):
+            super().__delitem__(key)
+            for i, (priority, k) in enumerate(self.heap):
+                if k == key:
+                    del self.heap[i]
+                    heapq.heapify(self.heap)
+                    break
+            self.sorted_keys = None
+
+        def keys(self):
+            if self.sorted_keys is None:
+                self.sorted_keys = [k for _, k in sorted(self.heap, reverse=self.reverse)]
+            return self.sorted_keys
+
+    random.seed(1)
+    for n in (50, 2000):
+        ops = [("k{}".format(random.randrange(n)), random.randrange(1000), random.random() < 0.2) for _ in range(20000)]
+        for name, cls in (("old", OldSortedDict), ("new", SortedDict)):
+            d = cls(lambda k, v: v, reverse=True)
+            start = time.perf_counter()
+            for key, value, iterate in ops:
+                if key in d and value % 5 == 0:
+                    del d[key]
+                else:
+                    d[key] = value
+                if iterate:
+                    for _ in d.keys():
+                        pass
+            cost = time.perf_counter() - start
+            print(f"n={n:<5} {name}: {cost / len(ops) * 1e6:.2f}us/op, keys={d.keys()[:3]}")
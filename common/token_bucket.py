@@ -1,39 +1,95 @@
+import asyncio
 import threading
 import time
 
+_DEFAULT = object()
+
 
 class TokenBucket:
-    def __init__(self, tpm, timeout=None):
+    """
+    令牌桶，令牌数在获取时根据monotonic时钟惰性计算，不需要后台线程
+    获取令牌时如果不够，会预占令牌(余额变为负数)并等待到令牌补齐，后来的请求等待更久，天然先到先得
+    """
+
+    def __init__(self, tpm, timeout=None, initial_tokens=1):
         self.capacity = int(tpm)  # 令牌桶容量
-        self.tokens = 0  # 初始令牌数为0
+        # 初始令牌数，默认为1：与原来的生成线程启动时立即放入一个令牌一致，第一次获取不需要等待
+        self.tokens = float(min(initial_tokens, self.capacity))
         self.rate = int(tpm) / 60  # 令牌每秒生成速率
         self.timeout = timeout  # 等待令牌超时时间
-        self.cond = threading.Condition()  # 条件变量
-        self.is_running = True
-        # 开启令牌生成线程
-        threading.Thread(target=self._generate_tokens).start()
-
-    def _generate_tokens(self):
-        """生成令牌"""
-        while self.is_running:
-            with self.cond:
-                if self.tokens < self.capacity:
-                    self.tokens += 1
-                self.cond.notify()  # 通知获取令牌的线程
-            time.sleep(1 / self.rate)
-
-    def get_token(self):
-        """获取令牌"""
-        with self.cond:
-            while self.tokens <= 0:
-                flag = self.cond.wait(self.timeout)
-                if not flag:  # 超时
-                    return False
-            self.tokens -= 1
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def wait_time(self, tokens, now=None):
+        """不获取令牌，只计算还需要等待多少秒才能拿到tokens个令牌，余额透支时tokens为0也需要等待"""
+        with self.lock:
+            self._refill(time.monotonic() if now is None else now)
+            tokens = min(tokens, self.capacity)  # 超过容量的请求在桶满时放行，避免永远等待
+            if self.tokens >= tokens:
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def take(self, tokens):
+        """直接扣除令牌，允许透支(负数表示归还)，之后的请求会相应等待更久"""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens - tokens)
+
+    def set_rate(self, tpm):
+        """修改速率和容量，保留当前余额(不超过新容量)，不会因为修改配置而重新放行一整桶请求"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.capacity = int(tpm)
+            self.rate = int(tpm) / 60
+            self.tokens = min(self.capacity, self.tokens)
+
+    def _reserve(self, tokens, blocking, timeout):
+        """预占令牌，返回需要等待的秒数，无法在超时时间内获取时返回None"""
+        if timeout is _DEFAULT:
+            timeout = self.timeout
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            if not blocking or self.rate <= 0:
+                return None
+            wait = (tokens - self.tokens) / self.rate
+            if timeout is not None and wait > timeout:
+                return None
+            self.tokens -= tokens
+            return wait
+
+    def get_token(self, tokens=1, blocking=True, timeout=_DEFAULT):
+        """
+        获取令牌
+        :param tokens: 获取的令牌数，可用于按token数限流
+        :param blocking: False时令牌不足立即返回False
+        :param timeout: 最长等待秒数，默认使用构造时的timeout，None表示一直等待
+        """
+        wait = self._reserve(tokens, blocking, timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    async def get_token_async(self, tokens=1, blocking=True, timeout=_DEFAULT):
+        """get_token的异步版本，等待期间不阻塞事件循环"""
+        wait = self._reserve(tokens, blocking, timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
         return True
 
     def close(self):
-        self.is_running = False
+        # 不再有后台线程，保留该方法兼容旧代码
+        pass
 
 
 if __name__ == "__main__":
@@ -43,3 +99,18 @@ if __name__ == "__main__":
         if token_bucket.get_token():
             print(f"第{i+1}次请求成功")
     token_bucket.close()
+
+    # 高速率下的获取开销
+    bucket = TokenBucket(6000000, initial_tokens=6000000)
+    start = time.perf_counter()
+    for _ in range(100000):
+        bucket.get_token(blocking=False)
+    print(f"get_token: {(time.perf_counter() - start) / 100000 * 1e6:.2f}us/op, threads={threading.active_count()}")
+
+    async def main():
+        bucket = TokenBucket(600)
+        start = time.monotonic()
+        await asyncio.gather(*[bucket.get_token_async() for _ in range(5)])
+        print(f"async: 5 tokens at 10/s took {time.monotonic() - start:.2f}s")
+
+    asyncio.run(main())
@@ -0,0 +1,210 @@
+"""
+群聊/私聊触发词匹配：配置加载时预编译一次，消息处理时直接使用
+- PrefixTrie: 前缀匹配，结果与 check_prefix 一致（返回列表中最靠前的匹配前缀）
+- KeywordMatcher: 关键词包含匹配（Aho-Corasick），结果与 check_contain 一致
+- strip_mentions: 移除@机器人/@列表中的成员，结果与逐个 re.sub 一致，正则按名字缓存
+"""
+
+import re
+from functools import lru_cache
+
+
+class PrefixTrie(object):
+    def __init__(self, prefixes):
+        self.prefixes = tuple(p for p in (prefixes or []) if isinstance(p, str))
+        self.root = {}
+        self.empty_index = None  # 空字符串前缀在列表中的位置
+        for index, prefix in enumerate(self.prefixes):
+            if not prefix:
+                if self.empty_index is None:
+                    self.empty_index = index
+                continue
+            node = self.root
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            if None not in node:  # None键保存该前缀在列表中的位置，重复前缀保留第一个
+                node[None] = index
+
+    def match(self, content):
+        """返回列表中第一个匹配的前缀，没有匹配返回None"""
+        if not self.prefixes:
+            return None
+        best = self.empty_index
+        node = self.root
+        for ch in content:
+            node = node.get(ch)
+            if node is None:
+                break
+            index = node.get(None)
+            if index is not None and (best is None or index < best):
+                best = index
+        return None if best is None else self.prefixes[best]
+
+
+class KeywordMatcher(object):
+    # 关键词较少时直接用str的查找更快，关键词多时使用自动机
+    AUTOMATON_THRESHOLD = 64
+
+    def __init__(self, keywords):
+        self.keywords = tuple(k for k in (keywords or []) if isinstance(k, str))
+        self.has_empty = "" in self.keywords
+        self.goto = None
+        if len(self.keywords) > self.AUTOMATON_THRESHOLD and not self.has_empty:
+            self._build()
+
+    def _build(self):
+        # goto[state]: 字符 -> 下一状态；fail为失配指针；output标记是否有关键词在该状态结束
+        goto = [{}]
+        output = [False]
+        for keyword in self.keywords:
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    output.append(False)
+                state = nxt
+            output[state] = True
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                if state:
+                    f = fail[state]
+                    while f and ch not in goto[f]:
+                        f = fail[f]
+                    fail[nxt] = goto[f].get(ch, 0)
+                output[nxt] = output[nxt] or output[fail[nxt]]
+        self.goto, self.fail, self.output = goto, fail, output
+
+    def search(self, content):
+        """包含任一关键词返回True，否则返回None"""
+        if not self.keywords:
+            return None
+        if self.has_empty:
+            return True
+        if self.goto is None:
+            for keyword in self.keywords:
+                if keyword in content:
+                    return True
+            return None
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for ch in content:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                return True
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _mention_pattern(name):
+    return re.compile(f"@{re.escape(name)}(\u2005|\u0020)")
+
+
+def _strip(name, content):
+    # 内容里没有 "@名字" 时正则不可能匹配，跳过
+    if ("@" + name) not in content:
+        return content
+    return _mention_pattern(name).sub("", content)
+
+
+def strip_mentions(content, bot_name, at_list=None, self_display_name=None):
+    """
+    依次移除 @机器人名、@列表中的成员；如果内容没有变化，再尝试移除 @机器人群昵称
+    """
+    if "@" not in content:
+        return content
+    result = _strip(bot_name, content)
+    if isinstance(at_list, list):
+        for at in at_list:
+            result = _strip(at, result)
+    if result == content and self_display_name:
+        result = _strip(self_display_name, content)
+    return result
+
+
+class TriggerMatcher(object):
+    """由配置编译出的全部触发规则"""
+
+    def __init__(self, config):
+        self.group_chat_prefix = PrefixTrie(config.get("group_chat_prefix"))
+        self.group_chat_keyword = KeywordMatcher(config.get("group_chat_keyword"))
+        self.single_chat_prefix = PrefixTrie(config.get("single_chat_prefix", [""]))
+        self.image_create_prefix = PrefixTrie(config.get("image_create_prefix", [""]))
+        self.group_name_keyword_white_list = KeywordMatcher(config.get("group_name_keyword_white_list", []))
+
+
+if __name__ == "__main__":
+    import random
+    import string
+    import time
+
+    def check_prefix(content, prefix_list):
+        if not prefix_list:
+            return None
+        for prefix in prefix_list:
+            if content.startswith(prefix):
+                return prefix
+        return None
+
+    def check_contain(content, keyword_list):
+        if not keyword_list:
+            return None
+        for ky in keyword_list:
+            if content.find(ky) != -1:
+                return True
+        return None
+
+    def old_strip(content, name, at_list, display_name):
+        pattern = f"@{re.escape(name)}(\u2005|\u0020)"
+        subtract_res = re.sub(pattern, r"", content)
+        for at in at_list:
+            pattern = f"@{re.escape(at)}(\u2005|\u0020)"
+            subtract_res = re.sub(pattern, r"", subtract_res)
+        if subtract_res == content and display_name:
+            pattern = f"@{re.escape(display_name)}(\u2005|\u0020)"
+            subtract_res = re.sub(pattern, r"", content)
+        return subtract_res
+
+    random.seed(1)
+
+    def word(n):
+        return "".join(random.choice(string.ascii_lowercase + "小助手机器人") for _ in range(n))
+
+    def bench(name, fn, items, rounds=20):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for item in items:
+                fn(item)
+        cost = time.perf_counter() - start
+        print(f"{name:<28} {len(items) * rounds / cost / 1000:8.1f}k msg/s")
+
+    messages = [word(random.randint(5, 120)) for _ in range(5000)]
+    for n in (4, 32, 256):
+        prefixes = ["@" + word(random.randint(2, 6)) for _ in range(n)] + ["bot"]
+        keywords = [word(random.randint(3, 8)) for _ in range(n)]
+        samples = messages + [random.choice(prefixes) + m for m in messages[:500]]
+        trie, matcher = PrefixTrie(prefixes), KeywordMatcher(keywords)
+        assert all(trie.match(m) == check_prefix(m, prefixes) for m in samples)
+        assert all(matcher.search(m) == check_contain(m, keywords) for m in samples)
+        print(f"--- {n} prefixes / keywords")
+        bench("check_prefix", lambda m: check_prefix(m, prefixes), samples)
+        bench("PrefixTrie.match", trie.match, samples)
+        bench("check_contain", lambda m: check_contain(m, keywords), samples)
+        bench("KeywordMatcher.search", matcher.search, samples)
+
+    members = [word(random.randint(2, 8)) for _ in range(200)]
+    at_messages = []
+    for m in messages[:2000]:
+        at_list = random.sample(members, random.randint(0, 3))
+        at_messages.append(("".join("@" + a + " " for a in at_list) + m, at_list))
+    assert all(strip_mentions(c, "bot", a, "小助手") == old_strip(c, "bot", a, "小助手") for c, a in at_messages)
+    print("--- mention stripping")
+    bench("re.sub per name", lambda x: old_strip(x[0], "bot", x[1], "小助手"), at_messages)
+    bench("strip_mentions", lambda x: strip_mentions(x[0], "bot", x[1], "小助手"), at_messages)
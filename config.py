@@ -5,8 +5,10 @@ import logging
 import os
 import pickle
 import copy
+import threading
 
 from common.log import logger
+from common.trigger_matcher import TriggerMatcher
 
 # 将所有可用的配置项写在字典里, 请使用小写字母
 # 此处的配置值无实际意义，程序不会读取此处的配置，仅用于提示格式，请将配置加入到config.json中
@@ -36,6 +38,12 @@ available_setting = {
     "siliconflow_api_key": "", # 硅基流动 API key
     "siliconflow_api_base": "https://api.siliconflow.cn/v1/chat/completions",
     "siliconflow_model": "deepseek-ai/DeepSeek-V3.1",  # SiliconFlow 默认模型    
+    # 多后端路由配置，bot_type设置为router时生效
+    "router_backends": [],  # 后端列表，如 [{"bot_type": "deepseek", "model": "deepseek-chat", "weight": 2, "max_concurrency": 8}, {"bot_type": "siliconflow"}, {"bot_type": "dashscope", "model": "qwen-plus"}]
+    "router_strategy": "least_latency",  # 后端选择策略，可选 least_latency(最低延迟), weighted(按权重随机)
+    "router_hedge_delay": 0,  # 对冲请求延迟(秒)，主后端超过该时间未返回时同时请求备用后端，0表示关闭
+    "router_failure_threshold": 3,  # 连续失败多少次后熔断该后端
+    "router_recovery_seconds": 30,  # 熔断后多少秒尝试恢复
     # Modelscope API配置    
     "modelscope_api_key": "", # Modelscope API key
     "modelscope_api_base": "https://api-inference.modelscope.cn/v1",  # Modelscope API基础地址
@@ -47,6 +55,12 @@ available_setting = {
     "wx859_protocol_version": "859", # wx859 channel protocol version 
     "wx859_sync_interval": 3, # wx859 channel 消息同步间隔时间
     "log_level": "INFO",                 # 日志级别, 可选 "DEBUG", "INFO", "WARNING", "ERROR"
+    "log_async": True,  # 是否使用后台线程写日志，避免磁盘IO阻塞消息处理
+    "log_json": False,  # 是否输出JSON Lines格式的结构化日志
+    "log_file": "run.log",  # 日志文件路径
+    "log_max_bytes": 0,  # 日志文件按大小轮转的阈值(字节)，0表示不按大小轮转
+    "log_rotate_when": "",  # 日志按时间轮转，如 "midnight"、"H"，为空表示不按时间轮转，优先于log_max_bytes
+    "log_backup_count": 5,  # 轮转后保留的日志文件个数
     "wx859_callback_host": "127.0.0.1",  # WX859 channel 回调监听主机
     "wx859_callback_port": 9919,       # WX859 channel 回调监听端口 (根据实际需要和代码确认是否添加)
     "wx859_callback_key": "",  # WX859回调接口的验证密钥，默认为空字符串    
@@ -80,19 +94,35 @@ available_setting = {
     "image_proxy": True,  # 是否需要图片代理，国内访问LinkAI时需要
     "image_create_prefix": ["画", "看", "找"],  # 开启图片回复的前缀
     "concurrency_in_session": 1,  # 同一会话最多有多少条消息在处理中，大于1可能乱序
+    "request_coalescing": True,  # 是否合并并发的相同无状态请求(画图、dify工作流、翻译等)，只调用一次后端并共享结果
     "image_create_size": "256x256",  # 图片大小,可选有 256x256, 512x512, 1024x1024 (dall-e-3默认为1024x1024)
     "group_chat_exit_group": False,
     "group_exit_msg": "",  # 退出群聊的消息
     "accept_friend_msg": "",  # 接受好友请求后发送的消息
     # chatgpt会话参数
     "expires_in_seconds": 3600,  # 无操作会话的过期时间
+    "session_max_count": 0,  # 内存中最多保留的会话数，超过后淘汰最久未使用的会话，0表示不限制
+    "session_max_bytes": 0,  # 内存中会话消息的最大估算字节数，0表示不限制
+    "session_spill_to_disk": False,  # 是否把被淘汰的会话写入数据目录下的sessions.db，下次消息时自动加载
     "image_expires_in_seconds": 7200,  # 图片消息缓存过期时间（秒）
     # 人格描述
     "character_desc": "你是ChatGPT, 一个由OpenAI训练的大型语言模型, 你旨在回答并解决人们的任何问题，并且可以使用多种语言与人交流。",
     "conversation_max_tokens": 1000,  # 支持上下文记忆的最多字符数
+    # 会话压缩：会话长度超过阈值时，在后台把较早的对话总结为一条摘要，减少每次请求的长度
+    "session_compaction": False,  # 是否开启会话压缩
+    "session_compaction_threshold": 0.8,  # 超过 conversation_max_tokens 的多少比例时触发压缩
+    "session_compaction_keep_messages": 4,  # 压缩时保留最近多少条原始消息
+    # 摘要直接调用OpenAI兼容的/chat/completions接口，不经过对话bot，以下为空时使用open_ai_api_base、open_ai_api_key和model
+    "session_compaction_api_base": "",
+    "session_compaction_api_key": "",
+    "session_compaction_model": "",
+    "session_compaction_prompt": "请用简洁的中文总结以下对话，保留用户的关键信息、偏好以及尚未解决的问题，不超过200字：",
     # chatgpt限流配置
     "rate_limit_chatgpt": 20,  # chatgpt的调用频率限制
     "rate_limit_dalle": 50,  # openai dalle的调用频率限制
+    # 按后端+api key统一限流，key为bot类型，如 {"deepseek": {"rpm": 60, "tpm": 100000, "max_concurrency": 4}}
+    "rate_limits": {},
+    "rate_limit_wait_timeout": 60,  # 等待限流许可的最长时间(秒)
     # chatgpt api参数 参考https://platform.openai.com/docs/api-reference/chat/create
     "temperature": 0.9,
     "top_p": 1,
@@ -221,6 +251,14 @@ available_setting = {
     "plugin_trigger_prefix": "$",  # 规范插件提供聊天相关指令的前缀，建议不要和管理员指令前缀"#"冲突
     # 是否使用全局插件配置
     "use_global_plugin_config": False,
+    "plugin_prefilter": True,  # 是否根据插件声明的消息类型和触发词预先过滤，只把可能命中的消息交给插件处理
+    "plugin_lazy_load": False,  # 是否懒加载插件：插件目录没有变化时按清单缓存注册，第一次有消息需要该插件时才导入模块
+    "plugin_profiling": True,  # 是否统计每个插件处理事件的耗时，可通过#pstat查看
+    "plugin_time_budgets": {},  # 插件单次处理事件的时间预算(秒)，key为插件名，"default"对所有插件生效，如 {"default": 5, "JinaSum": 30}
+    "plugin_budget_action": "warn",  # 超出时间预算时的处理: warn 只告警, disable 连续超出多次后在运行时禁用插件
+    "plugin_budget_strikes": 3,  # 连续超出时间预算多少次后禁用插件
+    "plugin_background_workers": 8,  # 插件后台任务线程池大小，用于run_in_background提交的同步任务
+    "http_pool_size": 32,  # 插件共享HTTP客户端的连接池大小
     "max_media_send_count": 3,  # 单次最大发送媒体资源的个数
     "media_send_interval": 1,  # 发送图片的事件间隔，单位秒
     # 智谱AI 平台配置
@@ -242,6 +280,9 @@ available_setting = {
 }
 
 
+_config_version = 0  # 每次修改配置项时递增，用于判断配置快照是否过期
+
+
 class Config(dict):
     def __init__(self, d=None):
         super().__init__()
@@ -260,6 +301,8 @@ class Config(dict):
     def __setitem__(self, key, value):
         if key not in available_setting:
             raise Exception("key {} not in available_setting".format(key))
+        global _config_version
+        _config_version += 1
         return super().__setitem__(key, value)
 
     def get(self, key, default=None):
@@ -393,6 +436,71 @@ def conf():
     return config
 
 
+class ConfigSnapshot(object):
+    """
+    消息处理热路径使用的只读配置快照
+    名单转换为frozenset，前缀和关键词编译为TriggerMatcher，其余配置项转换为确定类型的字段
+    """
+
+    def __init__(self, config, version):
+        self.source = config
+        self.version = version
+
+        group_name_white_list = config.get("group_name_white_list", []) or []
+        self.group_name_white_list = frozenset(group_name_white_list)
+        self.all_group = "ALL_GROUP" in self.group_name_white_list
+        group_chat_in_one_session = config.get("group_chat_in_one_session", []) or []
+        self.group_chat_in_one_session = frozenset(group_chat_in_one_session)
+        self.all_group_in_one_session = "ALL_GROUP" in self.group_chat_in_one_session
+        self.nick_name_black_list = frozenset(config.get("nick_name_black_list", []) or [])
+
+        # 前缀、关键词等触发规则
+        self.triggers = TriggerMatcher(config)
+
+        self.group_at_off = bool(config.get("group_at_off", False))
+        self.trigger_by_self = bool(config.get("trigger_by_self", True))
+        self.always_reply_voice = bool(config.get("always_reply_voice"))
+        self.voice_reply_voice = bool(config.get("voice_reply_voice"))
+        self.speech_recognition = config.get("speech_recognition") == True
+        self.group_speech_recognition = config.get("group_speech_recognition") == True
+        self.no_need_at = bool(config.get("no_need_at", False))
+
+        self.group_chat_reply_prefix = config.get("group_chat_reply_prefix", "") or ""
+        self.group_chat_reply_suffix = config.get("group_chat_reply_suffix", "") or ""
+        self.single_chat_reply_prefix = config.get("single_chat_reply_prefix", "") or ""
+        self.single_chat_reply_suffix = config.get("single_chat_reply_suffix", "") or ""
+
+        self.log_level = config.get("log_level", "INFO")
+        self.wx859_api_host = config.get("wx859_api_host", "127.0.0.1")
+        self.wx859_api_port = config.get("wx859_api_port", 8059)
+
+    def is_valid(self, config):
+        return self.source is config and self.version == _config_version
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def conf_snapshot() -> ConfigSnapshot:
+    """
+    获取当前配置快照。#reconf重新加载或修改配置项后，下次调用时重新构建并整体替换
+    快照本身不可变，读取方不需要加锁
+    """
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.is_valid(config):
+        return snapshot
+    return refresh_conf_snapshot()
+
+
+def refresh_conf_snapshot() -> ConfigSnapshot:
+    """强制重建配置快照，用于配置中的列表被原地修改等无法自动感知的场景"""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = ConfigSnapshot(config, _config_version)
+        return _snapshot
+
+
 def get_appdata_dir():
     data_path = os.path.join(get_root(), conf().get("appdata_dir", ""))
     if not os.path.exists(data_path):
@@ -401,6 +509,14 @@ def get_appdata_dir():
     return data_path
 
 
+def get_cache_dir():
+    """运行时生成的缓存文件目录，位于数据目录下的cache子目录，不与源码混在一起"""
+    cache_path = os.path.join(get_appdata_dir(), "cache")
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path, exist_ok=True)
+    return cache_path
+
+
 def subscribe_msg():
     trigger_prefix = conf().get("single_chat_prefix", [""])[0]
     msg = conf().get("subscribe_msg", "")
@@ -2,11 +2,14 @@ import plugins
 import requests
 import re
 import json
+import threading
 from urllib.parse import urlparse
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from channel import channel
+from common.async_runtime import get_http_session
 from common.log import logger
+from common.response_cache import DAILY, HOURLY, get_response_cache, schedule_daily
 from plugins import *
 from datetime import datetime, timedelta
 from PIL import Image
@@ -15,6 +18,25 @@ BASE_URL_VVHAN = "https://api.vvhan.com/api/"
 BASE_URL_ALAPI= "https://v3.alapi.cn/api/"
 
 
+def _cache_key_part(value):
+    """把请求参数转换成可以作为缓存key的字符串"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return value
+
+
+def _is_ok_response(result):
+    """只缓存成功的响应：请求异常、接口返回success=False或code不为200时都不缓存"""
+    if result is None or isinstance(result, Exception):
+        return False
+    if isinstance(result, dict):
+        if result.get("success") is False:
+            return False
+        if "code" in result and result.get("code") != 200:
+            return False
+    return bool(result)
+
+
 @plugins.register(
     name="Apilot",
     desire_priority=88,
@@ -22,6 +44,8 @@ BASE_URL_ALAPI= "https://v3.alapi.cn/api/"
     desc="A plugin to handle specific keywords",
     version="0.2",
     author="vision",
+    context_types=[ContextType.TEXT],
+    keywords=["早报", "摸鱼", "八卦", "举牌", "快递", "座", "热榜", "天气"],
 )
 class Apilot(Plugin):
     def __init__(self):
@@ -39,10 +63,26 @@ class Apilot(Plugin):
                 self.alapi_token = self.conf.get("alapi_token")
                 self.morning_news_text_enabled = self.conf.get("morning_news_text_enabled", False)
                 self.ssl_verify = self.conf.get("ssl_verify", True) # Read from config, default to True
+            plugin_conf = self.conf or {}
+            # 外部接口响应缓存，早报、摸鱼等每日数据缓存到午夜，热榜、天气缓存到下一个整点
+            self.cache_enabled = plugin_conf.get("cache_enabled", True)
+            self.response_cache = get_response_cache()
+            self._prefetch_state = threading.local()
+            # 在高峰前定时预取每日数据，格式 ["07:50"]
+            self.prefetch_commands = plugin_conf.get("prefetch_commands", ["早报", "摸鱼", "八卦"])
+            self._cancel_prefetch = None
+            if self.cache_enabled and plugin_conf.get("prefetch_times"):
+                self._cancel_prefetch = schedule_daily(plugin_conf["prefetch_times"], self.prefetch, name="apilot-prefetch")
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
         except Exception as e:
             raise self.handle_error(e, "[Apiot] init failed, ignore ")
 
+    def unload(self):
+        # 插件重载或重新启用时会创建新实例，取消旧实例的预取定时器
+        if getattr(self, "_cancel_prefetch", None):
+            self._cancel_prefetch()
+            self._cancel_prefetch = None
+
     def on_handle_context(self, e_context: EventContext):
         if e_context["context"].type not in [
             ContextType.TEXT
@@ -191,7 +231,7 @@ class Apilot(Plugin):
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
             # 发送请求获取图片
-            response = requests.get(url, headers=headers)
+            response = get_http_session().get(url, headers=headers)
             response.raise_for_status()
             
             # 使用PIL处理图片
@@ -228,14 +268,14 @@ class Apilot(Plugin):
             url = BASE_URL_VVHAN + "zaobao"
             payload = {"format": "json"} # VVHAN uses GET, so this should be params
             headers = {'User-Agent': 'Mozilla/5.0'} # VVHAN might need a User-Agent
-            news_api_output = self.make_request(url, method="GET", headers=headers, params=payload, verify_ssl=self.ssl_verify)
+            news_api_output = self.make_request(url, method="GET", headers=headers, params=payload, verify_ssl=self.ssl_verify, cache=DAILY)
         else:
             # Use ALAPI (with token)
             is_alapi_with_token = True
             url = BASE_URL_ALAPI + "zaobao"
             data = {"token": alapi_token, "format": "json"}
             headers = {'Content-Type': "application/x-www-form-urlencoded"}
-            news_api_output = self.make_request(url, method="POST", headers=headers, data=data, verify_ssl=self.ssl_verify)
+            news_api_output = self.make_request(url, method="POST", headers=headers, data=data, verify_ssl=self.ssl_verify, cache=DAILY)
             img_url_key = 'image' # ALAPI uses 'image' in data
             # news_data_key is still 'data' but structure is different
 
@@ -282,7 +322,7 @@ class Apilot(Plugin):
                 return self.create_reply(ReplyType.TEXT, formatted_text)
             else:
                 # Download image and return as ReplyType.IMAGE
-                image_bytes = self.make_request(actual_img_url, method="GET", verify_ssl=self.ssl_verify, return_raw_content=True)
+                image_bytes = self.make_request(actual_img_url, method="GET", verify_ssl=self.ssl_verify, return_raw_content=True, cache=DAILY)
                 if isinstance(image_bytes, bytes) and image_bytes:
                     return self.create_reply(ReplyType.IMAGE, image_bytes)
                 else:
@@ -297,7 +337,7 @@ class Apilot(Plugin):
         url = BASE_URL_VVHAN + "moyu?type=json"
         payload = "format=json"
         headers = {'Content-Type': "application/x-www-form-urlencoded"}
-        moyu_calendar_info = self.make_request(url, method="POST", headers=headers, data=payload)
+        moyu_calendar_info = self.make_request(url, method="POST", headers=headers, data=payload, cache=DAILY)
         # 验证请求是否成功
         if isinstance(moyu_calendar_info, dict) and moyu_calendar_info.get('success', False):
             return moyu_calendar_info['url']
@@ -305,7 +345,7 @@ class Apilot(Plugin):
             url = "https://dayu.qqsuu.cn/moyuribao/apis.php?type=json" # Fallback URL
             payload = "format=json"
             headers = {'Content-Type': "application/x-www-form-urlencoded"}
-            moyu_calendar_info = self.make_request(url, method="POST", headers=headers, data=payload)
+            moyu_calendar_info = self.make_request(url, method="POST", headers=headers, data=payload, cache=DAILY)
             if isinstance(moyu_calendar_info, dict) and moyu_calendar_info.get('code') == 200:
                 moyu_pic_url = moyu_calendar_info["data"]
                 if self.is_valid_image_url(moyu_pic_url):
@@ -319,7 +359,7 @@ class Apilot(Plugin):
         url = "https://dayu.qqsuu.cn/moyuribaoshipin/apis.php?type=json"
         payload = "format=json"
         headers = {'Content-Type': "application/x-www-form-urlencoded"}
-        moyu_calendar_info = self.make_request(url, method="POST", headers=headers, data=payload)
+        moyu_calendar_info = self.make_request(url, method="POST", headers=headers, data=payload, cache=DAILY)
         logger.debug(f"[Apilot] moyu calendar video response: {moyu_calendar_info}")
         # 验证请求是否成功
         if isinstance(moyu_calendar_info, dict) and moyu_calendar_info.get('code') == 200:
@@ -338,7 +378,7 @@ class Apilot(Plugin):
                 'time': time_period
             }
             try:
-                horoscope_data = self.make_request(url, "GET", params=params)
+                horoscope_data = self.make_request(url, "GET", params=params, cache=DAILY)
                 if isinstance(horoscope_data, dict) and horoscope_data['success']:
                     data = horoscope_data['data']
 
@@ -376,7 +416,7 @@ class Apilot(Plugin):
             payload = f"token={alapi_token}&star={astro_sign}"
             headers = {'Content-Type': "application/x-www-form-urlencoded"}
             try:
-                horoscope_data = self.make_request(url, method="POST", headers=headers, data=payload, verify_ssl=self.ssl_verify)
+                horoscope_data = self.make_request(url, method="POST", headers=headers, data=payload, verify_ssl=self.ssl_verify, cache=DAILY)
                 if isinstance(horoscope_data, dict) and horoscope_data.get('code') == 200:
                     data = horoscope_data['data']['day']
 
@@ -414,7 +454,7 @@ class Apilot(Plugin):
             try:
                 data = self.make_request(url, "GET", params={
                     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                }, verify_ssl=self.ssl_verify)
+                }, verify_ssl=self.ssl_verify, cache=HOURLY)
                 if isinstance(data, dict) and data.get('success', False) == True:
                     output = []
                     topics = data['data']
@@ -503,7 +543,7 @@ class Apilot(Plugin):
         logger.info(f"[Apilot] 查询参数: city/id={city_or_id}, date={date}")
         
         try:
-            weather_data = self.make_request(url, "GET", params=params, verify_ssl=self.ssl_verify)
+            weather_data = self.make_request(url, "GET", params=params, verify_ssl=self.ssl_verify, cache=HOURLY)
             if isinstance(weather_data, dict) and weather_data.get('code') == 200:
                 data = weather_data['data']
                 if date in ['明天', '后天', '七天', '7天', '3天']:
@@ -610,7 +650,7 @@ class Apilot(Plugin):
         url = "https://dayu.qqsuu.cn/mingxingbagua/apis.php?type=json"
         payload = "format=json"
         headers = {'Content-Type': "application/x-www-form-urlencoded"}
-        bagua_info = self.make_request(url, method="POST", headers=headers, data=payload)
+        bagua_info = self.make_request(url, method="POST", headers=headers, data=payload, cache=DAILY)
         # 验证请求是否成功
         if isinstance(bagua_info, dict) and bagua_info['code'] == 200:
             bagua_pic_url = bagua_info["data"]
@@ -622,13 +662,28 @@ class Apilot(Plugin):
             logger.error(f"错误信息：{bagua_info}")
             return "暂无明星八卦，吃瓜莫急"
 
-    def make_request(self, url, method="GET", headers=None, params=None, data=None, json_data=None, verify_ssl: bool = True, return_raw_content: bool = False):
+    def make_request(self, url, method="GET", headers=None, params=None, data=None, json_data=None, verify_ssl: bool = True, return_raw_content: bool = False, cache=None):
+        """
+        :param cache: 缓存时间段(response_cache.DAILY/HOURLY)，为空时不缓存，只缓存成功的响应
+        """
+        if not cache or not self.cache_enabled:
+            return self._do_request(url, method, headers, params, data, json_data, verify_ssl, return_raw_content)
+        key = ("Apilot", method.upper(), url, _cache_key_part(params), _cache_key_part(data), _cache_key_part(json_data), return_raw_content)
+        return self.response_cache.get_or_fetch(
+            key,
+            lambda: self._do_request(url, method, headers, params, data, json_data, verify_ssl, return_raw_content),
+            expires=cache,
+            cacheable=_is_ok_response,
+            refresh=getattr(self._prefetch_state, "refresh", False),
+        )
+
+    def _do_request(self, url, method, headers, params, data, json_data, verify_ssl, return_raw_content):
         try:
             response = None
             if method.upper() == "GET":
-                response = requests.request(method, url, headers=headers, params=params, verify=verify_ssl)
+                response = get_http_session().request(method, url, headers=headers, params=params, verify=verify_ssl)
             elif method.upper() == "POST":
-                response = requests.request(method, url, headers=headers, data=data, json=json_data, verify=verify_ssl)
+                response = get_http_session().request(method, url, headers=headers, data=data, json=json_data, verify=verify_ssl)
             else:
                 return {"success": False, "message": "Unsupported HTTP method"} # This path might need review if !return_raw_content
             
@@ -663,14 +718,41 @@ class Apilot(Plugin):
             return False
 
     def is_valid_image_url(self, url):
+        if not self.cache_enabled:
+            return self._check_image_url(url)
+        # 只缓存可用的结果，不可用的地址下次仍然重新检查
+        return self.response_cache.get_or_fetch(
+            ("Apilot", "HEAD", url), lambda: self._check_image_url(url), expires=HOURLY, cacheable=bool
+        )
+
+    def _check_image_url(self, url):
         try:
-            response = requests.head(url)  # Using HEAD request to check the URL header
+            response = get_http_session().head(url, timeout=10)  # Using HEAD request to check the URL header
             # If the response status code is 200, the URL exists and is reachable.
             return response.status_code == 200
         except requests.RequestException as e:
             # If there's an exception such as a timeout, connection error, etc., the URL is not valid.
             return False
 
+    def prefetch(self):
+        """在高峰前刷新每日数据的缓存，用户请求时直接命中"""
+        self._prefetch_state.refresh = True
+        try:
+            for command in self.prefetch_commands:
+                if command == "早报":
+                    self.get_morning_news(self.alapi_token, self.morning_news_text_enabled)
+                elif command == "摸鱼":
+                    self.get_moyu_calendar()
+                elif command == "摸鱼视频":
+                    self.get_moyu_calendar_video()
+                elif command == "八卦":
+                    self.get_mx_bagua()
+                else:
+                    logger.warning(f"[Apilot] unsupported prefetch command: {command}")
+            logger.info(f"[Apilot] prefetched {self.prefetch_commands}, cache stats: {self.response_cache.stats()}")
+        finally:
+            self._prefetch_state.refresh = False
+
     def load_city_conditions(self):
         if self.condition_2_and_3_cities is None:
             try:
@@ -2,17 +2,24 @@
 import json
 import os
 import html
+import hashlib
 from urllib.parse import urlparse, quote
 import time
 import re
 import random
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import requests
 import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.async_runtime import get_http_session
+from common.single_flight import SingleFlight
+from config import get_appdata_dir
 from plugins import *
+from .url_cache import UrlCache, normalize_url
 
 # 默认认为requests已安装，因为它是基本依赖
 has_requests = True
@@ -35,6 +42,52 @@ except ImportError:
 # 总体判断是否可以使用高级内容提取方法
 can_use_advanced_extraction = has_bs4 and has_requests
 
+# 合并并发的相同总结请求
+_summary_flight = SingleFlight()
+# 合并并发的相同URL抓取
+_fetch_flight = SingleFlight()
+# 竞速抓取时jina和静态提取并行执行的线程池
+_extract_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="jinasum-extract")
+# 动态渲染共用一个浏览器，在单独的线程中串行执行
+_render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jinasum-render")
+_render_session = None
+
+# 验证码、登录、风控等拦截页面的特征
+BLOCK_PAGE_MARKERS = (
+    "环境异常",
+    "完成验证后即可继续访问",
+    "访问过于频繁",
+    "请在微信客户端打开",
+    "登录后查看",
+    "请先登录",
+    "captcha",
+    "access denied",
+    "please enable javascript",
+)
+
+
+def _get_render_session():
+    """获取渲染线程共用的HTMLSession，浏览器只在第一次渲染时启动"""
+    global _render_session
+    if _render_session is None:
+        # requests_html通过当前线程的事件循环驱动浏览器，渲染线程默认没有事件循环
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        session = HTMLSession()
+        session.loop = loop
+        try:
+            import pyppeteer
+
+            # 非主线程不能注册信号处理，自己启动浏览器并关闭pyppeteer的信号处理
+            session._browser = loop.run_until_complete(
+                pyppeteer.launch(headless=True, args=["--no-sandbox"], handleSIGINT=False, handleSIGTERM=False, handleSIGHUP=False)
+            )
+        except Exception as e:
+            logger.warning(f"[JinaSum] 预先启动浏览器失败，由requests_html自行启动: {e}")
+        _render_session = session
+    return _render_session
+
+
 @plugins.register(
     name="JinaSum",
     desire_priority=20,
@@ -42,6 +95,7 @@ can_use_advanced_extraction = has_bs4 and has_requests
     desc="Sum url link content with jina reader and llm",
     version="1.1.0",
     author="AI assistant",
+    context_types=[ContextType.TEXT, ContextType.SHARING],
 )
 class JinaSum(Plugin):
     """网页内容总结插件
@@ -82,6 +136,15 @@ class JinaSum(Plugin):
         # 缓存和超时设置
         "pending_messages_timeout": 60,  # 分享消息缓存时间（默认 60 秒）
         "content_cache_timeout": 300,  # 总结后提问的缓存时间（默认 5 分钟）
+        "url_cache_ttl": 3600,  # 按URL缓存网页正文和总结的有效期（默认 1 小时）
+        "url_cache_stale_ttl": 86400,  # 过期后仍保留用于条件请求的时间（默认 1 天）
+        "url_cache_max_entries": 500,  # 内存中最多缓存的URL数
+        "url_cache_persist": True,  # 是否把URL缓存写入本地，重启后仍然有效
+
+        # 竞速抓取设置
+        "hedged_extraction": True,  # jina reader和静态提取竞速，取先返回的可用结果
+        "hedge_delay": 3,  # jina多少秒未返回时启动静态提取，0表示同时启动
+        "extract_min_length": 500,  # 提取结果的最小长度，过短视为失败
 
         # 触发词设置
         "qa_trigger": "问",  # 提问触发词
@@ -121,6 +184,12 @@ class JinaSum(Plugin):
             # 每次启动时重置缓存
             self.pending_messages = {}  # 待处理消息缓存
             self.content_cache = {}  # 按 chat_id 缓存总结内容
+            self.url_cache = UrlCache(
+                ttl=self.url_cache_ttl,
+                stale_ttl=self.url_cache_stale_ttl,
+                max_entries=self.url_cache_max_entries,
+                path=os.path.join(get_appdata_dir(), "jinasum_url_cache.db") if self.url_cache_persist else None,
+            )
 
             logger.info(f"[JinaSum] inited, config={self.config}")
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
@@ -291,7 +360,7 @@ class JinaSum(Plugin):
 
             if user_info['is_group']:
                 if should_auto_sum:
-                    return self._process_summary(content, e_context, user_info['chat_id'], retry_count=0)
+                    return self._summarize_in_background(content, e_context, user_info['chat_id'])
                 else:
                     self.pending_messages[user_info['chat_id']] = {
                         "content": content,
@@ -301,7 +370,7 @@ class JinaSum(Plugin):
                     return
             else:  # 单聊消息
                 if should_auto_sum:
-                    return self._process_summary(content, e_context, user_info['chat_id'], retry_count=0)
+                    return self._summarize_in_background(content, e_context, user_info['chat_id'])
                 else:
                     logger.debug(f"[JinaSum] User {user_info['display_name']} not in whitelist, require '总结' to trigger summary")
                     return
@@ -353,11 +422,11 @@ class JinaSum(Plugin):
             custom_prompt, url = self._parse_command(content_for_commands)
             if url or custom_prompt:  # 处理总结指令
                 if url:  # 直接URL总结
-                    return self._process_summary(url, e_context, user_info['chat_id'], custom_prompt=custom_prompt)
+                    return self._summarize_in_background(url, e_context, user_info['chat_id'], custom_prompt=custom_prompt)
                 elif user_info['chat_id'] in self.pending_messages:  # 处理缓存内容
                     cached_content = self.pending_messages[user_info['chat_id']]["content"]
                     del self.pending_messages[user_info['chat_id']]
-                    return self._process_summary(cached_content, e_context, user_info['chat_id'], skip_notice=True, custom_prompt=custom_prompt)
+                    return self._summarize_in_background(cached_content, e_context, user_info['chat_id'], skip_notice=True, custom_prompt=custom_prompt)
                 else:
                     logger.debug("[JinaSum] No content to summarize")
                     return
@@ -394,6 +463,16 @@ class JinaSum(Plugin):
         for k in expired_chat_ids:
             del self.content_cache[k]
 
+    def _summarize_in_background(self, content: str, e_context: EventContext, chat_id: str, **kwargs):
+        """读取网页和调用LLM都很耗时，放到后台执行，完成后再发送总结，不占用消息处理线程"""
+        job_context = EventContext(e_context.event, dict(e_context.econtext))
+
+        def job():
+            self._process_summary(content, job_context, chat_id, **kwargs)
+            return job_context["reply"]
+
+        self.run_in_background(e_context, job)
+
     def _process_summary(self, content: str, e_context: EventContext, chat_id: str, retry_count: int = 0, skip_notice: bool = False, custom_prompt: str = None):
         """处理总结请求
 
@@ -405,6 +484,18 @@ class JinaSum(Plugin):
             skip_notice: 是否跳过提示消息
         """
         try:
+            target_url = html.unescape(content)
+            cache_key = normalize_url(target_url)
+            summary_key = self._get_summary_key(custom_prompt)
+
+            # 同一篇文章已经总结过，直接回复，不再发送等待提示
+            # 只查一次缓存，正文和总结取自同一个条目，避免两次查询之间条目过期或被淘汰
+            entry = self.url_cache.get(cache_key)
+            if entry is not None and self.url_cache.is_fresh(entry) and summary_key in entry["summaries"]:
+                logger.info(f"[JinaSum] Summary cache hit: {cache_key}")
+                self._reply_summary(e_context, chat_id, target_url, entry["content"], entry["summaries"][summary_key])
+                return
+
             if retry_count == 0 and not skip_notice:
                 logger.debug(f"[JinaSum] Processing URL: {content}, chat_id: {chat_id}")
                 reply = Reply(ReplyType.TEXT, "🎉正在为您生成总结，请稍候...")
@@ -412,69 +503,8 @@ class JinaSum(Plugin):
                 channel.send(reply, e_context["context"])
 
             # 获取网页内容
-            target_url = html.unescape(content)
-            jina_url = self._get_jina_url(target_url)
-            logger.debug(f"[JinaSum] Requesting jina url: {jina_url}")
-
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
-            }
             try:
-                response = requests.get(jina_url, headers=headers, timeout=60)
-                response.raise_for_status()
-                target_url_content = response.text
-
-                # 检查是否是微信平台文章，并检查返回内容是否包含"环境异常"
-                if "mp.weixin.qq.com" in target_url:
-                    if not target_url_content or "环境异常" in target_url_content:
-                        logger.error(f"[JinaSum] 微信平台文章内容获取失败或包含'环境异常': {target_url}")
-                        # 尝试使用备用方法获取内容
-                        if can_use_advanced_extraction:
-                            logger.info(f"[JinaSum] 尝试使用通用内容提取方法获取微信文章: {target_url}")
-                            extracted_content = self._extract_content_general(target_url)
-                            if extracted_content and len(extracted_content) > 500 and "环境异常" not in extracted_content:
-                                logger.info(f"[JinaSum] 通用内容提取方法成功获取微信文章: {target_url}, 内容长度: {len(extracted_content)}")
-                                target_url_content = extracted_content
-                            elif has_requests_html:
-                                logger.info(f"[JinaSum] 尝试使用动态内容提取方法获取微信文章: {target_url}")
-                                dynamic_content = self._extract_dynamic_content(target_url)
-                                if dynamic_content and len(dynamic_content) > 500 and "环境异常" not in dynamic_content:
-                                    logger.info(f"[JinaSum] 动态内容提取方法成功获取微信文章: {target_url}, 内容长度: {len(dynamic_content)}")
-                                    target_url_content = dynamic_content
-                                else:
-                                    if not dynamic_content or len(dynamic_content) <= 500:
-                                        logger.warning(f"[JinaSum] 动态内容提取方法获取的微信文章内容过短或为空: {target_url}")
-                                    elif "环境异常" in dynamic_content:
-                                        logger.warning(f"[JinaSum] 动态内容提取方法获取的微信文章内容包含'环境异常': {target_url}")
-                                    raise ValueError("无法获取微信平台文章内容")
-                            else:
-                                raise ValueError("无法获取微信平台文章内容，且未安装高级内容提取所需的库")
-                        else:
-                            raise ValueError("无法获取微信平台文章内容，且未安装高级内容提取所需的库")
-                else:
-                    # 非微信平台文章，只检查内容是否为空
-                    if not target_url_content:
-                        logger.error(f"[JinaSum] 内容获取失败，返回为空: {target_url}")
-                        # 尝试使用备用方法获取内容
-                        if can_use_advanced_extraction:
-                            logger.info(f"[JinaSum] 尝试使用通用内容提取方法: {target_url}")
-                            extracted_content = self._extract_content_general(target_url)
-                            if extracted_content and len(extracted_content) > 500:
-                                logger.info(f"[JinaSum] 通用内容提取方法成功: {target_url}, 内容长度: {len(extracted_content)}")
-                                target_url_content = extracted_content
-                            elif has_requests_html:
-                                logger.info(f"[JinaSum] 尝试使用动态内容提取方法: {target_url}")
-                                dynamic_content = self._extract_dynamic_content(target_url)
-                                if dynamic_content and len(dynamic_content) > 500:
-                                    logger.info(f"[JinaSum] 动态内容提取方法成功: {target_url}, 内容长度: {len(dynamic_content)}")
-                                    target_url_content = dynamic_content
-                                else:
-                                    logger.warning(f"[JinaSum] 动态内容提取方法获取的内容过短或为空: {target_url}")
-                                    raise ValueError("Empty response from all content extraction methods")
-                            else:
-                                raise ValueError("Empty response from jina reader and no advanced extraction methods available")
-                        else:
-                            raise ValueError("Empty response from jina reader")
+                target_url_content = self._get_url_content(target_url, cache_key)
             except Exception as e:
                 logger.error(f"[JinaSum] Failed to get content from jina reader: {str(e)}")
                 if retry_count < 3:
@@ -488,22 +518,13 @@ class JinaSum(Plugin):
                 return
 
             try:
-                # 使用统一的内容处理方法
-                summary = self._process_content_query(target_url_content, custom_prompt, e_context)
-                additional_prompt = "\n\n💬5min内输入j追问+问题，可继续追问"
-                summary += additional_prompt
-                reply = Reply(ReplyType.TEXT, summary)
-                e_context["reply"] = reply
-                e_context.action = EventAction.BREAK_PASS
-
-                # 缓存内容和时间戳，按 chat_id 缓存
-                self.content_cache[chat_id] = {
-                    "url": target_url,
-                    "content": target_url_content,
-                    "timestamp": time.time(),
-                }
-                logger.debug(f"[JinaSum] Content cached for chat_id: {chat_id}")
-
+                # 条件请求确认正文未变化时，可以直接使用之前的总结
+                summary = self.url_cache.get_summary(cache_key, summary_key)
+                if summary is None:
+                    # 使用统一的内容处理方法
+                    summary = self._process_content_query(target_url_content, custom_prompt, e_context)
+                    self.url_cache.put_summary(cache_key, summary_key, target_url_content, summary)
+                self._reply_summary(e_context, chat_id, target_url, target_url_content, summary)
             except Exception as e:
                 logger.error(f"[JinaSum] Failed to get summary from OpenAI: {str(e)}")
                 if retry_count < 3:
@@ -524,6 +545,199 @@ class JinaSum(Plugin):
             e_context["reply"] = reply
             e_context.action = EventAction.BREAK_PASS
 
+    def _get_summary_key(self, custom_prompt: str = None) -> str:
+        """总结缓存的key，同一篇文章使用不同的提示词或模型时分别缓存"""
+        prompt = custom_prompt or self.prompt
+        return hashlib.md5(f"{self.open_ai_model}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def _reply_summary(self, e_context: EventContext, chat_id: str, target_url: str, target_url_content: str, summary: str):
+        additional_prompt = "\n\n💬5min内输入j追问+问题，可继续追问"
+        e_context["reply"] = Reply(ReplyType.TEXT, summary + additional_prompt)
+        e_context.action = EventAction.BREAK_PASS
+
+        # 缓存内容和时间戳，按 chat_id 缓存
+        self.content_cache[chat_id] = {
+            "url": target_url,
+            "content": target_url_content,
+            "timestamp": time.time(),
+        }
+        logger.debug(f"[JinaSum] Content cached for chat_id: {chat_id}")
+
+    def _get_url_content(self, target_url: str, cache_key: str) -> str:
+        """获取网页正文，优先使用URL缓存，同一URL的并发请求只抓取一次"""
+        entry = self.url_cache.get(cache_key)
+        if entry is not None and self.url_cache.is_fresh(entry):
+            logger.debug(f"[JinaSum] Content cache hit: {cache_key}")
+            return entry["content"]
+        target_url_content, shared = _fetch_flight.do(cache_key, self._fetch_url_content, target_url, cache_key)
+        if shared:
+            logger.debug(f"[JinaSum] Reused in-flight fetch result: {cache_key}")
+        return target_url_content
+
+    def _fetch_jina(self, target_url: str, entry: dict = None):
+        """通过jina reader抓取网页正文
+
+        Returns:
+            tuple: (正文, ETag, Last-Modified)，条件请求返回304时正文为None
+        """
+        jina_url = self._get_jina_url(target_url)
+        logger.debug(f"[JinaSum] Requesting jina url: {jina_url}")
+
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
+        }
+        # 缓存已过期但还在保留期内，带上校验信息做条件请求
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = get_http_session().get(jina_url, headers=headers, timeout=60)
+        if response.status_code == 304 and entry is not None:
+            return None, None, None
+        response.raise_for_status()
+        return response.text, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+    def _is_good_content(self, content: str) -> bool:
+        """检查提取结果是否可用：长度足够，且不是验证码、登录等拦截页面"""
+        if not content or len(content.strip()) < self.extract_min_length:
+            return False
+        # 拦截页面通常很短，只检查开头部分
+        head = content[:2000].lower()
+        return not any(marker in head for marker in BLOCK_PAGE_MARKERS)
+
+    def _hedged_fetch(self, target_url: str, entry: dict = None):
+        """jina reader和静态提取竞速，第一个通过质量检查的结果胜出，都失败时才使用动态渲染
+
+        静态提取在jina失败或等待超过hedge_delay秒后启动，hedge_delay为0时同时启动
+
+        Returns:
+            tuple: (正文, ETag, Last-Modified)，条件请求返回304时正文为None
+        """
+        start = time.monotonic()
+        pending = {_extract_pool.submit(self._fetch_jina, target_url, entry): "jina"}
+        static_started = False
+        errors = []
+        while True:
+            if not static_started and (not pending or time.monotonic() - start >= self.hedge_delay):
+                logger.debug(f"[JinaSum] Starting static extraction for {target_url}")
+                pending[_extract_pool.submit(self._extract_static_content, target_url, None, False)] = "static"
+                static_started = True
+            if not pending:
+                break
+            timeout = None if static_started else max(0, start + self.hedge_delay - time.monotonic())
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+                    continue
+                if name == "jina":
+                    content, etag, last_modified = result
+                    if content is None:
+                        return result  # 304，正文未变化
+                else:
+                    content, etag, last_modified = result, None, None
+                if self._is_good_content(content):
+                    logger.info(f"[JinaSum] {name} extraction won in {time.monotonic() - start:.2f}s: {target_url}")
+                    # 线程中的请求无法中断，未完成的任务结果直接丢弃
+                    for other in pending:
+                        other.cancel()
+                    return content, etag, last_modified
+                errors.append(f"{name}: 内容过短或为拦截页面")
+
+        if has_requests_html:
+            logger.info(f"[JinaSum] jina和静态提取都失败({'; '.join(errors)})，尝试动态渲染: {target_url}")
+            content = self._extract_dynamic_content(target_url)
+            if self._is_good_content(content):
+                return content, None, None
+            errors.append("dynamic: 内容过短或为拦截页面")
+        raise ValueError(f"无法获取该网页内容: {'; '.join(errors)}")
+
+    def _fetch_url_content(self, target_url: str, cache_key: str) -> str:
+        """抓取网页正文，结果写入URL缓存"""
+        entry = self.url_cache.get(cache_key)
+        if self.hedged_extraction and has_bs4:
+            target_url_content, etag, last_modified = self._hedged_fetch(target_url, entry)
+        else:
+            target_url_content, etag, last_modified = self._sequential_fetch(target_url, entry)
+        if target_url_content is None:
+            logger.debug(f"[JinaSum] Content not modified: {cache_key}")
+            self.url_cache.revalidate(cache_key)
+            return entry["content"]
+        self.url_cache.put_content(cache_key, target_url, target_url_content, etag, last_modified)
+        return target_url_content
+
+    def _sequential_fetch(self, target_url: str, entry: dict = None):
+        """先用jina reader抓取，失败时依次使用静态提取和动态渲染
+
+        Returns:
+            tuple: (正文, ETag, Last-Modified)，条件请求返回304时正文为None
+        """
+        target_url_content, etag, last_modified = self._fetch_jina(target_url, entry)
+        if target_url_content is None:
+            return None, None, None
+        jina_content = target_url_content
+
+        # 检查是否是微信平台文章，并检查返回内容是否包含"环境异常"
+        if "mp.weixin.qq.com" in target_url:
+            if not target_url_content or "环境异常" in target_url_content:
+                logger.error(f"[JinaSum] 微信平台文章内容获取失败或包含'环境异常': {target_url}")
+                # 尝试使用备用方法获取内容
+                if can_use_advanced_extraction:
+                    logger.info(f"[JinaSum] 尝试使用通用内容提取方法获取微信文章: {target_url}")
+                    extracted_content = self._extract_content_general(target_url)
+                    if extracted_content and len(extracted_content) > 500 and "环境异常" not in extracted_content:
+                        logger.info(f"[JinaSum] 通用内容提取方法成功获取微信文章: {target_url}, 内容长度: {len(extracted_content)}")
+                        target_url_content = extracted_content
+                    elif has_requests_html:
+                        logger.info(f"[JinaSum] 尝试使用动态内容提取方法获取微信文章: {target_url}")
+                        dynamic_content = self._extract_dynamic_content(target_url)
+                        if dynamic_content and len(dynamic_content) > 500 and "环境异常" not in dynamic_content:
+                            logger.info(f"[JinaSum] 动态内容提取方法成功获取微信文章: {target_url}, 内容长度: {len(dynamic_content)}")
+                            target_url_content = dynamic_content
+                        else:
+                            if not dynamic_content or len(dynamic_content) <= 500:
+                                logger.warning(f"[JinaSum] 动态内容提取方法获取的微信文章内容过短或为空: {target_url}")
+                            elif "环境异常" in dynamic_content:
+                                logger.warning(f"[JinaSum] 动态内容提取方法获取的微信文章内容包含'环境异常': {target_url}")
+                            raise ValueError("无法获取微信平台文章内容")
+                    else:
+                        raise ValueError("无法获取微信平台文章内容，且未安装高级内容提取所需的库")
+                else:
+                    raise ValueError("无法获取微信平台文章内容，且未安装高级内容提取所需的库")
+        else:
+            # 非微信平台文章，只检查内容是否为空
+            if not target_url_content:
+                logger.error(f"[JinaSum] 内容获取失败，返回为空: {target_url}")
+                # 尝试使用备用方法获取内容
+                if can_use_advanced_extraction:
+                    logger.info(f"[JinaSum] 尝试使用通用内容提取方法: {target_url}")
+                    extracted_content = self._extract_content_general(target_url)
+                    if extracted_content and len(extracted_content) > 500:
+                        logger.info(f"[JinaSum] 通用内容提取方法成功: {target_url}, 内容长度: {len(extracted_content)}")
+                        target_url_content = extracted_content
+                    elif has_requests_html:
+                        logger.info(f"[JinaSum] 尝试使用动态内容提取方法: {target_url}")
+                        dynamic_content = self._extract_dynamic_content(target_url)
+                        if dynamic_content and len(dynamic_content) > 500:
+                            logger.info(f"[JinaSum] 动态内容提取方法成功: {target_url}, 内容长度: {len(dynamic_content)}")
+                            target_url_content = dynamic_content
+                        else:
+                            logger.warning(f"[JinaSum] 动态内容提取方法获取的内容过短或为空: {target_url}")
+                            raise ValueError("Empty response from all content extraction methods")
+                    else:
+                        raise ValueError("Empty response from jina reader and no advanced extraction methods available")
+                else:
+                    raise ValueError("Empty response from jina reader")
+
+        if target_url_content != jina_content:
+            etag = last_modified = None  # 备用方法获取的正文，jina返回的校验信息不再适用
+        return target_url_content, etag, last_modified
+
     def _process_question(self, question: str, chat_id: str, e_context: EventContext, retry_count: int = 0):
         """处理问题"""
         try:
@@ -740,13 +954,53 @@ class JinaSum(Plugin):
             logger.error("[JinaSum] BeautifulSoup库未安装，无法使用通用内容提取方法")
             return None
 
+        # 如果没有提供headers，创建一个默认的
+        if not headers:
+            headers = self._get_default_headers()
+
+        static_content_result = self._extract_static_content(url, headers)
+
+        # 判断静态提取的内容质量
+        content_is_good = False
+        if static_content_result:
+            # 内容长度检查
+            if len(static_content_result) > 1000:
+                content_is_good = True
+            # 结构检查 - 至少应该有多个段落
+            elif static_content_result.count('\n\n') >= 3:
+                content_is_good = True
+
+        # 如果静态提取内容质量不佳，尝试动态提取
+        if not content_is_good:
+            logger.debug("[JinaSum] 静态提取内容质量不佳，尝试动态提取")
+            dynamic_content = self._extract_dynamic_content(url, headers)
+            if dynamic_content:
+                logger.debug(f"[JinaSum] 动态提取成功，内容长度: {len(dynamic_content)}")
+                return dynamic_content
+
+        return static_content_result
+
+    def _extract_static_content(self, url, headers=None, delay=True):
+        """请求原始网页并用BeautifulSoup提取正文
+
+        Args:
+            url: 网页URL
+            headers: 可选的请求头，如果为None则使用默认
+            delay: 是否在请求前随机延迟，与其他提取方法并行竞速时不需要
+
+        Returns:
+            str: 提取的内容，失败返回None
+        """
+        if not has_bs4:
+            return None
+
         try:
-            # 如果没有提供headers，创建一个默认的
             if not headers:
                 headers = self._get_default_headers()
 
             # 添加随机延迟以避免被检测为爬虫
-            time.sleep(random.uniform(0.5, 2))
+            if delay:
+                time.sleep(random.uniform(0.5, 2))
 
             # 创建会话对象
             session = requests.Session()
@@ -894,24 +1148,6 @@ class JinaSum(Plugin):
                 logger.debug(f"[JinaSum] 通用提取方法成功，提取内容长度: {len(result)}")
                 static_content_result = result
 
-            # 判断静态提取的内容质量
-            content_is_good = False
-            if static_content_result:
-                # 内容长度检查
-                if len(static_content_result) > 1000:
-                    content_is_good = True
-                # 结构检查 - 至少应该有多个段落
-                elif static_content_result.count('\n\n') >= 3:
-                    content_is_good = True
-
-            # 如果静态提取内容质量不佳，尝试动态提取
-            if not content_is_good:
-                logger.debug("[JinaSum] 静态提取内容质量不佳，尝试动态提取")
-                dynamic_content = self._extract_dynamic_content(url, headers)
-                if dynamic_content:
-                    logger.debug(f"[JinaSum] 动态提取成功，内容长度: {len(dynamic_content)}")
-                    return dynamic_content
-
             return static_content_result
 
         except Exception as e:
@@ -932,11 +1168,19 @@ class JinaSum(Plugin):
             logger.error("[JinaSum] requests_html库未安装，无法使用动态内容提取方法")
             return None
 
+        # 渲染在专用线程中串行执行，共用同一个浏览器实例
+        try:
+            return _render_pool.submit(self._render_dynamic_content, url, headers).result(timeout=90)
+        except Exception as e:
+            logger.error(f"[JinaSum] 动态提取失败: {str(e)}")
+            return None
+
+    def _render_dynamic_content(self, url, headers=None):
+        """在渲染线程中执行，使用共享的HTMLSession和浏览器"""
         try:
             logger.debug(f"[JinaSum] 开始动态提取内容: {url}")
 
-            # 创建会话并设置超时
-            session = HTMLSession()
+            session = _get_render_session()
 
             # 添加请求头
             req_headers = headers or self._get_default_headers()
@@ -1021,14 +1265,8 @@ class JinaSum(Plugin):
                     result += f"标题: {title}\n\n"
                 result += content_text
 
-                # 关闭会话
-                session.close()
-
                 return result
 
-            # 关闭会话
-            session.close()
-
             return None
 
         except Exception as e:
@@ -1154,24 +1392,32 @@ class JinaSum(Plugin):
                 # 使用默认总结模板
                 prompt = f"{self.prompt}\n\n'''{content}'''"
 
-            # 准备API请求
-            openai_payload = {
-                "model": self.open_ai_model,
-                "messages": [{"role": "user", "content": prompt}],
-            }
-
-            # 调用API
-            openai_chat_url = self._get_openai_chat_url()
-            openai_headers = self._get_openai_headers()
-            response = requests.post(
-                openai_chat_url, headers=openai_headers, json=openai_payload, timeout=60
-            )
-            response.raise_for_status()
-
-            # 获取回答
-            answer = response.json()["choices"][0]["message"]["content"]
+            # 同一篇文章被同时分享到多个群时，只调用一次API
+            flight_key = ("jinasum", self._get_openai_chat_url(), self.open_ai_model, hashlib.md5(prompt.encode("utf-8")).hexdigest())
+            answer, shared = _summary_flight.do(flight_key, self._call_openai_chat, prompt)
+            if shared:
+                logger.debug("[JinaSum] Reused in-flight content query result")
             return answer
 
         except Exception as e:
             logger.error(f"[JinaSum] Error in processing content query: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def _call_openai_chat(self, prompt: str) -> str:
+        """调用OpenAI兼容接口获取回答"""
+        # 准备API请求
+        openai_payload = {
+            "model": self.open_ai_model,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+        # 调用API
+        openai_chat_url = self._get_openai_chat_url()
+        openai_headers = self._get_openai_headers()
+        response = requests.post(
+            openai_chat_url, headers=openai_headers, json=openai_payload, timeout=60
+        )
+        response.raise_for_status()
+
+        # 获取回答
+        return response.json()["choices"][0]["message"]["content"]
@@ -0,0 +1,194 @@
+# encoding:utf-8
+"""
+按规范化URL缓存网页正文和总结结果：
+1. 同一篇文章分享到多个群时，直接复用已抓取的正文和已生成的总结
+2. 缓存过期后带上ETag/Last-Modified做条件请求，内容没有变化时继续使用原来的正文和总结
+3. 可选写入本地SQLite，重启后缓存仍然有效
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from common.log import logger
+
+# 微信公众号文章由这几个参数唯一确定，其余参数都是分享来源、场景、校验等跟踪信息
+WEIXIN_ARTICLE_PARAMS = frozenset(["__biz", "mid", "idx", "sn"])
+# 其他网站只去掉常见的广告跟踪参数，避免误删影响页面内容的参数
+TRACKING_PARAMS = frozenset(["spm", "fbclid", "gclid", "mc_cid", "mc_eid", "share_token"])
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+
+def normalize_url(url):
+    """规范化URL作为缓存key：统一大小写、去掉锚点、默认端口和跟踪参数，参数排序"""
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "http").lower()
+    host = parts.netloc.lower()
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and host.endswith(default_port):
+        host = host[: -len(default_port)]
+    path = parts.path or "/"
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    if host == "mp.weixin.qq.com":
+        scheme = "https"
+        if path.startswith("/s/"):
+            params = []  # 短链接 /s/xxxx 本身就是文章ID
+        else:
+            params = [(k, v) for k, v in params if k in WEIXIN_ARTICLE_PARAMS]
+    else:
+        params = [(k, v) for k, v in params if not k.startswith("utm_") and k not in TRACKING_PARAMS]
+    params.sort()
+    return urlunsplit((scheme, host, path, urlencode(params), ""))
+
+
+def content_digest(content):
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+class UrlCache(object):
+    """
+    :param ttl: 正文缓存有效期(秒)，有效期内直接使用缓存，不发任何请求
+    :param stale_ttl: 过期缓存最多保留多久(秒)，保留期间用条件请求重新验证
+    :param max_entries: 内存中最多缓存多少个URL，按LRU淘汰
+    :param path: SQLite文件路径，为空时只缓存在内存中
+    """
+
+    def __init__(self, ttl=3600, stale_ttl=86400, max_entries=500, path=None):
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> entry
+        self._lock = threading.RLock()
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS url_cache (key TEXT PRIMARY KEY, data TEXT, fetched_at REAL)")
+                self._db.execute("DELETE FROM url_cache WHERE fetched_at < ?", (time.time() - self.stale_ttl,))
+                self._db.commit()
+            except Exception as e:
+                logger.warning(f"[JinaSum] url cache persistence disabled: {e}")
+                self._db = None
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute("SELECT data FROM url_cache WHERE key=?", (key,)).fetchone()
+            return json.loads(row[0]) if row is not None else None
+        except Exception as e:
+            logger.warning(f"[JinaSum] failed to load url cache {key}: {e}")
+            return None
+
+    def _save(self, key, entry):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO url_cache (key, data, fetched_at) VALUES (?, ?, ?)",
+                (key, json.dumps(entry, ensure_ascii=False), entry["fetched_at"]),
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.warning(f"[JinaSum] failed to save url cache {key}: {e}")
+
+    def _delete(self, key):
+        self._data.pop(key, None)
+        if self._db is None:
+            return
+        try:
+            self._db.execute("DELETE FROM url_cache WHERE key=?", (key,))
+            self._db.commit()
+        except Exception as e:
+            logger.warning(f"[JinaSum] failed to delete url cache {key}: {e}")
+
+    def _entry(self, key):
+        """内存中没有时从SQLite加载，不检查是否过期"""
+        entry = self._data.get(key)
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None:
+                self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while self.max_entries and len(self._data) > self.max_entries:
+            self._data.popitem(last=False)  # 只从内存淘汰，SQLite中的记录仍可重新加载
+
+    def _store(self, key, entry):
+        self._remember(key, entry)
+        self._save(key, entry)
+
+    def is_fresh(self, entry):
+        return time.time() - entry["fetched_at"] <= self.ttl
+
+    def get(self, key):
+        """返回缓存条目(可能已过期，需要用is_fresh判断)，超过保留期或不存在时返回None"""
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry["fetched_at"] > self.stale_ttl:
+                self._delete(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put_content(self, key, url, content, etag=None, last_modified=None):
+        """保存抓取到的正文，正文变化时清空之前的总结"""
+        digest = content_digest(content)
+        with self._lock:
+            old = self._data.get(key) or self._load(key)
+            summaries = old["summaries"] if old and old.get("digest") == digest else {}
+            self._store(key, {
+                "url": url,
+                "content": content,
+                "digest": digest,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": time.time(),
+                "summaries": summaries,
+            })
+
+    def revalidate(self, key):
+        """条件请求返回304，刷新缓存时间，条目已从内存淘汰时从SQLite加载"""
+        with self._lock:
+            entry = self._entry(key)
+            if entry is not None:
+                entry["fetched_at"] = time.time()
+                self.revalidated += 1
+                self._save(key, entry)
+
+    def get_summary(self, key, summary_key):
+        """返回未过期正文对应的总结"""
+        with self._lock:
+            entry = self.get(key)
+            if entry is None or not self.is_fresh(entry):
+                return None
+            return entry["summaries"].get(summary_key)
+
+    def put_summary(self, key, summary_key, content, summary):
+        """保存总结，正文已经被更新时丢弃"""
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None or entry["digest"] != content_digest(content):
+                return
+            entry["summaries"][summary_key] = summary
+            self._save(key, entry)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "revalidated": self.revalidated}
@@ -12,13 +12,40 @@ import json
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from channel.chat_message import ChatMessage
+from common.async_runtime import get_http_session
 from common.log import logger
+from common.response_cache import DAILY, HOURLY, get_response_cache
 from common.tmp_dir import TmpDir
 from plugins import *
 from config import conf
 from io import BytesIO  # 确保导入BytesIO，如果需要的话
 from PIL import Image
 
+
+class CachedResponse(object):
+    """缓存的响应，只保留插件用到的字段"""
+
+    __slots__ = ("status_code", "headers", "url", "content", "encoding")
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = requests.structures.CaseInsensitiveDict(response.headers)
+        self.url = response.url
+        self.content = response.content
+        self.encoding = response.encoding or "utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
 @plugins.register(
     name="NiceAPI",
     desire_priority=600,
@@ -26,12 +53,17 @@ from PIL import Image
     desc="一个输入关键词就能返回随机图片和视频的插件，支持王者英雄语音",
     version="0.2",
     author="Lingyuzhou",
+    context_types=[ContextType.TEXT],
 )
 class NiceAPI(Plugin):
     def __init__(self):
         super().__init__()
         self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
         self.config = self.load_config()
+        # 大部分接口每次返回随机内容，只缓存结果固定的请求(英雄语音列表、表情合成、图片下载)
+        # 以及cache_keywords中配置的关键词
+        self.response_cache = get_response_cache()
+        self.cache_keywords = set(self.config.get("cache_keywords", []))
         logger.info("[NiceAPI] inited.")
 
     def load_config(self):
@@ -50,11 +82,25 @@ class NiceAPI(Plugin):
             logger.error(f"[NiceAPI] Error loading config: {e}")
             return {"api_mapping": {}}
 
-    def call_api(self, url, params=None):
+    def _get(self, url, params=None, cache=None):
+        """
+        GET请求，cache为缓存时间段(DAILY/HOURLY)时返回缓存的响应，只缓存状态码为200的响应
+        """
+        if not cache:
+            return get_http_session().get(url, params=params)
+        key = ("NiceAPI", url, json.dumps(params, sort_keys=True, ensure_ascii=False) if params else None)
+        return self.response_cache.get_or_fetch(
+            key,
+            lambda: CachedResponse(get_http_session().get(url, params=params)),
+            expires=cache,
+            cacheable=lambda response: response.status_code == 200,
+        )
+
+    def call_api(self, url, params=None, cache=None):
         try:
-            response = requests.get(url, params=params)
+            response = self._get(url, params=params, cache=cache)
             if response.status_code == 200:
-                content_type = response.headers.get('Content-Type')
+                content_type = response.headers.get('Content-Type', '')
                 if 'audio/mpeg' in content_type or url.endswith('.mp3'):
                     logger.debug("Audio content detected")
                     # 保存音频文件到临时目录
@@ -89,7 +135,7 @@ class NiceAPI(Plugin):
                         voice_url = voice_item.get('voice')
                         if voice_url:
                             # 下载并保存语音文件
-                            voice_response = requests.get(voice_url)
+                            voice_response = self._get(voice_url, cache=cache)
                             if voice_response.status_code == 200:
                                 tmp_dir = TmpDir().path()
                                 timestamp = int(time.time())
@@ -144,7 +190,8 @@ class NiceAPI(Plugin):
             if hero_name:
                 url = api_mapping.get("王者")
                 if url:
-                    reply = self.call_api(url, params={"msg": hero_name})
+                    # 英雄语音列表是固定的，缓存列表和下载的语音，每次仍然随机选择一条
+                    reply = self.call_api(url, params={"msg": hero_name}, cache=DAILY)
                     if reply and "voice" in reply:
                         e_context["reply"] = self.create_reply(ReplyType.VOICE, reply["voice"])
                         e_context.action = EventAction.BREAK_PASS
@@ -181,7 +228,7 @@ class NiceAPI(Plugin):
             try:
                 # 构建完整的API URL
                 full_url = f"{url}?type=text&emoji1={emoji1}&emoji2={emoji2}"
-                response = requests.get(full_url)
+                response = self._get(full_url, cache=DAILY)
                 
                 if response.status_code != 200:
                     error_msg = f"表情合成失败，错误码：{response.status_code}"
@@ -206,7 +253,7 @@ class NiceAPI(Plugin):
                    (text_content.startswith('http://') or text_content.startswith('https://')):                    
                     # 下载并处理图片
                     try:
-                        image_response = requests.get(text_content)
+                        image_response = self._get(text_content, cache=DAILY)
                         image_response.raise_for_status()
                         
                         # 使用PIL处理图片
@@ -254,7 +301,7 @@ class NiceAPI(Plugin):
         # 检查内容是否包含任意关键词
         for keyword, url in api_mapping.items():
             if keyword in content:
-                reply = self.call_api(url)
+                reply = self.call_api(url, cache=HOURLY if keyword in self.cache_keywords else None)
                 if reply:
                     if "image" in reply:
                         e_context["reply"] = self.create_reply(ReplyType.IMAGE_URL, reply["image"])  # 创建图片回复
@@ -265,14 +312,28 @@ class NiceAPI(Plugin):
                     e_context.action = EventAction.BREAK_PASS
                     break  # 找到第一个匹配的关键词后就退出循环
 
-    def get_video_url(self, url):
+    def get_triggers(self):
+        # 关键词来自配置中的api_mapping
+        triggers = dict(super().get_triggers() or {})
+        triggers["prefixes"] = ["王者 ", "表情合成 "]
+        triggers["keywords"] = list(self.config.get("api_mapping", {}).keys())
+        return triggers
+
+    def get_video_url(self, url, cache=None):
+        """解析视频的最终地址，随机视频接口不能缓存，需要缓存时传入cache时间段"""
+        if cache:
+            return self.response_cache.get_or_fetch(("NiceAPI", "video", url), lambda: self._resolve_video_url(url), expires=cache)
+        return self._resolve_video_url(url)
+
+    def _resolve_video_url(self, url):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            content_type = response.headers.get('Content-Type')
-            if 'video' in content_type:
-                logger.debug("Video content detected")
-                return response.url
+            # 只需要响应头和最终地址，不下载视频内容
+            with get_http_session().get(url, stream=True) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type')
+                if 'video' in content_type:
+                    logger.debug("Video content detected")
+                    return response.url
             return None
         except requests.exceptions.RequestException as e:
             logger.error(f"Request failed: {e}")
@@ -281,9 +342,10 @@ class NiceAPI(Plugin):
     def is_valid_url(self, url):
         return url.startswith("http://") or url.startswith("https://")
 
-    def download_image(self, image_url):
+    def download_image(self, image_url, cache=None):
+        """下载图片，随机图片接口不能缓存，只有同一地址总是返回同一张图片时才传入cache时间段"""
         try:
-            response = requests.get(image_url)
+            response = self._get(image_url, cache=cache)
             response.raise_for_status()
             image_data = BytesIO(response.content)
             logger.info("Image downloaded successfully")
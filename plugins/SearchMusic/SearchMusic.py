@@ -7,11 +7,23 @@ import time
 import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common.async_runtime import get_http_session
 from common.log import logger
 from common.tmp_dir import TmpDir
 from plugins import *
 import random
 import urllib.parse
+from .search_engine import MusicSearchEngine
+
+# 全网点歌时并发搜索的平台，按显示顺序排列
+SEARCH_PLATFORMS = [("kugou", "酷狗"), ("netease", "网易"), ("qishui", "汽水"), ("kuwo", "酷我")]
+# 各平台的歌曲列表搜索接口，与各平台点歌命令使用的接口相同
+SEARCH_LIST_URLS = {
+    "kugou": "https://www.hhlqilongzhu.cn/api/dg_kgmusic.php?gm={song_name}&n=",
+    "netease": "https://www.hhlqilongzhu.cn/api/dg_wyymusic.php?gm={song_name}&n=&num=20",
+    "qishui": "https://hhlqilongzhu.cn/api/dg_qishuimusic.php?msg={song_name}",
+    "kuwo": "https://hhlqilongzhu.cn/api/dg_kuwomusic.php?msg={song_name}",
+}
 
 @plugins.register(
     name="SearchMusic",
@@ -19,11 +31,15 @@ import urllib.parse
     desc="输入关键词'点歌 歌曲名称'即可获取对应歌曲详情和播放链接",
     version="3.0",
     author="Lingyuzhou",
+    context_types=[ContextType.TEXT],
+    prefixes=["全网点歌 ", "酷狗点歌 ", "网易点歌 ", "汽水点歌 ", "酷我点歌 ", "酷狗听歌 ", "网易听歌 ", "汽水听歌 ", "酷我听歌 ", "酷狗MV "],
+    keywords=["随机点歌", "随机听歌"],
 )
 class SearchMusic(Plugin):
     def __init__(self):
         super().__init__()
         self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+        self.engine = MusicSearchEngine()
         logger.info("[SearchMusic] inited.")
 
     def construct_music_appmsg(self, title, singer, url, thumb_url="", platform=""):
@@ -106,7 +122,7 @@ class SearchMusic(Plugin):
 
     def get_music_cover(self, platform, detail_url, song_name="", singer=""):
         """
-        尝试获取歌曲封面图片URL
+        尝试获取歌曲封面图片URL，多个来源并发查询，取最先返回的结果
         :param platform: 平台名称（kugou, netease, qishui, kuwo等）
         :param detail_url: 详情页URL（可选）
         :param song_name: 歌曲名称（可选，用于备用搜索）
@@ -114,108 +130,94 @@ class SearchMusic(Plugin):
         :return: 封面图片URL
         """
         default_cover = "https://p2.music.126.net/tGHU62DTszbFQ37W9qPHcw==/2002210674180197.jpg"
-        
-        try:
-            # 根据平台选择不同的获取方式
-            if platform == "kugou":
-                # 尝试从酷狗音乐详情页获取封面
-                try:
-                    if detail_url:
-                        response = requests.get(detail_url, timeout=10)
-                        # 使用正则表达式提取封面URL
-                        cover_pattern = r'<img.*?src="(https?://.*?\.jpg)".*?>'
-                        match = re.search(cover_pattern, response.text)
-                        if match:
-                            cover_url = match.group(1)
-                            logger.info(f"[SearchMusic] 从酷狗音乐详情页提取到封面: {cover_url}")
-                            return cover_url
-                except Exception as e:
-                    logger.error(f"[SearchMusic] 从酷狗音乐详情页获取封面时出错: {e}")
-                
-                # 如果从详情页获取失败，尝试使用备用方法
-                if song_name and singer:
-                    try:
-                        # 使用备用API
-                        backup_url = f"https://mobilecdn.kugou.com/api/v3/search/song?keyword={song_name}%20{singer}&page=1&pagesize=1"
-                        response = requests.get(backup_url, timeout=10)
-                        data = response.json()
-                        if data["status"] == 1 and data["data"]["total"] > 0:
-                            song_info = data["data"]["info"][0]
-                            hash_value = song_info["hash"]
-                            album_id = song_info.get("album_id", "")
-                            if album_id:
-                                cover_url = f"https://imge.kugou.com/stdmusic/{album_id}.jpg"
-                                logger.info(f"[SearchMusic] 使用酷狗音乐API获取到封面: {cover_url}")
-                                return cover_url
-                    except Exception as e:
-                        logger.error(f"[SearchMusic] 使用酷狗音乐API获取封面时出错: {e}")
-            
-            elif platform == "qishui":
-                # 汽水音乐封面已在API响应中提供，这里不需要额外处理
-                # 如果需要备用方法，可以在这里添加
-                pass
-                
-            elif platform == "kuwo":
-                # 尝试从酷我音乐API获取封面
-                try:
-                    if song_name and singer:
-                        # 使用酷我音乐API搜索歌曲
-                        search_url = f"https://api.suyanw.cn/api/kw.php?msg={song_name}"
-                        response = requests.get(search_url, timeout=10)
-                        data = json.loads(response.text)
-                        if "data" in data and isinstance(data["data"], list) and len(data["data"]) > 0:
-                            # 查找匹配的歌曲
-                            for song in data["data"]:
-                                if "singer" in song and singer.lower() in song["singer"].lower():
-                                    if "pic" in song and song["pic"]:
-                                        cover_url = song["pic"]
-                                        logger.info(f"[SearchMusic] 使用酷我音乐API获取到封面: {cover_url}")
-                                        return cover_url
-                                    break
-                except Exception as e:
-                    logger.error(f"[SearchMusic] 使用酷我音乐API获取封面时出错: {e}")
-            
-            elif platform == "netease":
-                # 尝试从网易云音乐API获取封面
-                try:
-                    if song_name and singer:
-                        # 使用网易云音乐API搜索歌曲
-                        search_url = f"https://music.163.com/api/search/get/web?csrf_token=hlpretag=&hlposttag=&s={song_name}&type=1&offset=0&total=true&limit=1"
-                        response = requests.get(search_url, timeout=10)
-                        data = response.json()
-                        if "result" in data and "songs" in data["result"] and len(data["result"]["songs"]) > 0:
-                            song_info = data["result"]["songs"][0]
-                            if "al" in song_info and "picUrl" in song_info["al"]:
-                                cover_url = song_info["al"]["picUrl"]
-                                logger.info(f"[SearchMusic] 使用网易云音乐API获取到封面: {cover_url}")
-                                return cover_url
-                except Exception as e:
-                    logger.error(f"[SearchMusic] 使用网易云音乐API获取封面时出错: {e}")
-            
-            # 对于其他平台，尝试使用歌曲名称和歌手名称搜索封面
+
+        cache_key = (platform, detail_url, song_name, singer)
+        cover_url = self.engine.covers.get(cache_key)
+        if cover_url:
+            return cover_url
+
+        # 根据平台选择不同的获取方式，汽水音乐封面已在API响应中提供
+        sources = []
+        if platform == "kugou":
+            if detail_url:
+                sources.append(lambda: self._kugou_cover_from_detail(detail_url))
             if song_name and singer:
-                # 尝试使用QQ音乐搜索API获取封面
-                try:
-                    search_url = f"https://c.y.qq.com/soso/fcgi-bin/client_search_cp?w={urllib.parse.quote(f'{song_name} {singer}')}&format=json&p=1&n=1"
-                    response = requests.get(search_url, timeout=10)
-                    if response.status_code == 200:
-                        data = json.loads(response.text)
-                        if "data" in data and "song" in data["data"] and "list" in data["data"]["song"] and data["data"]["song"]["list"]:
-                            song_info = data["data"]["song"]["list"][0]
-                            if "albummid" in song_info:
-                                albummid = song_info["albummid"]
-                                cover_url = f"https://y.gtimg.cn/music/photo_new/T002R300x300M000{albummid}.jpg"
-                                logger.info(f"[SearchMusic] 使用QQ音乐API获取到封面: {cover_url}")
-                                return cover_url
-                except Exception as e:
-                    logger.error(f"[SearchMusic] 使用QQ音乐API获取封面时出错: {e}")
-            
+                sources.append(lambda: self._kugou_cover_from_api(song_name, singer))
+        elif platform == "kuwo" and song_name and singer:
+            sources.append(lambda: self._kuwo_cover(song_name, singer))
+        elif platform == "netease" and song_name and singer:
+            sources.append(lambda: self._netease_cover(song_name))
+        # 对于所有平台，同时尝试使用歌曲名称和歌手名称在QQ音乐搜索封面
+        if song_name and singer:
+            sources.append(lambda: self._qq_cover(song_name, singer))
+
+        cover_url = self.engine.first_good(sources)
+        if not cover_url:
             logger.warning(f"[SearchMusic] 无法获取封面图片，使用默认封面: {song_name} - {singer}")
             return default_cover
-            
-        except Exception as e:
-            logger.error(f"[SearchMusic] 获取封面图片时出错: {e}")
-            return default_cover
+        self.engine.covers[cache_key] = cover_url
+        return cover_url
+
+    def _kugou_cover_from_detail(self, detail_url):
+        """从酷狗音乐详情页获取封面"""
+        response = self.engine.fetch(detail_url)
+        # 使用正则表达式提取封面URL
+        match = re.search(r'<img.*?src="(https?://.*?\.jpg)".*?>', response.text)
+        if match:
+            logger.info(f"[SearchMusic] 从酷狗音乐详情页提取到封面: {match.group(1)}")
+            return match.group(1)
+        return None
+
+    def _kugou_cover_from_api(self, song_name, singer):
+        """使用酷狗音乐搜索API获取封面"""
+        backup_url = f"https://mobilecdn.kugou.com/api/v3/search/song?keyword={song_name}%20{singer}&page=1&pagesize=1"
+        data = self.engine.fetch(backup_url).json()
+        if data["status"] == 1 and data["data"]["total"] > 0:
+            album_id = data["data"]["info"][0].get("album_id", "")
+            if album_id:
+                cover_url = f"https://imge.kugou.com/stdmusic/{album_id}.jpg"
+                logger.info(f"[SearchMusic] 使用酷狗音乐API获取到封面: {cover_url}")
+                return cover_url
+        return None
+
+    def _kuwo_cover(self, song_name, singer):
+        """使用酷我音乐API搜索歌曲获取封面"""
+        data = self.engine.fetch(f"https://api.suyanw.cn/api/kw.php?msg={song_name}").json()
+        if "data" in data and isinstance(data["data"], list):
+            # 查找匹配的歌曲
+            for song in data["data"]:
+                if "singer" in song and singer.lower() in song["singer"].lower():
+                    if "pic" in song and song["pic"]:
+                        logger.info(f"[SearchMusic] 使用酷我音乐API获取到封面: {song['pic']}")
+                        return song["pic"]
+                    break
+        return None
+
+    def _netease_cover(self, song_name):
+        """使用网易云音乐API搜索歌曲获取封面"""
+        search_url = f"https://music.163.com/api/search/get/web?csrf_token=hlpretag=&hlposttag=&s={song_name}&type=1&offset=0&total=true&limit=1"
+        data = self.engine.fetch(search_url).json()
+        if "result" in data and "songs" in data["result"] and len(data["result"]["songs"]) > 0:
+            song_info = data["result"]["songs"][0]
+            if "al" in song_info and "picUrl" in song_info["al"]:
+                logger.info(f"[SearchMusic] 使用网易云音乐API获取到封面: {song_info['al']['picUrl']}")
+                return song_info["al"]["picUrl"]
+        return None
+
+    def _qq_cover(self, song_name, singer):
+        """使用QQ音乐搜索API获取封面"""
+        search_url = f"https://c.y.qq.com/soso/fcgi-bin/client_search_cp?w={urllib.parse.quote(f'{song_name} {singer}')}&format=json&p=1&n=1"
+        response = self.engine.fetch(search_url)
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        if "data" in data and "song" in data["data"] and "list" in data["data"]["song"] and data["data"]["song"]["list"]:
+            song_info = data["data"]["song"]["list"][0]
+            if "albummid" in song_info:
+                cover_url = f"https://y.gtimg.cn/music/photo_new/T002R300x300M000{song_info['albummid']}.jpg"
+                logger.info(f"[SearchMusic] 使用QQ音乐API获取到封面: {cover_url}")
+                return cover_url
+        return None
 
     def extract_cover_from_response(self, response_text):
         """
@@ -262,12 +264,13 @@ class SearchMusic(Plugin):
         :return: 有效的视频URL或None
         """
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            content_type = response.headers.get('Content-Type')
-            if 'video' in content_type:
-                logger.debug("[SearchMusic] 视频内容已检测")
-                return response.url
+            # 只需要响应头，stream=True避免把整个视频下载到内存
+            with get_http_session().get(url, stream=True, timeout=10) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '')
+                if 'video' in content_type:
+                    logger.debug("[SearchMusic] 视频内容已检测")
+                    return response.url
             return None
         except requests.exceptions.RequestException as e:
             logger.error(f"[SearchMusic] 请求视频URL失败: {e}")
@@ -292,7 +295,7 @@ class SearchMusic(Plugin):
             }
             for retry in range(3):  # 最多重试3次
                 try:
-                    response = requests.get(music_url, stream=True, headers=headers, timeout=30)
+                    response = get_http_session().get(music_url, stream=True, headers=headers, timeout=30)
                     response.raise_for_status()  # 检查响应状态
                     break
                 except requests.RequestException as e:
@@ -311,10 +314,10 @@ class SearchMusic(Plugin):
             music_name = f"{platform}_music_{timestamp}_{random_str}.mp3"
             music_path = os.path.join(tmp_dir, music_name)
             
-            # 保存文件，使用块写入以节省内存
+            # 流式写入文件以节省内存，写完后连接归还连接池
             total_size = 0
-            with open(music_path, "wb") as file:
-                for chunk in response.iter_content(chunk_size=8192):
+            with response, open(music_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=65536):
                     if chunk:
                         file.write(chunk)
                         total_size += len(chunk)
@@ -350,7 +353,7 @@ class SearchMusic(Plugin):
         if content.strip() == "随机点歌":
             url = "https://hhlqilongzhu.cn/api/wangyi_hot_review.php"
             try:
-                response = requests.get(url, timeout=10)
+                response = self.engine.fetch(url, cache=False)
                 if response.status_code == 200:
                     try:
                         data = json.loads(response.text)
@@ -386,7 +389,7 @@ class SearchMusic(Plugin):
         elif content.strip() == "随机听歌":
             url = "https://hhlqilongzhu.cn/api/wangyi_hot_review.php"
             try:
-                response = requests.get(url, timeout=10)
+                response = self.engine.fetch(url, cache=False)
                 if response.status_code == 200:
                     try:
                         data = json.loads(response.text)
@@ -420,6 +423,29 @@ class SearchMusic(Plugin):
                 logger.error(f"[SearchMusic] 随机听歌错误: {e}")
                 reply.content = "随机听歌失败，请稍后重试"
 
+        # 处理全网点歌命令，并发搜索所有平台并合并结果
+        elif content.startswith("全网点歌 "):
+            song_name = content[5:].strip()
+            if not song_name:
+                reply.content = "请输入要搜索的歌曲名称"
+                e_context["reply"] = reply
+                e_context.action = EventAction.BREAK_PASS
+                return
+
+            results = self.engine.gather({
+                platform: (lambda platform=platform: self.search_song_list(platform, song_name))
+                for platform, _ in SEARCH_PLATFORMS
+            })
+            if results:
+                reply_content = " 为你在各音乐库中找到以下歌曲：\n"
+                for platform, display_name in SEARCH_PLATFORMS:
+                    if platform in results:
+                        reply_content += f"\n【{display_name}】\n" + "\n".join(results[platform]) + "\n"
+                reply_content += f"\n请发送「平台+点歌 {song_name} 序号」获取歌曲详情，如「酷狗点歌 {song_name} 1」\n或发送「平台+听歌 {song_name} 序号」来播放对应歌曲"
+            else:
+                reply_content = "未找到相关歌曲，请换个关键词试试"
+            reply.content = reply_content
+
         # 处理酷狗点歌命令（搜索歌曲列表）
         elif content.startswith("酷狗点歌 "):
             song_name = content[5:].strip()  # 去除多余空格
@@ -435,7 +461,7 @@ class SearchMusic(Plugin):
                 song_name, song_number = params
                 url = f"https://www.hhlqilongzhu.cn/api/dg_kgmusic.php?gm={song_name}&n={song_number}"
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     content = response.text
                     song_info = content.split('\n')
                     
@@ -468,7 +494,7 @@ class SearchMusic(Plugin):
                 # 原有的搜索歌曲列表功能
                 url = f"https://www.hhlqilongzhu.cn/api/dg_kgmusic.php?gm={song_name}&n="
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     songs = response.text.strip().split('\n')
                     if songs and len(songs) > 1:  # 确保有搜索结果
                         reply_content = " 为你在酷狗音乐库中找到以下歌曲：\n\n"
@@ -498,7 +524,7 @@ class SearchMusic(Plugin):
                 song_name, song_number = params
                 url = f"https://www.hhlqilongzhu.cn/api/dg_wyymusic.php?gm={song_name}&n={song_number}"
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     content = response.text
                     song_info = content.split('\n')
                     
@@ -531,7 +557,7 @@ class SearchMusic(Plugin):
                 # 原有的搜索歌曲列表功能
                 url = f"https://www.hhlqilongzhu.cn/api/dg_wyymusic.php?gm={song_name}&n=&num=20"
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     songs = response.text.strip().split('\n')
                     if songs and len(songs) > 1:  # 确保有搜索结果
                         reply_content = " 为你在网易音乐库中找到以下歌曲：\n\n"
@@ -562,7 +588,7 @@ class SearchMusic(Plugin):
                 song_name, song_number = params
                 url = f"https://hhlqilongzhu.cn/api/dg_qishuimusic.php?msg={song_name}&n={song_number}"
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     content = response.text
                     
                     # 尝试解析JSON响应
@@ -609,7 +635,7 @@ class SearchMusic(Plugin):
                 # 搜索歌曲列表功能
                 url = f"https://hhlqilongzhu.cn/api/dg_qishuimusic.php?msg={song_name}"
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     content = response.text.strip()
                     
                     # 尝试解析JSON响应
@@ -672,7 +698,7 @@ class SearchMusic(Plugin):
             url = f"https://www.hhlqilongzhu.cn/api/dg_kgmusic.php?gm={song_name}&n={song_number}"
             
             try:
-                response = requests.get(url, timeout=10)
+                response = self.engine.fetch(url)
                 content = response.text
                 song_info = content.split('\n')
                 
@@ -718,7 +744,7 @@ class SearchMusic(Plugin):
             url = f"https://www.hhlqilongzhu.cn/api/dg_wyymusic.php?gm={song_name}&n={song_number}"
             
             try:
-                response = requests.get(url, timeout=10)
+                response = self.engine.fetch(url)
                 content = response.text
                 
                 # 解析返回内容
@@ -763,7 +789,7 @@ class SearchMusic(Plugin):
                 song_name, song_number = params
                 url = f"https://hhlqilongzhu.cn/api/dg_kuwomusic.php?msg={song_name}&n={song_number}"
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     content = response.text
                     
                     # 解析文本格式的响应
@@ -809,7 +835,7 @@ class SearchMusic(Plugin):
                 # 搜索歌曲列表功能
                 url = f"https://hhlqilongzhu.cn/api/dg_kuwomusic.php?msg={song_name}"
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     content = response.text.strip()
                     
                     # 解析返回的歌曲列表
@@ -848,7 +874,7 @@ class SearchMusic(Plugin):
             url = f"https://hhlqilongzhu.cn/api/dg_qishuimusic.php?msg={song_name}&n={song_number}"
             
             try:
-                response = requests.get(url, timeout=10)
+                response = self.engine.fetch(url)
                 content = response.text
                 
                 # 尝试解析JSON响应
@@ -896,7 +922,7 @@ class SearchMusic(Plugin):
             url = f"https://hhlqilongzhu.cn/api/dg_kuwomusic.php?msg={song_name}&n={song_number}"
             
             try:
-                response = requests.get(url, timeout=10)
+                response = self.engine.fetch(url)
                 content = response.text
                 
                 # 尝试解析JSON响应
@@ -971,7 +997,7 @@ class SearchMusic(Plugin):
                 song_name, song_number = params
                 url = f"https://api.317ak.com/API/yljk/kgmv/kgmv.php?msg={song_name}&n={song_number}"
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     content = response.text
                     
                     # 尝试解析JSON响应
@@ -1010,7 +1036,7 @@ class SearchMusic(Plugin):
                 # 搜索MV列表功能
                 url = f"https://api.317ak.com/API/yljk/kgmv/kgmv.php?msg={song_name}"
                 try:
-                    response = requests.get(url, timeout=10)
+                    response = self.engine.fetch(url)
                     content = response.text.strip()
                     
                     # 尝试解析JSON响应
@@ -1044,6 +1070,27 @@ class SearchMusic(Plugin):
         e_context["reply"] = reply
         e_context.action = EventAction.BREAK_PASS
 
+    def search_song_list(self, platform, song_name, limit=5):
+        """
+        搜索单个平台的歌曲列表，接口与各平台点歌命令相同，可以共用搜索缓存
+        :return: 「序号. 歌名 - 歌手」格式的列表
+        """
+        text = self.engine.fetch(SEARCH_LIST_URLS[platform].format(song_name=song_name)).text.strip()
+        if platform != "qishui":
+            return [line for line in text.split("\n") if line.strip()][:limit]
+        # 汽水音乐返回JSON，旧接口返回文本
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            matches = re.findall(r"(\d+)\.\s+(.*?)\s+-\s+(.*?)$", text, re.MULTILINE)
+            return [f"{number}. {title} - {singer}" for number, title, singer in matches][:limit]
+        if isinstance(data.get("data"), list):
+            songs = [song for song in data["data"] if "n" in song and "title" in song and "singer" in song]
+            return [f"{song['n']}. {song['title']} - {song['singer']}" for song in songs][:limit]
+        if "title" in data and "singer" in data:
+            return [f"1. {data['title']} - {data['singer']}"]
+        return []
+
     def get_help_text(self, **kwargs):
         return (
             " 音乐搜索和播放功能：\n\n"
@@ -1066,5 +1113,6 @@ class SearchMusic(Plugin):
             "   - 语音播放：发送「酷我听歌 歌曲名称 序号」\n"
             "5. 随机点歌：发送「随机点歌」获取随机音乐卡片\n"
             "6. 随机听歌：发送「随机听歌」获取随机语音播放\n"
+            "7. 全网点歌：发送「全网点歌 歌曲名称」同时搜索所有平台\n"
             "注：序号在搜索结果中获取"
         )
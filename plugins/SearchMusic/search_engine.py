@@ -0,0 +1,119 @@
+# encoding:utf-8
+"""
+点歌插件的搜索引擎：
+1. 所有搜索请求走共享连接池，相同查询在有效期内直接返回缓存结果，并发的相同查询只请求一次
+2. 多个来源(多个平台、多个封面接口)并发查询，取第一个可用结果或合并全部结果
+"""
+
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from common.async_runtime import get_http_session
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from common.single_flight import SingleFlight
+
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="music-search")
+
+
+class SearchResponse(object):
+    """缓存的响应，只保留插件用到的字段"""
+
+    __slots__ = ("status_code", "text", "url")
+
+    def __init__(self, status_code, text, url):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class MusicSearchEngine(object):
+    """
+    :param query_ttl: 搜索结果缓存秒数，播放链接可能带有时效签名，不宜过长
+    :param cover_ttl: 封面缓存秒数
+    :param timeout: 单个请求的超时秒数
+    """
+
+    def __init__(self, query_ttl=600, cover_ttl=86400, timeout=10, max_size=1000):
+        self.timeout = timeout
+        self.queries = ExpiredDict(query_ttl, max_size=max_size, sliding=False)
+        self.covers = ExpiredDict(cover_ttl, max_size=max_size, sliding=False)
+        self._flight = SingleFlight()
+
+    def _request(self, url):
+        response = get_http_session().get(url, timeout=self.timeout)
+        return SearchResponse(response.status_code, response.text, response.url)
+
+    def fetch(self, url, cache=True):
+        """
+        请求搜索接口，只缓存状态码为200的响应
+        :param cache: 随机类接口每次结果都不同，需要传False
+        """
+        if not cache:
+            return self._request(url)
+        response = self.queries.get(url)
+        if response is not None:
+            logger.debug(f"[SearchMusic] query cache hit: {url}")
+            return response
+        response, _ = self._flight.do(url, self._request, url)
+        if response.status_code == 200:
+            self.queries[url] = response
+        return response
+
+    def first_good(self, sources, timeout=None):
+        """
+        并发执行多个来源，返回最先得到的非空结果，全部失败时返回None
+        :param sources: 无参函数列表，返回None或抛出异常表示该来源没有结果
+        """
+        if not sources:
+            return None
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        pending = {_search_pool.submit(source) for source in sources}
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.debug(f"[SearchMusic] source failed: {e}")
+                        continue
+                    if result:
+                        return result
+            return None
+        finally:
+            # 已经在执行的请求无法中断，结果直接丢弃
+            for future in pending:
+                future.cancel()
+
+    def gather(self, sources, timeout=None):
+        """
+        并发执行多个来源并合并结果
+        :param sources: {名称: 无参函数}
+        :return: {名称: 结果}，失败或超时的来源不包含在内，保持sources的顺序
+        """
+        timeout = self.timeout if timeout is None else timeout
+        futures = {name: _search_pool.submit(source) for name, source in sources.items()}
+        wait(futures.values(), timeout=timeout)
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                future.cancel()
+                logger.warning(f"[SearchMusic] {name} search timed out")
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"[SearchMusic] {name} search failed: {e}")
+                continue
+            if result:
+                results[name] = result
+        return results
@@ -0,0 +1,146 @@
+"""
+画图任务队列：
+1. 生成任务在独立的工作线程中执行，不占用消息处理线程，完成后通过回调推送结果
+2. 按模型限制并发数，某个模型的任务占满时，排在后面的其他模型任务可以先执行
+3. 相同的任务(同一模型、尺寸和提示词)只执行一次，结果发给所有提交者
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from common.log import logger
+
+
+class ImageJob(object):
+    __slots__ = ("key", "model", "description", "fn", "callbacks", "status", "created_at", "started_at")
+
+    def __init__(self, key, model, description, fn):
+        self.key = key
+        self.model = model
+        self.description = description
+        self.fn = fn
+        self.callbacks = []
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class ImageJobQueue(object):
+    """
+    :param workers: 工作线程数，即所有模型合计的最大并发数
+    :param model_limits: {模型: 最大并发数}，未配置的模型使用default_limit
+    :param max_queued: 最多排队的任务数，超过时拒绝新任务
+    """
+
+    def __init__(self, workers=2, model_limits=None, default_limit=1, max_queued=20):
+        self.workers = max(1, int(workers))
+        self.model_limits = dict(model_limits or {})
+        self.default_limit = max(1, int(default_limit))
+        self.max_queued = max_queued
+        self._cond = threading.Condition()
+        self._queue = []  # 排队中的任务，按提交顺序
+        self._jobs = {}  # key -> 排队中或执行中的任务
+        self._running = defaultdict(int)  # 模型 -> 执行中的任务数
+        self._threads = []
+        self._closed = False
+
+    def _limit(self, model):
+        return max(1, int(self.model_limits.get(model, self.default_limit)))
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"sf-image-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, model, description, fn, callback):
+        """
+        提交任务，相同key的任务正在排队或执行时只追加回调
+        :param fn: 无参函数，返回任务结果
+        :param callback: callback(result, error)，在工作线程中调用
+        :return: (是否合并到已有任务, 排队位置，0表示正在执行)
+        """
+        with self._cond:
+            if self._closed:
+                raise QueueFullError("job queue is closed")
+            job = self._jobs.get(key)
+            if job is not None:
+                job.callbacks.append(callback)
+                return True, self._position(job)
+            if self.max_queued and len(self._queue) >= self.max_queued:
+                raise QueueFullError(f"too many queued jobs: {len(self._queue)}")
+            job = ImageJob(key, model, description, fn)
+            job.callbacks.append(callback)
+            self._jobs[key] = job
+            self._queue.append(job)
+            self._ensure_workers()
+            self._cond.notify()
+            return False, self._position(job)
+
+    def _position(self, job):
+        if job.status == "running":
+            return 0
+        return self._queue.index(job) + 1
+
+    def _next_job(self):
+        for job in self._queue:
+            if self._running[job.model] < self._limit(job.model):
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._closed and not self._queue:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                self._queue.remove(job)
+                job.status = "running"
+                job.started_at = time.time()
+                self._running[job.model] += 1
+
+            result, error = None, None
+            try:
+                result = job.fn()
+            except Exception as e:
+                logger.error(f"[Siliconflow2cow] job failed: {job.description}, error: {e}")
+                error = e
+
+            with self._cond:
+                self._running[job.model] -= 1
+                self._jobs.pop(job.key, None)
+                callbacks = list(job.callbacks)
+                # 模型并发名额释放后，等待该模型的工作线程可以继续
+                self._cond.notify_all()
+
+            for callback in callbacks:
+                try:
+                    callback(result, error)
+                except Exception as e:
+                    logger.error(f"[Siliconflow2cow] job callback failed: {e}", exc_info=True)
+
+    def close(self):
+        """不再接受新任务，工作线程执行完已排队的任务后退出"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def status(self):
+        """返回执行中和排队中的任务信息"""
+        now = time.time()
+        with self._cond:
+            running = [job for job in self._jobs.values() if job.status == "running"]
+            return {
+                "running": [(job.model, job.description, now - job.started_at, len(job.callbacks)) for job in running],
+                "queued": [(job.model, job.description, now - job.created_at, len(job.callbacks)) for job in self._queue],
+            }
@@ -0,0 +1,111 @@
+"""
+提示词增强结果缓存：
+1. 按规范化后的原始提示词和增强策略缓存LLM改写结果，重复或只有空格、标点、大小写差异的提示词直接复用
+2. 内存中按LRU淘汰，可选写入本地SQLite，重启后仍然有效
+"""
+
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from common.log import logger
+
+_SPACES = re.compile(r"\s+")
+_EDGE_PUNCTUATION = "。.，,！!？?；;、~～ "
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+_LATIN_WORD = re.compile(r"[A-Za-z]{2,}")
+
+
+def normalize_prompt(prompt):
+    """规范化提示词作为缓存key：全角转半角、合并空白、英文小写、去掉首尾标点"""
+    text = unicodedata.normalize("NFKC", prompt)
+    text = _SPACES.sub(" ", text).strip(_EDGE_PUNCTUATION)
+    return text.lower()
+
+
+def is_english_prompt(prompt):
+    """不含中日韩文字且至少有三个英文单词，认为已经是可以直接使用的英文提示词"""
+    return not _CJK.search(prompt) and len(_LATIN_WORD.findall(prompt)) >= 3
+
+
+class PromptCache(object):
+    """
+    :param max_entries: 内存中最多缓存的提示词数量
+    :param ttl: 缓存有效期(秒)，0表示不过期
+    :param path: SQLite文件路径，为空时只缓存在内存中
+    :param namespace: 增强使用的模型和系统提示词等，变化后旧的缓存不再命中
+    """
+
+    def __init__(self, max_entries=1000, ttl=0, path=None, namespace=""):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (enhanced, created_at)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS prompt_cache (key TEXT PRIMARY KEY, enhanced TEXT, created_at REAL)"
+                )
+                if ttl:
+                    self._db.execute("DELETE FROM prompt_cache WHERE created_at < ?", (time.time() - ttl,))
+                self._db.commit()
+            except Exception as e:
+                logger.warning(f"[Siliconflow2cow] prompt cache persistence disabled: {e}")
+                self._db = None
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, prompt, variant):
+        return f"{self.namespace}\n{variant}\n{normalize_prompt(prompt)}"
+
+    def _remember(self, key, entry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while self.max_entries and len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT enhanced, created_at FROM prompt_cache WHERE key=?", (key,)).fetchone()
+        return tuple(row) if row else None
+
+    def get(self, prompt, variant):
+        key = self.make_key(prompt, variant)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._remember(key, entry)
+            if entry is None or (self.ttl and time.time() - entry[1] > self.ttl):
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, prompt, variant, enhanced):
+        key = self.make_key(prompt, variant)
+        entry = (enhanced, time.time())
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO prompt_cache (key, enhanced, created_at) VALUES (?, ?, ?)", (key,) + entry
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    logger.warning(f"[Siliconflow2cow] failed to save prompt cache: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
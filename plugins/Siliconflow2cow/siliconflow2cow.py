@@ -4,24 +4,37 @@ import json
 import time
 import requests
 import base64
+import hashlib
 from io import BytesIO
 from typing import List, Tuple
 from pathvalidate import sanitize_filename
 from PIL import Image
 from datetime import datetime, timedelta
 import threading
+import uuid
 
 import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.async_runtime import get_http_session
+from common.single_flight import SingleFlight
 from plugins import *
-from config import conf
+from config import conf, get_appdata_dir
+from .job_queue import ImageJobQueue, QueueFullError
+from .prompt_cache import PromptCache, is_english_prompt
 
 CHAT_API_URL = "https://api.siliconflow.cn/v1/chat/completions"
 CHAT_MODEL = "Qwen/Qwen2.5-7B-Instruct"
 ENHANCER_PROMPT = """You are a powerful Stable Diffusion prompt assistant. You can accurately translate Chinese to English and expand scenes and detailed descriptions based on simple prompts, generating concise and AI-recognizable painting prompts. Your prompts must output a complete English sentence, and the output result is limited to 100 words or less. It should be detailed and complete, including complex details of what is happening in the image. The text should be limited to one scene. Do not delete important details from the user's input information, especially terms related to graphics, details, lighting, quality, resolution, color profiles, image filters, and artist and character names. Do not output any explanatory content that is unrelated to the image prompt. """
 ENHANCER_PROMPT_FLUX = """You are a powerful Stable Diffusion prompt assistant. You can accurately translate Chinese to English and expand scenes and detailed descriptions based on simple prompts, generating concise and AI-recognizable painting prompts. Your prompts must output a complete English sentence, and the output result is limited to 100 words or less. It should be detailed and complete, including complex details of what is happening in the image. The text should be limited to one scene. Do not delete important details from the user's input information, especially terms related to graphics, details, lighting, quality, resolution, color profiles, image filters, and artist and character names. Do not output any explanatory content that is unrelated to the image prompt."""
+# 系统提示词消息只构建一次，flux模型使用自然语言描述策略
+ENHANCER_MESSAGES = {
+    "default": {"role": "system", "content": ENHANCER_PROMPT},
+    "flux": {"role": "system", "content": ENHANCER_PROMPT_FLUX},
+}
+# 增强模型或系统提示词修改后，本地缓存的增强结果自动失效
+ENHANCER_VERSION = hashlib.md5((CHAT_MODEL + ENHANCER_PROMPT + ENHANCER_PROMPT_FLUX).encode("utf-8")).hexdigest()[:8]
 
 @plugins.register(
     name="Siliconflow2cow",
@@ -30,6 +43,7 @@ ENHANCER_PROMPT_FLUX = """You are a powerful Stable Diffusion prompt assistant.
     desc="A plugin for generating images using various models.",
     version="2.5.8",
     author="Assistant",
+    context_types=[ContextType.TEXT],
 )
 class Siliconflow2cow(Plugin):
     def __init__(self):
@@ -53,6 +67,29 @@ class Siliconflow2cow(Plugin):
             if not os.path.exists(self.image_output_dir):
                 os.makedirs(self.image_output_dir)
 
+            self.chat_headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.auth_token}"
+            }
+            # 提示词增强结果缓存，prompt_cache_persist为true时保存到本地，重启后仍然有效
+            self.prompt_cache = PromptCache(
+                max_entries=int(conf.get("prompt_cache_size", 1000)),
+                ttl=int(conf.get("prompt_cache_ttl", 0)),
+                path=os.path.join(get_appdata_dir(), "siliconflow_prompt_cache.db") if conf.get("prompt_cache_persist", True) else None,
+                namespace=ENHANCER_VERSION,
+            )
+            self._enhance_flight = SingleFlight()
+            # 已经是英文的提示词不再调用LLM增强
+            self.skip_english_enhancement = conf.get("skip_english_enhancement", False)
+
+            # 画图任务队列，worker_count为同时执行的任务数，model_concurrency按模型限制并发
+            self.job_queue = ImageJobQueue(
+                workers=conf.get("worker_count", 2),
+                model_limits=conf.get("model_concurrency", {}),
+                default_limit=conf.get("default_model_concurrency", 1),
+                max_queued=conf.get("max_queued_jobs", 20),
+            )
+
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
 
             # 启动定时清理任务
@@ -65,9 +102,20 @@ class Siliconflow2cow(Plugin):
 
     def schedule_next_run(self):
         """安排下一次运行"""
+        if getattr(self, "_unloaded", False):
+            return
         self.timer = threading.Timer(self.clean_check_interval, self.run_clean_task)
+        self.timer.daemon = True
         self.timer.start()
 
+    def unload(self):
+        # 插件重载或重新启用时会创建新实例，停止旧实例的清理定时器，旧队列执行完已排队的任务后退出
+        self._unloaded = True
+        if getattr(self, "timer", None) is not None:
+            self.timer.cancel()
+        if getattr(self, "job_queue", None) is not None:
+            self.job_queue.close()
+
     def run_clean_task(self):
         """运行清理任务并安排下一次运行"""
         self.clean_old_images()
@@ -94,6 +142,8 @@ class Siliconflow2cow(Plugin):
 
             if content.lower() == "clean_all":
                 reply = self.clean_all_images()
+            elif content.lower() == "status":
+                reply = self.get_queue_status()
             elif used_prefix in self.pollinations_prefixes:
                 # 提取提示词和分辨率参数
                 prompt_text = content.strip()
@@ -115,40 +165,17 @@ class Siliconflow2cow(Plugin):
                 if not prompt_text:
                     reply = Reply(ReplyType.TEXT, "请输入需要生成的图片描述")
                 else:
-                    # 使用提示词增强
-                    enhanced_prompt = self.enhance_prompt(prompt_text, "kolors")
-                    logger.debug(f"[Siliconflow2cow] 增强后的提示词: {enhanced_prompt}")
-                    
-                    # 构建API URL
-                    url = f"https://image.pollinations.ai/prompt/{enhanced_prompt}?width={width}&height={height}&seed=100&model=flux&nologo=true"
-                    logger.debug(f"[Siliconflow2cow] 生成的图片URL: {url}")
-                    
-                    # 下载并保存图片
-                    image_path = self.download_and_save_image(url)
-                    logger.debug(f"[Siliconflow2cow] 图片已保存到: {image_path}")
-                    
-                    reply = Reply(ReplyType.IMAGE, image_path)
+                    key = ("pollinations", width, height, prompt_text)
+                    self.submit_job(e_context, key, "pollinations", prompt_text,
+                                    self.run_pollinations_job, prompt_text, width, height)
+                    return
             else:
                 model_key, image_size, clean_prompt = self.parse_user_input(content)
                 logger.debug(f"[Siliconflow2cow] 解析后的参数: 模型={model_key}, 尺寸={image_size}, 提示词={clean_prompt}")
-
-                original_image_url = self.extract_image_url(clean_prompt)
-                logger.debug(f"[Siliconflow2cow] 原始提示词中提取的图片URL: {original_image_url}")
-
-                enhanced_prompt = self.enhance_prompt(clean_prompt, model_key)
-                logger.debug(f"[Siliconflow2cow] 增强后的提示词: {enhanced_prompt}")
-
-                image_url = self.generate_image(enhanced_prompt, original_image_url, model_key, image_size)
-                logger.debug(f"[Siliconflow2cow] 生成的图片URL: {image_url}")
-
-                if image_url:
-                    image_path = self.download_and_save_image(image_url)
-                    logger.debug(f"[Siliconflow2cow] 图片已保存到: {image_path}")
-
-                    reply = Reply(ReplyType.IMAGE, image_path)
-                else:
-                    logger.error("[Siliconflow2cow] 生成图片失败")
-                    reply = Reply(ReplyType.ERROR, "生成图片失败。")
+                key = (model_key, image_size, clean_prompt)
+                self.submit_job(e_context, key, model_key, clean_prompt,
+                                self.run_siliconflow_job, clean_prompt, model_key, image_size)
+                return
 
             e_context["reply"] = reply
             e_context.action = EventAction.BREAK_PASS
@@ -158,6 +185,76 @@ class Siliconflow2cow(Plugin):
             e_context["reply"] = reply
             e_context.action = EventAction.BREAK_PASS
 
+    def submit_job(self, e_context: EventContext, key, model_key: str, prompt: str, job, *args):
+        """把画图任务放入队列并立即回复，生成完成后再推送图片"""
+        channel = e_context["channel"]
+        context = e_context["context"]
+
+        def on_done(image_path, error):
+            if error is not None:
+                reply = Reply(ReplyType.ERROR, f"发生错误: {str(error)}")
+            elif image_path:
+                reply = Reply(ReplyType.IMAGE, image_path)
+            else:
+                reply = Reply(ReplyType.ERROR, "生成图片失败。")
+            self.send_reply(channel, context, reply)
+
+        try:
+            merged, position = self.job_queue.submit(key, model_key, prompt[:30], lambda: job(*args), on_done)
+        except QueueFullError:
+            ack = "当前画图任务较多，请稍后再试"
+        else:
+            if merged:
+                ack = "相同的图片正在生成中，完成后一起发送"
+            elif position > 1:
+                ack = f"已加入画图队列，前面还有 {position - 1} 个任务，请稍候"
+            else:
+                ack = "正在生成图片，请稍候"
+        e_context["reply"] = Reply(ReplyType.TEXT, ack)
+        e_context.action = EventAction.BREAK_PASS
+
+    def run_pollinations_job(self, prompt_text: str, width: int, height: int) -> str:
+        # 使用提示词增强
+        enhanced_prompt = self.enhance_prompt(prompt_text, "kolors")
+        logger.debug(f"[Siliconflow2cow] 增强后的提示词: {enhanced_prompt}")
+
+        # 构建API URL
+        url = f"https://image.pollinations.ai/prompt/{enhanced_prompt}?width={width}&height={height}&seed=100&model=flux&nologo=true"
+        logger.debug(f"[Siliconflow2cow] 生成的图片URL: {url}")
+
+        # 下载并保存图片
+        image_path = self.download_and_save_image(url)
+        logger.debug(f"[Siliconflow2cow] 图片已保存到: {image_path}")
+        return image_path
+
+    def run_siliconflow_job(self, clean_prompt: str, model_key: str, image_size: str) -> str:
+        original_image_url = self.extract_image_url(clean_prompt)
+        logger.debug(f"[Siliconflow2cow] 原始提示词中提取的图片URL: {original_image_url}")
+
+        enhanced_prompt = self.enhance_prompt(clean_prompt, model_key)
+        logger.debug(f"[Siliconflow2cow] 增强后的提示词: {enhanced_prompt}")
+
+        image_url = self.generate_image(enhanced_prompt, original_image_url, model_key, image_size)
+        logger.debug(f"[Siliconflow2cow] 生成的图片URL: {image_url}")
+
+        if not image_url:
+            logger.error("[Siliconflow2cow] 生成图片失败")
+            return None
+        image_path = self.download_and_save_image(image_url)
+        logger.debug(f"[Siliconflow2cow] 图片已保存到: {image_path}")
+        return image_path
+
+    def get_queue_status(self):
+        status = self.job_queue.status()
+        if not status["running"] and not status["queued"]:
+            return Reply(ReplyType.TEXT, "当前没有画图任务")
+        lines = [f"执行中 {len(status['running'])} 个，排队中 {len(status['queued'])} 个"]
+        for model, prompt, elapsed, waiters in status["running"]:
+            lines.append(f"▶ [{model}] {prompt} 已执行{int(elapsed)}秒" + (f"，{waiters}人等待" if waiters > 1 else ""))
+        for index, (model, prompt, elapsed, waiters) in enumerate(status["queued"], 1):
+            lines.append(f"{index}. [{model}] {prompt} 已等待{int(elapsed)}秒" + (f"，{waiters}人等待" if waiters > 1 else ""))
+        return Reply(ReplyType.TEXT, "\n".join(lines))
+
     def parse_user_input(self, content: str) -> Tuple[str, str, str]:
         model_key = self.extract_model_key(content)
         image_size = self.extract_image_size(content)
@@ -166,60 +263,39 @@ class Siliconflow2cow(Plugin):
         return model_key, image_size, clean_prompt
 
     def enhance_prompt(self, prompt: str, model_key: str) -> str:
-        """根据模型选择合适的提示词增强策略"""
-        # 直接使用用户输入的提示词进行增强
-        if model_key in ["dev", "flux"]:
-            try:
-                logger.debug(f"[Siliconflow2cow] 模型 {model_key} 使用 ENHANCER_PROMPT_FLUX 进行自然语言增强。")
-                response = requests.post(
-                    CHAT_API_URL,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.auth_token}"
-                    },
-                    json={
-                        "model": CHAT_MODEL,
-                        "messages": [
-                            {"role": "system", "content": ENHANCER_PROMPT_FLUX},
-                            {"role": "user", "content": prompt}
-                        ]
-                    }
-                )
-                response.raise_for_status()
-                enhanced_prompt = response.json()['choices'][0]['message']['content']
-                logger.debug(f"[Siliconflow2cow] 使用 ENHANCER_PROMPT_FLUX 增强后的提示词: {enhanced_prompt}")
-                logger.info(f"[Siliconflow2cow] 提示词增强成功，原始提示词: {prompt}，增强后提示词: {enhanced_prompt}")
-                return enhanced_prompt
-            except Exception as e:
-                logger.error(f"[Siliconflow2cow] 自然语言增强失败: {e}")
-                return prompt  # 如果增强失败，返回原始提示词
-        
-        # 使用默认的 ENHANCER_PROMPT 进行提示词增强
+        """根据模型选择合适的提示词增强策略，相同的提示词直接使用缓存的增强结果"""
+        if self.skip_english_enhancement and is_english_prompt(prompt):
+            logger.debug(f"[Siliconflow2cow] 提示词已经是英文，跳过增强: {prompt}")
+            return prompt
+
+        variant = "flux" if model_key in ["dev", "flux"] else "default"
+        enhanced_prompt = self.prompt_cache.get(prompt, variant)
+        if enhanced_prompt:
+            logger.debug(f"[Siliconflow2cow] 提示词增强命中缓存: {prompt} -> {enhanced_prompt}")
+            return enhanced_prompt
+
+        # 并发的相同提示词只请求一次
+        key = self.prompt_cache.make_key(prompt, variant)
+        enhanced_prompt, _ = self._enhance_flight.do(key, self._request_enhancement, prompt, variant)
+        return enhanced_prompt
+
+    def _request_enhancement(self, prompt: str, variant: str) -> str:
         try:
-            logger.debug(f"[Siliconflow2cow] 正在使用 ENHANCER_PROMPT 进行提示词增强: {prompt}")
-            response = requests.post(
+            logger.debug(f"[Siliconflow2cow] 正在使用 {variant} 策略进行提示词增强: {prompt}")
+            response = get_http_session().post(
                 CHAT_API_URL,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.auth_token}"
-                },
-                json={
-                    "model": CHAT_MODEL,
-                    "messages": [
-                        {"role": "system", "content": ENHANCER_PROMPT},
-                        {"role": "user", "content": prompt}
-                    ]
-                }
+                headers=self.chat_headers,
+                json={"model": CHAT_MODEL, "messages": [ENHANCER_MESSAGES[variant], {"role": "user", "content": prompt}]},
             )
             response.raise_for_status()
-            enhanced_prompt = response.json()['choices'][0]['message']['content']
-            logger.debug(f"[Siliconflow2cow] 使用 ENHANCER_PROMPT 增强后的提示词: {enhanced_prompt}")
+            enhanced_prompt = response.json()['choices'][0]['message']['content'].strip()
             logger.info(f"[Siliconflow2cow] 提示词增强成功，原始提示词: {prompt}，增强后提示词: {enhanced_prompt}")
-            return enhanced_prompt
-            
         except Exception as e:
             logger.error(f"[Siliconflow2cow] 提示词增强失败: {e}")
-            return prompt  # 如果增强失败，返回原始提示词
+            return prompt  # 如果增强失败，返回原始提示词，不写入缓存
+        if enhanced_prompt:
+            self.prompt_cache.put(prompt, variant, enhanced_prompt)
+        return enhanced_prompt or prompt
 
     def generate_image(self, prompt: str, original_image_url: str, model_key: str, image_size: str) -> str:
         if original_image_url:
@@ -463,7 +539,8 @@ class Siliconflow2cow(Plugin):
 
         image = Image.open(BytesIO(response.content))
 
-        filename = f"{int(time.time())}.png"
+        # 多个任务可能在同一秒完成，文件名加上随机后缀避免互相覆盖
+        filename = f"{int(time.time())}_{uuid.uuid4().hex[:8]}.png"
         file_path = os.path.join(self.image_output_dir, filename)
 
         image.save(file_path, format='PNG')
@@ -505,6 +582,12 @@ class Siliconflow2cow(Plugin):
         else:
             logger.info("[Siliconflow2cow] 没有需要清理的旧图片")
 
+    def get_triggers(self):
+        # 触发前缀来自配置
+        triggers = dict(super().get_triggers() or {})
+        triggers["prefixes"] = list(self.siliconflow_prefixes)
+        return triggers
+
     def get_help_text(self, **kwargs):
         help_text = "插件使用指南：\n"
         help_text += f"1. 使用 {', '.join(self.siliconflow_prefixes)} 作为Kolors画图的命令前缀\n"
@@ -512,6 +595,7 @@ class Siliconflow2cow(Plugin):
         help_text += "3. 在提示词后面添加 '--m' 来选择模型，例如：--m dev，当前默认为kolors\n"
         help_text += "4. 使用 '--' 后跟比例来指定图片尺寸，例如：--ar 16:9\n"
         help_text += f"5. 输入 '{self.siliconflow_prefixes[0]}clean_all' 来清理所有图片（警告：这将删除所有已生成的图片）\n"
+        help_text += f"6. 输入 '{self.siliconflow_prefixes[0]}status' 查看执行中和排队中的画图任务\n"
         help_text += f"示例：{self.siliconflow_prefixes[0]} 一只可爱的小猫 --m dev --16:9\n"
         help_text += "注意：您的提示词将会被AI自动优化以产生更好的结果。\n"
         help_text += f"可用的模型：dev, schnell, sd35, janus, kolors\n"
@@ -1,3 +1,4 @@
+from .command_router import CommandRouter
 from .event import *
 from .plugin import *
 from .plugin_manager import PluginManager
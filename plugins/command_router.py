@@ -0,0 +1,132 @@
+# encoding:utf-8
+
+"""
+#指令路由：Godcmd内置指令和其他插件注册的指令共用一张 别名->指令 的哈希表，
+注册或配置变化时编译一次，每条消息只需一次字典查找就能判断是否为指令；渲染好的帮助文本也会缓存
+"""
+
+import threading
+
+from common.log import logger
+from common.singleton import singleton
+
+
+class Command(object):
+    __slots__ = ("name", "alias", "args", "desc", "admin", "hidden", "owner", "handler")
+
+    def __init__(self, name, alias, args=None, desc="", admin=False, hidden=False, owner=None, handler=None):
+        self.name = name
+        self.alias = list(alias)
+        self.args = list(args or [])
+        self.desc = desc
+        self.admin = admin
+        self.hidden = hidden  # 不在帮助中显示
+        self.owner = owner  # 注册指令的插件名
+        self.handler = handler  # handler(e_context, args) -> (ok, result)，为空时由owner自己分发
+
+    def usage(self):
+        line = f"#{self.alias[0]} "
+        if self.args:
+            line += " ".join(self.args)
+        return line + f": {self.desc}"
+
+
+@singleton
+class CommandRouter(object):
+    def __init__(self):
+        self.commands = {}  # 指令名 -> Command，按注册顺序
+        self._aliases = None  # 别名 -> Command，为None时下次查找前重新编译
+        self._help_cache = {}  # 帮助文本缓存，key由调用方决定
+        self._lock = threading.Lock()
+        self.version = 0  # 每次指令变化加1，可以作为调用方帮助缓存key的一部分
+
+    def register(self, name, alias, args=None, desc="", admin=False, hidden=False, owner=None, handler=None):
+        """
+        注册或覆盖指令，覆盖已有指令时保留其在帮助中的位置
+        只能覆盖同一个插件注册的指令，指令名已被其他插件使用时改为 插件名:指令名
+        """
+        with self._lock:
+            existing = self.commands.get(name)
+            if existing is not None and existing.owner != owner:
+                namespaced = f"{owner}:{name}"
+                logger.warning(f"[CommandRouter] command {name} already registered by {existing.owner}, "
+                               f"registered by {owner} as {namespaced}")
+                name = namespaced
+            command = Command(name, alias, args, desc, admin, hidden, owner, handler)
+            self.commands[name] = command
+            self._invalidate()
+        return command
+
+    def unregister(self, name=None, owner=None):
+        """按指令名或注册的插件名注销指令"""
+        with self._lock:
+            names = [n for n, c in self.commands.items() if n == name or (owner is not None and c.owner == owner)]
+            for n in names:
+                del self.commands[n]
+            if names:
+                self._invalidate()
+
+    def _invalidate(self):
+        self._aliases = None
+        self._help_cache.clear()
+        self.version += 1
+
+    def _compile(self):
+        aliases = {}
+        for command in self.commands.values():
+            for alias in command.alias:
+                existing = aliases.get(alias)
+                if existing is not None and existing is not command:
+                    logger.warning(f"[CommandRouter] alias #{alias} of {command.name} conflicts with {existing.name}, ignored")
+                    continue
+                aliases[alias] = command
+        return aliases
+
+    def resolve(self, alias):
+        """返回别名对应的指令，不是指令时返回None"""
+        aliases = self._aliases
+        if aliases is None:
+            with self._lock:
+                if self._aliases is None:
+                    self._aliases = self._compile()
+                aliases = self._aliases
+        return aliases.get(alias)
+
+    def list_commands(self, owner=None, admin=None):
+        with self._lock:
+            commands = list(self.commands.values())
+        return [c for c in commands if (owner is None or c.owner == owner) and (admin is None or c.admin == admin)]
+
+    def cached_help(self, key, render):
+        """返回缓存的帮助文本，未缓存时调用render()生成；指令变化后缓存自动失效"""
+        text = self._help_cache.get(key)
+        if text is None:
+            text = render()
+            self._help_cache[key] = text
+        return text
+
+    def invalidate_help(self):
+        """插件启停、重载或配置变化时清空帮助文本缓存"""
+        self._help_cache.clear()
+
+
+if __name__ == "__main__":
+    # 基准测试：对比逐个扫描所有指令别名与编译后的哈希表查找
+    import time
+
+    router = CommandRouter()
+    table = {f"cmd{i}": {"alias": [f"cmd{i}", f"指令{i}", f"c{i}"]} for i in range(40)}
+    for name, info in table.items():
+        router.register(name, info["alias"])
+    queries = ["cmd39", "c20", "unknown"] * 10000
+
+    start = time.perf_counter()
+    for q in queries:
+        any(q in info["alias"] for info in table.values())
+    scan = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for q in queries:
+        router.resolve(q)
+    lookup = time.perf_counter() - start
+    print(f"scan: {scan / len(queries) * 1e6:.2f}us/lookup, router: {lookup / len(queries) * 1e6:.2f}us/lookup")
@@ -16,6 +16,8 @@ from common import const
 from config import conf, load_config, global_config
 from plugins import *
 
+from . import ops
+
 # 定义指令集
 COMMANDS = {
     "help": {
@@ -148,6 +150,21 @@ ADMIN_COMMANDS = {
         "alias": ["debug", "调试模式", "DEBUG"],
         "desc": "开启机器调试日志",
     },
+    "pstat": {
+        "alias": ["pstat", "插件耗时"],
+        "args": ["[插件名|reset|import]"],
+        "desc": "查看各插件处理消息的次数和耗时，reset清空统计，import查看插件导入耗时",
+    },
+    "stats": {
+        "alias": ["stats", "运行状态"],
+        "args": ["[pool|session|cache|bot|plugin|limit]"],
+        "desc": "查看线程池、会话、缓存、bot耗时、插件耗时和限流的实时状态",
+    },
+    "tune": {
+        "alias": ["tune", "调优"],
+        "args": ["pool|session|rate|log", "参数"],
+        "desc": "运行时调整线程池大小、会话并发、限流和日志级别，无需重启",
+    },
 }
 
 def generate_temporary_password(length=12):
@@ -187,20 +204,41 @@ def generate_temporary_password(length=12):
     return password
 
 
+# 不在帮助中显示的指令
+HIDDEN_COMMANDS = ["auth", "set_openai_api_key", "reset_openai_api_key", "set_gpt_model", "reset_gpt_model", "gpt_model"]
+
+
+def _plugins_state():
+    """插件列表的启停、优先级和类对象，任何变化都会让缓存的帮助文本失效"""
+    return tuple((name, id(cls), cls.enabled, cls.priority) for name, cls in PluginManager().list_plugins().items())
+
+
+def _visible_commands(admin):
+    plugins = PluginManager().list_plugins()
+    commands = []
+    for command in CommandRouter().list_commands(admin=admin):
+        if command.hidden:
+            continue
+        if command.owner != "Godcmd":
+            plugincls = plugins.get(command.owner.upper()) if command.owner else None
+            if plugincls is None or not plugincls.enabled:
+                continue
+        commands.append(command)
+    return commands
+
+
 # 定义帮助函数
 def get_help_text(isadmin, isgroup):
+    key = ("help", isadmin, conf().get("channel_type", "wx"), _plugins_state())
+    return CommandRouter().cached_help(key, lambda: _render_help_text(isadmin))
+
+
+def _render_help_text(isadmin):
     help_text = "通用指令\n"
-    for cmd, info in COMMANDS.items():
-        if cmd in ["auth", "set_openai_api_key", "reset_openai_api_key", "set_gpt_model", "reset_gpt_model", "gpt_model"]:  # 不显示帮助指令
+    for command in _visible_commands(admin=False):
+        if command.name == "id" and conf().get("channel_type", "wx") not in ["wxy", "wechatmp"]:
             continue
-        if cmd == "id" and conf().get("channel_type", "wx") not in ["wxy", "wechatmp"]:
-            continue
-        alias = ["#" + a for a in info["alias"][:1]]
-        help_text += f"{','.join(alias)} "
-        if "args" in info:
-            args = [a for a in info["args"]]
-            help_text += f"{' '.join(args)}"
-        help_text += f": {info['desc']}\n"
+        help_text += command.usage() + "\n"
 
     # 插件指令
     plugins = PluginManager().list_plugins()
@@ -209,20 +247,27 @@ def get_help_text(isadmin, isgroup):
         if plugins[plugin].enabled and not plugins[plugin].hidden:
             namecn = plugins[plugin].namecn
             help_text += "\n%s:" % namecn
-            help_text += PluginManager().instances[plugin].get_help_text(verbose=False).strip()
-
-    if ADMIN_COMMANDS and isadmin:
+            instance = PluginManager().instances.get(plugin)
+            if instance is not None:
+                help_text += instance.get_help_text(verbose=False).strip()
+            elif plugins[plugin].desc:
+                # 懒加载尚未导入的插件只显示清单中的描述，不为了帮助文本导入所有插件
+                help_text += plugins[plugin].desc.strip()
+
+    admin_commands = _visible_commands(admin=True)
+    if admin_commands and isadmin:
         help_text += "\n\n管理员指令：\n"
-        for cmd, info in ADMIN_COMMANDS.items():
-            alias = ["#" + a for a in info["alias"][:1]]
-            help_text += f"{','.join(alias)} "
-            if "args" in info:
-                args = [a for a in info["args"]]
-                help_text += f"{' '.join(args)}"
-            help_text += f": {info['desc']}\n"
+        for command in admin_commands:
+            help_text += command.usage() + "\n"
     return help_text
 
 
+def get_admin_help_text():
+    key = ("ahelp", _plugins_state())
+    lines = lambda: "\n".join(["管理员专属指令："] + [c.usage() for c in _visible_commands(admin=True)])
+    return CommandRouter().cached_help(key, lines)
+
+
 @plugins.register(
     name="Godcmd",
     desire_priority=999,
@@ -299,12 +344,7 @@ class Godcmd(Plugin):
             self.role_map = {}
             logger.error("[Godcmd] Error loading role map file %s: %s. Role switching will not be available.", role_map_path, e, exc_info=True)
 
-        custom_commands = conf().get("clear_memory_commands", [])
-        for custom_command in custom_commands:
-            if custom_command and custom_command.startswith("#"):
-                custom_command = custom_command[1:]
-                if custom_command and custom_command not in COMMANDS["reset"]["alias"]:
-                    COMMANDS["reset"]["alias"].append(custom_command)
+        self.register_commands()
 
         self.isrunning = True  # 机器人是否运行中
 
@@ -344,15 +384,12 @@ class Godcmd(Plugin):
                 isadmin = True
             ok = False
             result = "string"
-            if any(cmd_alias in info["alias"] for info in COMMANDS.values() for cmd_alias in ([cmd] if isinstance(cmd, str) else cmd)):
-                # Find the canonical command name for the given alias
-                canonical_cmd = ""
-                for c_name, c_info in COMMANDS.items():
-                    if cmd in c_info["alias"]:
-                        canonical_cmd = c_name
-                        break
-                
-                if canonical_cmd == "help":
+            command = CommandRouter().resolve(cmd)
+            if command is not None and not command.admin:
+                canonical_cmd = command.name
+                if command.handler is not None:
+                    ok, result = self.run_plugin_command(command, e_context, args)
+                elif canonical_cmd == "help":
                     if len(args) == 0: # #help, #帮助, #功能列表 (no arguments)
                         ok, result = True, self.fixed_help_text_from_file
                     else: # #help <plugin_name>, #帮助 <plugin_name>, etc.
@@ -365,7 +402,10 @@ class Godcmd(Plugin):
                             # Case insensitive compare for plugin name and its Chinese name (if exists)
                             if query_name == name.upper() or \
                                (hasattr(plugincls, 'namecn') and plugincls.namecn and query_name == plugincls.namecn.upper()):
-                                ok, result = True, PluginManager().instances[name].get_help_text(isgroup=isgroup, isadmin=isadmin, verbose=True)
+                                instance = PluginManager().get_instance(name)
+                                if instance is None:
+                                    break
+                                ok, result = True, instance.get_help_text(isgroup=isgroup, isadmin=isadmin, verbose=True)
                                 found_plugin = True
                                 break
                         if not found_plugin:
@@ -523,7 +563,7 @@ class Godcmd(Plugin):
                         logger.error(f"[Godcmd] Error processing modellist: {e}")
                         ok, result = False, f"处理 #modellist 指令时发生内部错误: {str(e)[:100]}"
                 logger.debug("[Godcmd] command: %s by %s" % (canonical_cmd, user))
-            elif any(cmd_alias in info["alias"] for info in ADMIN_COMMANDS.values() for cmd_alias in ([cmd] if isinstance(cmd, str) else cmd)):
+            elif command is not None:
                 if isadmin:
                     if isgroup: # All admin commands are private chat only by default
                         ok, result = False, "群聊不可执行管理员指令"
@@ -531,24 +571,11 @@ class Godcmd(Plugin):
                         e_context.action = EventAction.BREAK_PASS
                         return # Important to return to prevent further processing
 
-                    canonical_admin_cmd = ""
-                    for ac_name, ac_info in ADMIN_COMMANDS.items():
-                        if cmd in ac_info["alias"]:
-                            canonical_admin_cmd = ac_name
-                            break
-                    
-                    if canonical_admin_cmd == "ahelp":
-                        admin_help_items = []
-                        admin_help_items.append("管理员专属指令：")
-                        for acmd_key, info_val in ADMIN_COMMANDS.items():
-                            alias_str = ["#" + a for a in info_val["alias"][:1]]
-                            line = f"{','.join(alias_str)} "
-                            if "args" in info_val:
-                                args_text = [a_arg for a_arg in info_val["args"]]
-                                line += f"{' '.join(args_text)}"
-                            line += f": {info_val['desc']}"
-                            admin_help_items.append(line)
-                        ok, result = True, "\n".join(admin_help_items)
+                    canonical_admin_cmd = command.name
+                    if command.handler is not None:
+                        ok, result = self.run_plugin_command(command, e_context, args)
+                    elif canonical_admin_cmd == "ahelp":
+                        ok, result = True, get_admin_help_text()
                     elif canonical_admin_cmd == "stop":
                         self.isrunning = False
                         ok, result = True, "服务已暂停"
@@ -557,6 +584,7 @@ class Godcmd(Plugin):
                         ok, result = True, "服务已恢复"
                     elif canonical_admin_cmd == "reconf":
                         load_config()
+                        self.register_commands()
                         ok, result = True, "配置已重载"
                     elif canonical_admin_cmd == "resetall":
                         if bottype in [const.OPEN_AI, const.CHATGPT, const.CHATGPTONAZURE, const.LINKAI, const.DIFY, const.COZE,
@@ -584,6 +612,19 @@ class Godcmd(Plugin):
                                 result += "已启用\n"
                             else:
                                 result += "未启用\n"
+                    elif canonical_admin_cmd == "pstat":
+                        profiler = PluginManager().profiler
+                        if len(args) == 1 and args[0].lower() == "reset":
+                            profiler.reset()
+                            ok, result = True, "插件耗时统计已清空"
+                        elif len(args) == 1 and args[0].lower() == "import":
+                            ok, result = True, PluginManager().import_report()
+                        else:
+                            ok, result = True, profiler.report(args[0].upper() if args else None)
+                    elif canonical_admin_cmd == "stats":
+                        ok, result = ops.stats_report(channel, args[0].lower() if args else None)
+                    elif canonical_admin_cmd == "tune":
+                        ok, result = ops.tune(args)
                     elif canonical_admin_cmd == "scanp":
                         new_plugins = PluginManager().scan_plugins()
                         ok, result = True, "插件扫描完成"
@@ -607,6 +648,7 @@ class Godcmd(Plugin):
                             ok, result = False, "请提供插件名"
                         else:
                             ok = PluginManager().reload_plugin(args[0])
+                            CommandRouter().invalidate_help()
                             if ok:
                                 result = "插件配置已重载"
                             else:
@@ -661,6 +703,31 @@ class Godcmd(Plugin):
         elif not self.isrunning:
             e_context.action = EventAction.BREAK_PASS
 
+    def register_commands(self):
+        """把内置指令编译进指令路由，配置的clear_memory_commands作为#reset的别名，重载配置后需要重新调用"""
+        router = CommandRouter()
+        for name, info in COMMANDS.items():
+            alias = list(info["alias"])
+            if name == "reset":
+                for custom_command in conf().get("clear_memory_commands", []):
+                    if custom_command and custom_command.startswith("#") and custom_command[1:] not in alias:
+                        alias.append(custom_command[1:])
+            router.register(name, [a for a in alias if a], info.get("args"), info["desc"],
+                            hidden=name in HIDDEN_COMMANDS, owner=self.name)
+        for name, info in ADMIN_COMMANDS.items():
+            router.register(name, info["alias"], info.get("args"), info["desc"], admin=True, owner=self.name)
+
+    def run_plugin_command(self, command, e_context, args) -> Tuple[bool, str]:
+        """执行其他插件注册的指令，所属插件被禁用时不执行"""
+        plugincls = PluginManager().list_plugins().get(command.owner.upper()) if command.owner else None
+        if plugincls is None or not plugincls.enabled:
+            return False, f"指令#{command.alias[0]}所属的插件未启用"
+        try:
+            return command.handler(e_context, args)
+        except Exception as e:
+            logger.error(f"[Godcmd] command {command.name} of {command.owner} failed: {e}", exc_info=True)
+            return False, f"指令执行失败: {e}"
+
     def authenticate(self, userid, args, isadmin, isgroup) -> Tuple[bool, str]:
         if isgroup:
             return False, "请勿在群聊中认证"
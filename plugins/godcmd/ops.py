@@ -0,0 +1,191 @@
+# encoding:utf-8
+
+"""
+管理员运维指令：
+1. #stats 查看实时运行状态：消息线程池和会话队列、bot会话内存、缓存命中率、bot和插件耗时、限流器
+2. #tune 运行时调整线程池大小、限流和日志级别，不需要重启，重启后恢复配置文件中的值
+"""
+
+from bridge.bridge import Bridge
+from common import rate_limiter
+from common.log import set_logger_level
+from common.response_cache import get_response_cache
+from config import conf
+from plugins import PluginManager
+
+STAT_SECTIONS = {
+    "pool": "消息线程池和会话队列",
+    "session": "bot会话",
+    "cache": "缓存",
+    "bot": "bot耗时",
+    "plugin": "插件耗时",
+    "limit": "限流",
+}
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+MAX_POOL_SIZE = 64
+MAX_SESSION_CONCURRENCY = 16
+RATE_LIMIT_FIELDS = {"rpm": "rpm", "tpm": "tpm", "concurrency": "max_concurrency"}
+
+TUNE_USAGE = "\n".join(
+    [
+        "用法：",
+        f"#tune pool <1-{MAX_POOL_SIZE}>: 消息处理线程池大小",
+        f"#tune session <1-{MAX_SESSION_CONCURRENCY}>: 单个会话同时处理的消息数，对新会话生效",
+        "#tune rate <后端> <rpm|tpm|concurrency> <数值>: 后端限流，0表示不限制",
+        f"#tune log <{'|'.join(LOG_LEVELS)}>: 日志级别",
+    ]
+)
+
+
+def _ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+
+def _size(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def _rate(stats):
+    lookups = stats.get("hits", 0) + stats.get("misses", 0)
+    return f"{stats['hits'] / lookups:.0%}" if lookups else "-"
+
+
+def _pool_lines(channel):
+    if not hasattr(channel, "get_queue_stats"):
+        return ["当前通道没有消息处理线程池"]
+    s = channel.get_queue_stats()
+    lines = [
+        f"线程池: 大小{s['pool_size']} 线程{s['pool_threads']} 执行中{s['running']} 等待线程{s['pool_queued']}",
+        f"会话队列: 会话{s['sessions']} 待处理消息{s['pending']}",
+    ]
+    lines += [f"  {session_id}: 积压{n}" for session_id, n in s["busiest"]]
+    return lines
+
+
+def _chat_bots():
+    bridge = Bridge()
+    bots = {}
+    if bridge.bots.get("chat") is not None:
+        bots[bridge.get_bot_type("chat")] = bridge.bots["chat"]
+    for bot_type, bot in bridge.chat_bots.items():
+        bots.setdefault(bot_type, bot)
+    return bots
+
+
+def _session_lines():
+    lines = []
+    for bot_type, bot in _chat_bots().items():
+        sessions = getattr(bot, "sessions", None)
+        if sessions is None or not hasattr(sessions, "get_stats"):
+            continue
+        s = sessions.get_stats()
+        line = f"{bot_type}: 会话{s['sessions']} 约{_size(s.get('bytes', 0))}"
+        if "spilled" in s:
+            line += f" 落盘{s['spilled']} 命中率{_rate(s)} 淘汰{s['evictions']}"
+        lines.append(line)
+    return lines or ["暂无会话"]
+
+
+def _cache_lines(channel):
+    lines = []
+    if hasattr(channel, "get_cache_stats"):
+        for kind, s in channel.get_cache_stats().items():
+            hit_rate = "-" if s["hit_rate"] is None else f"{s['hit_rate']:.0%}"
+            line = f"{kind}缓存: 文件{s['files']} {_size(s['bytes'])} 命中{s['hits']} 未命中{s['misses']} 命中率{hit_rate}"
+            if "downloading" in s:
+                line += f" 下载中{s['downloading']}"
+            lines.append(line)
+    s = get_response_cache().stats()
+    lines.append(f"插件响应缓存: 条目{s['size']} {_size(s['bytes'])} 命中率{_rate(s)}")
+    return lines
+
+
+def _bot_lines():
+    stats = Bridge().get_latency_stats()
+    if not stats:
+        return ["暂无bot耗时统计"]
+    lines = []
+    for name, s in stats.items():
+        line = f"{name}: 成功{s['success']} 失败{s['failure']} p50 {_ms(s['p50'])} p95 {_ms(s['p95'])}"
+        if "state" in s:
+            line += f" 执行中{s['in_flight']} 熔断{s['state']}"
+        lines.append(line)
+    return lines
+
+
+def _limit_lines():
+    stats = rate_limiter.all_stats()
+    if not stats:
+        return ["暂无限流器"]
+    return [
+        f"{name}: 执行中{s['in_flight']} 等待{s['waiting']} 平均等待{_ms(s['avg_wait'])} "
+        f"最长等待{_ms(s['max_wait'])} 超时{s['timeouts']}"
+        for name, s in stats.items()
+    ]
+
+
+def stats_report(channel, section=None):
+    """生成运行状态报告，section为空时输出全部"""
+    if section and section not in STAT_SECTIONS:
+        return False, f"未知的统计项：{section}，可选：{', '.join(STAT_SECTIONS)}"
+    builders = {
+        "pool": lambda: _pool_lines(channel),
+        "session": _session_lines,
+        "cache": lambda: _cache_lines(channel),
+        "bot": _bot_lines,
+        "plugin": lambda: PluginManager().profiler.report().splitlines(),
+        "limit": _limit_lines,
+    }
+    lines = []
+    for name in [section] if section else STAT_SECTIONS:
+        lines.append(f"【{STAT_SECTIONS[name]}】")
+        lines += builders[name]()
+    return True, "\n".join(lines)
+
+
+def _parse_int(value, low, high):
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    return number if low <= number <= high else None
+
+
+def tune(args):
+    """运行时调优，返回(是否成功, 结果)"""
+    if not args:
+        return False, TUNE_USAGE
+    target = args[0].lower()
+    if target == "pool" and len(args) == 2:
+        size = _parse_int(args[1], 1, MAX_POOL_SIZE)
+        if size is None:
+            return False, f"线程池大小需要在1-{MAX_POOL_SIZE}之间"
+        from channel import chat_channel
+
+        chat_channel.resize_handler_pool(size)
+        return True, f"消息线程池大小已设置为{size}"
+    if target == "session" and len(args) == 2:
+        concurrency = _parse_int(args[1], 1, MAX_SESSION_CONCURRENCY)
+        if concurrency is None:
+            return False, f"会话并发数需要在1-{MAX_SESSION_CONCURRENCY}之间"
+        conf()["concurrency_in_session"] = concurrency
+        return True, f"新会话的并发数已设置为{concurrency}"
+    if target == "rate" and len(args) == 4:
+        # 也接受#stats limit中显示的 后端:key 形式
+        backend, field = args[1].split(":")[0], args[2].lower()
+        value = _parse_int(args[3], 0, 1000000)
+        if field not in RATE_LIMIT_FIELDS or value is None:
+            return False, TUNE_USAGE
+        affected = rate_limiter.set_limits(backend, **{RATE_LIMIT_FIELDS[field]: value})
+        return True, f"{backend}的{field}已设置为{value or '不限制'}，立即生效的限流器{affected}个"
+    if target == "log" and len(args) == 2:
+        level = args[1].upper()
+        if level not in LOG_LEVELS:
+            return False, f"日志级别可选：{', '.join(LOG_LEVELS)}"
+        set_logger_level(level)
+        return True, f"日志级别已设置为{level}"
+    return False, TUNE_USAGE
@@ -1,7 +1,12 @@
 import os
 import json
+import asyncio
+from bridge.reply import Reply, ReplyType
+from common import async_runtime
 from config import pconf, plugin_config, conf, write_plugin_config
 from common.log import logger
+from plugins.command_router import CommandRouter
+from plugins.event import EventAction
 
 
 class Plugin:
@@ -48,5 +53,72 @@ class Plugin:
     def get_help_text(self, **kwargs):
         return "暂无帮助信息"
 
+    def get_triggers(self):
+        """
+        插件处理ON_HANDLE_CONTEXT事件的触发条件，用于在分发前过滤消息
+        默认使用注册时声明的条件，触发词来自插件配置的插件可以重写该方法
+        :return: dict，可包含 context_types / prefixes / keywords / regexes，返回None表示不过滤
+        """
+        return getattr(self, "triggers", None)
+
+    def register_command(self, name, alias, handler, desc="", args=None, admin=False, hidden=False):
+        """
+        注册#指令，由Godcmd统一解析分发，指令会出现在#help中
+        :param alias: 别名列表，不含#前缀
+        :param handler: handler(e_context, args) -> (ok, result)，result为回复文本
+        :param admin: 为True时只有管理员能在私聊中执行
+        开启插件懒加载时，指令在插件第一次被实例化后才会注册
+        """
+        return CommandRouter().register(
+            name, alias, args=args, desc=desc, admin=admin, hidden=hidden, owner=self.name, handler=handler
+        )
+
+    def run_in_background(self, e_context, job, *args, ack=None, **kwargs):
+        """
+        把耗时的处理放到后台执行并立即结束本次事件，不再占用消息处理线程，处理完成后再发送回复
+        :param job: 返回Reply(或None表示不回复)的函数，可以是async函数(在共享事件循环中执行)或普通函数(在后台任务线程池中执行)
+        :param ack: 立即发送的提示，文本或Reply
+        :return: concurrent.futures.Future
+        """
+        channel = e_context["channel"]
+        context = e_context["context"]
+        if ack:
+            self.send_reply(channel, context, ack if isinstance(ack, Reply) else Reply(ReplyType.TEXT, ack))
+        e_context["reply"] = Reply()
+        e_context.action = EventAction.BREAK_PASS
+
+        if asyncio.iscoroutinefunction(job):
+            future = async_runtime.submit(job(*args, **kwargs))
+        else:
+            future = async_runtime.run_job(job, *args, **kwargs)
+
+        def on_done(f):
+            try:
+                reply = f.result()
+            except Exception as e:
+                logger.error(f"[{self.name}] background job failed: {e}", exc_info=True)
+                reply = Reply(ReplyType.ERROR, f"处理失败: {e}")
+            if reply and reply.type:
+                self.send_reply(channel, context, reply)
+
+        # 回调可能运行在事件循环线程中，发送回复是阻塞操作，统一交给后台任务线程池
+        future.add_done_callback(lambda f: async_runtime.run_job(on_done, f))
+        return future
+
+    def send_reply(self, channel, context, reply):
+        """在正常的回复流程之外主动发送回复，会经过装饰和ON_SEND_REPLY等插件事件"""
+        try:
+            if hasattr(channel, "_decorate_reply") and hasattr(channel, "_send_reply"):
+                reply = channel._decorate_reply(context, reply)
+                channel._send_reply(context, reply)
+            else:
+                channel.send(reply, context)
+        except Exception as e:
+            logger.error(f"[{self.name}] send reply failed: {e}", exc_info=True)
+
     def reload(self):
         pass
+
+    def unload(self):
+        """实例被重载、重新启用或卸载时调用，需要停止实例创建的定时器和后台线程，避免旧实例一直驻留"""
+        pass
@@ -0,0 +1,50 @@
+# encoding:utf-8
+
+"""
+插件触发条件预过滤：插件在注册时(或通过get_triggers)声明关心的消息类型和触发词，
+PluginManager在分发ON_HANDLE_CONTEXT事件前先用预编译的条件过滤，不匹配的插件不会被调用
+"""
+
+import re
+
+from common.trigger_matcher import KeywordMatcher, PrefixTrie
+
+
+class PluginFilter(object):
+    def __init__(self, context_types=None, prefixes=None, keywords=None, regexes=None):
+        self.context_types = frozenset(context_types) if context_types else None
+        self.prefixes = PrefixTrie(prefixes) if prefixes else None
+        self.keywords = KeywordMatcher(keywords) if keywords else None
+        self.regexes = [re.compile(r) for r in regexes] if regexes else None
+        self.has_content_triggers = bool(self.prefixes or self.keywords or self.regexes)
+
+    @classmethod
+    def build(cls, triggers):
+        """根据插件声明的触发条件构建过滤器，没有声明任何条件时返回None，表示总是调用"""
+        if not triggers:
+            return None
+        f = cls(
+            triggers.get("context_types"),
+            triggers.get("prefixes"),
+            triggers.get("keywords"),
+            triggers.get("regexes"),
+        )
+        if f.context_types is None and not f.has_content_triggers:
+            return None
+        return f
+
+    def accepts(self, context):
+        if self.context_types is not None and context.type not in self.context_types:
+            return False
+        if not self.has_content_triggers:
+            return True
+        content = context.content
+        if not isinstance(content, str):
+            return True  # 触发词只对文本有意义，其他内容交给插件自己判断
+        if self.prefixes is not None and self.prefixes.match(content.lstrip()) is not None:
+            return True
+        if self.keywords is not None and self.keywords.search(content):
+            return True
+        if self.regexes is not None and any(r.search(content) for r in self.regexes):
+            return True
+        return False
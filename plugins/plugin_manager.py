@@ -1,17 +1,25 @@
 # encoding:utf-8
 
+import asyncio
 import importlib
 import importlib.util
 import json
 import os
 import sys
+import threading
+import time
 
+from bridge.reply import Reply
+from common import async_runtime
 from common.log import logger
 from common.singleton import singleton
 from common.sorted_dict import SortedDict
-from config import conf, remove_plugin_config, write_plugin_config
+from config import conf, get_cache_dir, refresh_conf_snapshot, remove_plugin_config, write_plugin_config
 
 from .event import *
+from .plugin_filter import PluginFilter
+from .plugin_manifest import PluginManifest, describe_plugin, make_stub, plugin_fingerprint
+from .plugin_profiler import PluginProfiler
 
 
 @singleton
@@ -23,6 +31,12 @@ class PluginManager:
         self.pconf = {}
         self.current_plugin_path = None
         self.loaded = {}
+        self.profiler = PluginProfiler()  # 插件事件处理耗时统计
+        self.filters = {}  # 插件名 -> PluginFilter，ON_HANDLE_CONTEXT事件分发前的预过滤条件
+        self.fingerprints = {}  # 插件目录 -> 导入时的文件指纹，用于判断#scanp时是否需要重新导入
+        self.import_times = {}  # 插件目录名 -> 最近一次导入模块的耗时(秒)
+        self.manifest = None  # 插件清单缓存，启用懒加载时使用
+        self._import_lock = threading.RLock()  # 导入插件时current_plugin_path是全局状态，需要串行
 
     def register(self, name: str, desire_priority: int = 0, **kwargs):
         def wrapper(plugincls):
@@ -35,6 +49,9 @@ class PluginManager:
             plugincls.namecn = kwargs.get("namecn") if kwargs.get("namecn") != None else name
             plugincls.hidden = kwargs.get("hidden") if kwargs.get("hidden") != None else False
             plugincls.enabled = kwargs.get("enabled") if kwargs.get("enabled") != None else True
+            # 可选的触发条件声明：context_types / prefixes / keywords / regexes
+            triggers = {k: kwargs[k] for k in ("context_types", "prefixes", "keywords", "regexes") if kwargs.get(k)}
+            plugincls.triggers = triggers or None
             if self.current_plugin_path == None:
                 raise Exception("Plugin path not set")
             self.plugins[name.upper()] = plugincls
@@ -84,31 +101,63 @@ class PluginManager:
         except Exception as e:
             logger.error(e)
 
+    def _lazy_enabled(self):
+        return conf().get("plugin_lazy_load", False)
+
+    def _import_plugin(self, plugin_name, plugin_path, reload=False):
+        """导入或重新导入插件模块及其子模块，记录耗时"""
+        import_path = "plugins.{}".format(plugin_name)
+        start = time.perf_counter()
+        with self._import_lock:
+            self.current_plugin_path = plugin_path
+            try:
+                if reload:
+                    logger.info("reload module %s" % plugin_name)
+                    self.loaded[plugin_path] = importlib.reload(sys.modules[import_path])
+                    dependent_module_names = [name for name in sys.modules.keys() if name.startswith(import_path + ".")]
+                    for name in dependent_module_names:
+                        logger.info("reload module %s" % name)
+                        importlib.reload(sys.modules[name])
+                else:
+                    self.loaded[plugin_path] = importlib.import_module(import_path)
+            finally:
+                self.current_plugin_path = None
+        cost = time.perf_counter() - start
+        self.import_times[plugin_name] = cost
+        logger.info("Plugin module %s imported in %.0fms" % (plugin_name, cost * 1000))
+
     def scan_plugins(self):
         logger.info("Scaning plugins ...")
         plugins_dir = "./plugins"
         raws = [self.plugins[name] for name in self.plugins]
+        lazy = self._lazy_enabled()
+        if self.manifest is None:
+            # 清单总是维护，开启懒加载后下次启动即可使用
+            self.manifest = PluginManifest(os.path.join(get_cache_dir(), "plugin_manifest.json"))
         for plugin_name in os.listdir(plugins_dir):
             plugin_path = os.path.join(plugins_dir, plugin_name)
             if os.path.isdir(plugin_path):
                 # 判断插件是否包含同名__init__.py文件
                 main_module_path = os.path.join(plugin_path, "__init__.py")
                 if os.path.isfile(main_module_path):
-                    # 导入插件
-                    import_path = "plugins.{}".format(plugin_name)
+                    fingerprint = plugin_fingerprint(plugin_path)
+                    # 已导入且文件没有变化的插件不再重新导入
+                    if self.fingerprints.get(plugin_path) == fingerprint:
+                        continue
                     try:
-                        self.current_plugin_path = plugin_path
-                        if plugin_path in self.loaded:
+                        if self.loaded.get(plugin_path) is not None:
                             if plugin_name.upper() != 'GODCMD':
-                                logger.info("reload module %s" % plugin_name)
-                                self.loaded[plugin_path] = importlib.reload(sys.modules[import_path])
-                                dependent_module_names = [name for name in sys.modules.keys() if name.startswith(import_path + ".")]
-                                for name in dependent_module_names:
-                                    logger.info("reload module %s" % name)
-                                    importlib.reload(sys.modules[name])
+                                self._import_plugin(plugin_name, plugin_path, reload=True)
                         else:
-                            self.loaded[plugin_path] = importlib.import_module(import_path)
-                        self.current_plugin_path = None
+                            entries = self.manifest.get(plugin_path, fingerprint) if lazy else None
+                            if entries and plugin_name.upper() != 'GODCMD':
+                                # 清单有效，注册占位类，推迟到第一次需要时再导入
+                                for entry in entries:
+                                    self.plugins[entry["name"].upper()] = make_stub(entry, plugin_path, "plugins.{}".format(plugin_name))
+                                logger.info("Plugin %s registered lazily from manifest" % plugin_name)
+                            else:
+                                self._import_plugin(plugin_name, plugin_path)
+                        self.fingerprints[plugin_path] = fingerprint
                     except Exception as e:
                         logger.warn("Failed to import plugin %s: %s" % (plugin_name, e))
                         continue
@@ -144,6 +193,15 @@ class PluginManager:
             if plugincls.enabled:
                 if 'GODCMD' in self.instances and name == 'GODCMD':
                     continue
+                if getattr(plugincls, "lazy", False):
+                    if plugincls.events is None:
+                        # 记录清单时插件未启用，不知道监听的事件，启用时直接加载
+                        self.get_instance(name)
+                        continue
+                    # 懒加载的插件只按清单登记监听的事件和触发条件，第一次分发到它时再创建实例
+                    self._listen(name, plugincls.events)
+                    self._build_filter(name, plugincls)
+                    continue
                 # if name not in self.instances:
                 try:
                     instance = plugincls()
@@ -153,25 +211,115 @@ class PluginManager:
                     failed_plugins.append(name)
                     continue
                 if name in self.instances:
-                    self.instances[name].handlers.clear()
+                    self._retire_instance(self.instances[name])
                 self.instances[name] = instance
-                for event in instance.handlers:
-                    if event not in self.listening_plugins:
-                        self.listening_plugins[event] = []
-                    self.listening_plugins[event].append(name)
+                self._build_filter(name, instance)
+                self._listen(name, instance.handlers)
         self.refresh_order()
+        refresh_conf_snapshot()  # 插件初始化时可能修改全局配置，重新生成配置快照
+        self._save_manifest()
         return failed_plugins
 
+    def _retire_instance(self, instance):
+        """插件实例被新实例替换或卸载时调用，停止旧实例的定时器、后台线程等"""
+        instance.handlers.clear()
+        try:
+            instance.unload()
+        except Exception as e:
+            logger.warn("Failed to unload plugin %s: %s" % (instance.name, e))
+
+    def _listen(self, name, events):
+        for event in events:
+            if event not in self.listening_plugins:
+                self.listening_plugins[event] = []
+            if name not in self.listening_plugins[event]:
+                self.listening_plugins[event].append(name)
+
+    def _save_manifest(self):
+        """记录已创建实例的插件目录，目录中所有启用的插件都有实例时才能写入清单，未启用的插件只记录注册信息"""
+        if self.manifest is None:
+            return
+        by_path = {}
+        for name, plugincls in self.plugins.items():
+            by_path.setdefault(plugincls.path, []).append((name, plugincls))
+        for path, members in by_path.items():
+            if path not in self.fingerprints or any(getattr(cls, "lazy", False) for _, cls in members):
+                continue
+            if all(name in self.instances or not cls.enabled for name, cls in members):
+                entries = [describe_plugin(cls, self.instances.get(name)) for name, cls in members]
+                self.manifest.put(path, self.fingerprints[path], entries)
+            else:
+                self.manifest.discard(path)
+        self.manifest.save()
+
+    def get_instance(self, name):
+        """获取插件实例，懒加载的插件在第一次调用时导入并创建实例，失败时返回None"""
+        instance = self.instances.get(name)
+        if instance is not None:
+            return instance
+        plugincls = self.plugins.get(name)
+        if plugincls is None or not getattr(plugincls, "lazy", False):
+            return None
+        with self._import_lock:
+            if name in self.instances:
+                return self.instances[name]
+            stub = self.plugins[name]
+            plugin_name = stub.module.split(".", 1)[1]
+            try:
+                # 模块可能已被其他插件导入过，这时需要重新执行才能注册插件类
+                self._import_plugin(plugin_name, stub.path, reload=stub.module in sys.modules)
+                plugincls = self.plugins[name]
+                if getattr(plugincls, "lazy", False):
+                    raise Exception("plugin %s not registered by module %s" % (name, stub.module))
+                # 保留plugins.json中的开关和优先级
+                plugincls.enabled = stub.enabled
+                plugincls.priority = stub.priority
+                self.plugins._update_heap(name)
+                instance = plugincls()
+            except Exception as e:
+                logger.warn("Failed to load lazy plugin %s, disabled. %s" % (name, e))
+                self.plugins[name].enabled = False
+                return None
+            self.instances[name] = instance
+            self._build_filter(name, instance)
+            # 清单中记录的事件可能已经过时，以实例为准
+            for event, names in self.listening_plugins.items():
+                if name in names and event not in instance.handlers:
+                    names.remove(name)
+            self._listen(name, instance.handlers)
+            self.refresh_order()
+            logger.info("Plugin %s loaded on first use" % name)
+            return instance
+
+    def import_report(self):
+        if not self.import_times:
+            return "暂无插件导入耗时"
+        lines = ["插件导入耗时(毫秒)："]
+        for name, cost in sorted(self.import_times.items(), key=lambda item: -item[1]):
+            lines.append(f"{name}: {cost * 1000:.0f}")
+        lazy = [plugincls.name for plugincls in self.plugins.values() if getattr(plugincls, "lazy", False)]
+        if lazy:
+            lines.append("尚未加载：" + ", ".join(lazy))
+        return "\n".join(lines)
+
+    def _build_filter(self, name, instance):
+        try:
+            triggers = instance.get_triggers() if hasattr(instance, "get_triggers") else instance.triggers
+            self.filters[name] = PluginFilter.build(triggers)
+        except Exception as e:
+            logger.warn("Failed to build trigger filter for %s, fallback to always dispatch. %s" % (name, e))
+            self.filters[name] = None
+
     def reload_plugin(self, name: str):
         name = name.upper()
+        if name in self.plugins and getattr(self.plugins[name], "lazy", False):
+            return True  # 尚未加载，第一次使用时会读取最新配置
         remove_plugin_config(name)
         if name in self.instances:
             for event in self.listening_plugins:
                 if name in self.listening_plugins[event]:
                     self.listening_plugins[event].remove(name)
-            if name in self.instances:
-                self.instances[name].handlers.clear()
-            del self.instances[name]
+            self._retire_instance(self.instances.pop(name))
             self.activate_plugins()
             return True
         return False
@@ -190,16 +338,140 @@ class PluginManager:
 
     def emit_event(self, e_context: EventContext, *args, **kwargs):
         if e_context.event in self.listening_plugins:
-            for name in self.listening_plugins[e_context.event]:
+            profiling = conf().get("plugin_profiling", True)
+            prefilter = e_context.event == Event.ON_HANDLE_CONTEXT and conf().get("plugin_prefilter", True)
+            # 懒加载插件第一次创建实例时会修改监听列表，遍历副本
+            names = list(self.listening_plugins[e_context.event])
+            resume = self._pop_resume(e_context)
+            if resume is not None:
+                # async处理函数结束后继续处理：跳过已经执行过的插件，处理函数结束了事件时跳过全部插件
+                after, broken = resume
+                if broken:
+                    names = []
+                elif after in names:
+                    names = names[names.index(after) + 1:]
+            for name in names:
                 if self.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
+                    if prefilter:
+                        # 每次调用前检查，前面的插件可能修改了context的类型或内容
+                        plugin_filter = self.filters.get(name)
+                        if plugin_filter is not None and not plugin_filter.accepts(e_context["context"]):
+                            continue
                     logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
-                    instance = self.instances[name]
-                    instance.handlers[e_context.event](e_context, *args, **kwargs)
+                    instance = self.get_instance(name)
+                    if instance is None or e_context.event not in instance.handlers:
+                        continue
+                    if self._detach_async(name, instance.handlers[e_context.event], e_context, profiling, *args, **kwargs):
+                        e_context["breaked_by"] = name
+                        break
+                    if profiling:
+                        self._profiled_call(name, instance.handlers[e_context.event], e_context, *args, **kwargs)
+                    else:
+                        self._call_handler(instance.handlers[e_context.event], e_context, *args, **kwargs)
                     if e_context.is_break():
                         e_context["breaked_by"] = name
                         logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
         return e_context
 
+    def _profiled_call(self, name, handler, e_context, *args, **kwargs):
+        """调用插件处理函数并记录耗时，超出时间预算时告警或自动禁用插件"""
+        start = time.perf_counter()
+        error = True
+        try:
+            self._call_handler(handler, e_context, *args, **kwargs)
+            error = False
+        finally:
+            self._record_cost(name, e_context.event, time.perf_counter() - start, error)
+
+    def _record_cost(self, name, event, cost, error):
+        budgets = conf().get("plugin_time_budgets", {}) or {}
+        budget = budgets.get(self.plugins[name].name, budgets.get("default"))
+        strikes = self.profiler.record(name, event, cost, error, budget)
+        if strikes:
+            logger.warning(
+                "[PluginManager] Plugin %s took %.3fs on %s, over budget %.3fs (%d in a row)"
+                % (name, cost, event, budget, strikes)
+            )
+            self._check_budget_strikes(name, strikes)
+
+    @staticmethod
+    def _call_handler(handler, e_context, *args, **kwargs):
+        """
+        调用插件处理函数，async处理函数在共享事件循环中执行
+        ON_HANDLE_CONTEXT以外的事件需要同步拿到结果(例如装饰后的回复)，只能等待协程结束
+        """
+        if asyncio.iscoroutinefunction(handler):
+            return async_runtime.run_sync(handler(e_context, *args, **kwargs))
+        return handler(e_context, *args, **kwargs)
+
+    @staticmethod
+    def _pop_resume(e_context):
+        if e_context.event != Event.ON_HANDLE_CONTEXT or "context" not in e_context.econtext:
+            return None
+        context = e_context["context"]
+        resume = context.get("plugin_resume")
+        if resume is not None:
+            del context["plugin_resume"]  # 只作用于这一次分发，之后由这条消息派生的context不受影响
+        return resume
+
+    def _detach_async(self, name, handler, e_context, profiling, *args, **kwargs):
+        """
+        ON_HANDLE_CONTEXT的async处理函数交给共享事件循环执行，不等待结果，消息处理线程立即返回，与run_in_background相同
+        处理函数结束后：结束事件(BREAK_PASS)时发送它设置的回复；否则从下一个插件继续分发，最后交给通道的默认处理逻辑
+        :return: 是否已交给事件循环
+        """
+        channel = e_context.econtext.get("channel")
+        if (
+            e_context.event != Event.ON_HANDLE_CONTEXT
+            or not asyncio.iscoroutinefunction(handler)
+            or not hasattr(channel, "_generate_reply")
+        ):
+            return False
+        # 处理函数在事件循环中修改的是自己的EventContext，与当前分发互不影响
+        detached = EventContext(e_context.event, dict(e_context.econtext))
+        start = time.perf_counter()
+        future = async_runtime.submit(handler(detached, *args, **kwargs))
+        e_context["reply"] = Reply()
+        e_context.action = EventAction.BREAK_PASS
+
+        def on_done(f):
+            error = True
+            try:
+                f.result()
+                error = False
+            except Exception as e:
+                logger.error("[PluginManager] async handler of plugin %s failed: %s" % (name, e), exc_info=True)
+            if profiling:
+                self._record_cost(name, detached.event, time.perf_counter() - start, error)
+            if not error:
+                self._finish_detached(name, channel, detached)
+
+        # 回调可能运行在事件循环线程中，继续处理和发送回复都是阻塞操作，统一交给后台任务线程池
+        future.add_done_callback(lambda f: async_runtime.run_job(on_done, f))
+        return True
+
+    @staticmethod
+    def _finish_detached(name, channel, e_context):
+        context = e_context["context"]
+        reply = e_context["reply"]
+        try:
+            if not e_context.is_pass():
+                context["plugin_resume"] = (name, e_context.is_break())
+                reply = channel._generate_reply(context, reply)
+            if reply and reply.content:
+                reply = channel._decorate_reply(context, reply)
+                channel._send_reply(context, reply)
+        except Exception as e:
+            logger.error("[PluginManager] failed to finish context after async handler of %s: %s" % (name, e), exc_info=True)
+
+    def _check_budget_strikes(self, name, strikes):
+        if conf().get("plugin_budget_action", "warn") != "disable" or name == "GODCMD":
+            return
+        if strikes >= conf().get("plugin_budget_strikes", 3):
+            # 只在运行时禁用，不写入plugins.json，可通过#enablep重新启用
+            self.plugins[name].enabled = False
+            logger.error("[PluginManager] Plugin %s disabled for exceeding its time budget %d times in a row" % (name, strikes))
+
     def set_plugin_priority(self, name: str, priority: int):
         name = name.upper()
         if name not in self.plugins:
@@ -221,6 +493,7 @@ class PluginManager:
             return False, "插件不存在"
         if not self.plugins[name].enabled:
             self.plugins[name].enabled = True
+            self.profiler.strikes.pop(name, None)  # 清空超时计数，避免被预算检查立即再次禁用
             rawname = self.plugins[name].name
             self.pconf["plugins"][rawname]["enabled"] = True
             self.save_config()
@@ -336,9 +609,12 @@ class PluginManager:
             for event in self.listening_plugins:
                 if name in self.listening_plugins[event]:
                     self.listening_plugins[event].remove(name)
+            if name in self.instances:
+                self._retire_instance(self.instances.pop(name))
             del self.plugins[name]
             del self.pconf["plugins"][rawname]
             self.loaded[dirname] = None
+            self.fingerprints.pop(dirname, None)
             self.save_config()
             return True, "卸载插件成功"
         except Exception as e:
@@ -0,0 +1,117 @@
+# encoding:utf-8
+
+"""
+插件清单缓存：记录每个插件目录注册的插件名、优先级、监听的事件和触发条件，
+启用懒加载时，插件目录没有变化就直接用清单注册占位类，等第一次有事件需要该插件时再导入模块、创建实例
+"""
+
+import json
+import os
+
+from bridge.context import ContextType
+from common.log import logger
+
+from .event import Event
+
+# 插件类上需要缓存的注册信息
+PLUGIN_ATTRS = ("name", "priority", "desc", "author", "version", "namecn", "hidden", "enabled")
+# 全局插件配置会影响插件的触发条件，修改后所有插件的清单都失效
+GLOBAL_CONFIG_FILES = ("./plugins/config.json",)
+
+
+def plugin_fingerprint(plugin_path):
+    """插件目录中源码和配置文件的最新修改时间和文件数，任何文件增删改都会改变指纹"""
+    latest, count = 0.0, 0
+    for root, dirs, files in os.walk(plugin_path):
+        dirs[:] = [d for d in dirs if d != "__pycache__" and not d.startswith(".")]
+        for filename in files:
+            if filename.endswith((".py", ".json")):
+                count += 1
+                latest = max(latest, os.path.getmtime(os.path.join(root, filename)))
+    for path in GLOBAL_CONFIG_FILES:
+        if os.path.exists(path):
+            latest = max(latest, os.path.getmtime(path))
+    return [latest, count]
+
+
+def _dump_triggers(triggers):
+    if not triggers:
+        return None
+    data = {}
+    for key, value in triggers.items():
+        if key == "context_types":
+            data[key] = [t.name for t in value]
+        elif key == "regexes":
+            data[key] = [getattr(r, "pattern", r) for r in value]
+        else:
+            data[key] = list(value)
+    return data
+
+
+def _load_triggers(data):
+    if not data:
+        return None
+    triggers = dict(data)
+    if "context_types" in triggers:
+        triggers["context_types"] = [ContextType[name] for name in triggers["context_types"]]
+    return triggers
+
+
+def describe_plugin(plugincls, instance=None):
+    """
+    生成插件的清单条目，触发条件使用实例的get_triggers，可能来自插件配置
+    未启用的插件没有实例，只记录类上的注册信息，events为None表示启用时需要导入后才能知道
+    """
+    entry = {attr: getattr(plugincls, attr, None) for attr in PLUGIN_ATTRS}
+    if instance is None:
+        entry["events"] = None
+        entry["triggers"] = None
+    else:
+        entry["events"] = [event.name for event in instance.handlers]
+        entry["triggers"] = _dump_triggers(instance.get_triggers())
+    return entry
+
+
+def make_stub(entry, plugin_path, import_path):
+    """根据清单条目创建占位插件类，属性与真实插件类一致，可以直接出现在插件列表中"""
+    attrs = {attr: entry.get(attr) for attr in PLUGIN_ATTRS}
+    attrs.update(
+        path=plugin_path,
+        module=import_path,
+        lazy=True,
+        events=None if entry.get("events") is None else [Event[name] for name in entry["events"]],
+        triggers=_load_triggers(entry.get("triggers")),
+    )
+    return type(entry["name"], (object,), attrs)
+
+
+class PluginManifest(object):
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}  # 插件目录 -> {"fingerprint": [...], "plugins": [清单条目]}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                logger.warn("Failed to load plugin manifest %s: %s" % (path, e))
+
+    def get(self, plugin_path, fingerprint):
+        """目录指纹一致时返回清单条目列表，否则返回None"""
+        entry = self.entries.get(plugin_path)
+        if entry is None or entry.get("fingerprint") != fingerprint:
+            return None
+        return entry.get("plugins")
+
+    def put(self, plugin_path, fingerprint, plugins):
+        self.entries[plugin_path] = {"fingerprint": fingerprint, "plugins": plugins}
+
+    def discard(self, plugin_path):
+        self.entries.pop(plugin_path, None)
+
+    def save(self):
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            logger.warn("Failed to save plugin manifest %s: %s" % (self.path, e))
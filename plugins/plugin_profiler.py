@@ -0,0 +1,104 @@
+# encoding:utf-8
+
+"""
+插件事件分发耗时统计：按 插件+事件 记录调用次数、异常次数和耗时直方图
+"""
+
+import threading
+from bisect import bisect_left
+
+# 直方图各桶的上界(毫秒)，最后一个桶记录超过最大上界的调用
+BUCKET_BOUNDS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 30000)
+
+
+class HandlerStats(object):
+    __slots__ = ("count", "errors", "total", "max", "over_budget", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0  # 总耗时(秒)
+        self.max = 0.0
+        self.over_budget = 0
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def add(self, cost, error=False, over_budget=False):
+        self.count += 1
+        self.total += cost
+        self.max = max(self.max, cost)
+        self.buckets[bisect_left(BUCKET_BOUNDS_MS, cost * 1000)] += 1
+        if error:
+            self.errors += 1
+        if over_budget:
+            self.over_budget += 1
+
+    def percentile(self, p):
+        """按直方图估算分位数，返回所在桶的上界(毫秒)"""
+        if not self.count:
+            return 0
+        target = self.count * p
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max * 1000
+        return self.max * 1000
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": self.max * 1000,
+            "over_budget": self.over_budget,
+        }
+
+
+class PluginProfiler(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}  # (插件名, 事件) -> HandlerStats
+        self.strikes = {}  # 插件名 -> 连续超出时间预算的次数
+
+    def record(self, plugin, event, cost, error=False, budget=None):
+        """
+        记录一次调用
+        :return: 该插件连续超出时间预算的次数，没有超出时为0
+        """
+        over_budget = budget is not None and cost > budget
+        with self.lock:
+            stats = self.stats.get((plugin, event))
+            if stats is None:
+                stats = self.stats[(plugin, event)] = HandlerStats()
+            stats.add(cost, error, over_budget)
+            strikes = self.strikes.get(plugin, 0) + 1 if over_budget else 0
+            self.strikes[plugin] = strikes
+            return strikes
+
+    def snapshot(self, plugin=None):
+        with self.lock:
+            return {
+                key: stats.snapshot()
+                for key, stats in self.stats.items()
+                if plugin is None or key[0] == plugin
+            }
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.strikes.clear()
+
+    def report(self, plugin=None):
+        snapshot = self.snapshot(plugin)
+        if not snapshot:
+            return "暂无插件耗时统计"
+        lines = ["插件耗时统计(毫秒)："]
+        # 按总耗时排序，最需要关注的插件排在前面
+        for (name, event), s in sorted(snapshot.items(), key=lambda item: -item[1]["avg_ms"] * item[1]["count"]):
+            lines.append(
+                f"{name} {event.name}: 次数{s['count']} 平均{s['avg_ms']:.1f} p50≤{s['p50_ms']:.0f} "
+                f"p95≤{s['p95_ms']:.0f} 最大{s['max_ms']:.0f} 超时{s['over_budget']} 异常{s['errors']}"
+            )
+        return "\n".join(lines)
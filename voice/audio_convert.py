@@ -2,21 +2,20 @@ import os
 import shutil
 import wave
 
+from common.lazy_import import lazy_import, module_available
 from common.log import logger
 
-try:
-    import pysilk
-except ImportError:
+# 语音转换依赖只在处理语音时导入，避免拖慢启动
+pysilk = lazy_import("pysilk", optional=True)
+if pysilk is None:
     logger.debug("import pysilk failed, wechaty voice message will not be supported.")
 
-try:
-    from pydub import AudioSegment
-except ImportError:
+pydub = lazy_import("pydub")
+if not module_available("pydub"):
     logger.warning("import pydub failed, wechat voice conversion will not be supported. Try: pip install pydub")
 
-try:
-    import pilk
-except ImportError:
+pilk = lazy_import("pilk", optional=True)
+if pilk is None:
     logger.warning("import pilk failed, silk voice conversion will not be supported. Try: pip install pilk")
 
 sil_supports = [8000, 12000, 16000, 24000, 32000, 44100, 48000]  # slk转wav时，支持的采样率
@@ -71,7 +70,7 @@ def any_to_mp3(any_path, mp3_path):
             
             # 再用pydub把PCM转成MP3
             # TODO: 下面的参数可能需要调整
-            audio = AudioSegment.from_raw(pcm_path, format="raw", 
+            audio = pydub.AudioSegment.from_raw(pcm_path, format="raw", 
                                         frame_rate=24000,
                                         channels=1,
                                         sample_width=2)  # 16-bit PCM = 2 bytes
@@ -83,7 +82,7 @@ def any_to_mp3(any_path, mp3_path):
             return
         
         # 其他格式使用pydub转换
-        audio = AudioSegment.from_file(any_path)
+        audio = pydub.AudioSegment.from_file(any_path)
         audio.export(mp3_path, format="mp3")
 
     except Exception as e:
@@ -100,7 +99,7 @@ def any_to_wav(any_path, wav_path):
         return
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         return sil_to_wav(any_path, wav_path)
-    audio = AudioSegment.from_file(any_path)
+    audio = pydub.AudioSegment.from_file(any_path)
     audio.set_frame_rate(8000)    # 百度语音转写支持8000采样率, pcm_s16le, 单通道语音识别
     audio.set_channels(1)
     audio.export(wav_path, format="wav", codec='pcm_s16le')
@@ -113,7 +112,7 @@ def any_to_sil(any_path, sil_path):
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         shutil.copy2(any_path, sil_path)
         return 10000
-    audio = AudioSegment.from_file(any_path)
+    audio = pydub.AudioSegment.from_file(any_path)
     rate = find_closest_sil_supports(audio.frame_rate)
     # Convert to PCM_s16
     pcm_s16 = audio.set_sample_width(2)
@@ -133,7 +132,7 @@ def mp3_to_silk(mp3_path: str, silk_path: str) -> int:
         Duration of the SILK file in milliseconds
     """
     # First load the MP3 file
-    audio = AudioSegment.from_file(mp3_path)
+    audio = pydub.AudioSegment.from_file(mp3_path)
     
     # Convert to mono and set sample rate to 24000Hz
     # TODO: 下面的参数可能需要调整
@@ -163,7 +162,7 @@ def any_to_amr(any_path, amr_path):
         return
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         raise NotImplementedError("Not support file type: {}".format(any_path))
-    audio = AudioSegment.from_file(any_path)
+    audio = pydub.AudioSegment.from_file(any_path)
     audio = audio.set_frame_rate(8000)  # only support 8000
     audio.export(amr_path, format="amr")
     return audio.duration_seconds * 1000
@@ -182,7 +181,7 @@ def split_audio(file_path, max_segment_length_ms=60000):
     """
     分割音频文件
     """
-    audio = AudioSegment.from_file(file_path)
+    audio = pydub.AudioSegment.from_file(file_path)
     audio_length_ms = len(audio)
     if audio_length_ms <= max_segment_length_ms:
         return audio_length_ms, [file_path]